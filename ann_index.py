@@ -0,0 +1,197 @@
+# ann_index.py
+"""
+FAISS index factory for the selectable index types, plus a recall@k
+benchmark against exact (flat) search.
+
+    flat      exact inner-product scan, cost grows linearly with the corpus
+    ivf_flat  inverted lists over k-means cells; nprobe cells scanned per query
+    hnsw      graph search; efSearch controls the candidate list size
+    ivf_pq    inverted lists with product-quantized codes, smallest on disk
+
+Every type supports add_with_ids so FAISS IDs stay docstore node IDs.
+"""
+import logging
+import math
+import time
+
+import faiss
+import numpy as np
+
+# INDEX_TYPES lives in config so the CLI can list it without importing faiss
+from config import (EMBEDDING_DIM, INDEX_TYPE, INDEX_TYPES, IVF_NLIST, IVF_NPROBE,
+                    HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH,
+                    PQ_M, PQ_NBITS, INDEX_TRAIN_SAMPLE)
+
+# Types whose quantizer is trained on the corpus before vectors are added
+TRAINED_INDEX_TYPES = ("ivf_flat", "ivf_pq")
+
+
+def _nlist(n_vectors: int) -> int:
+    """Number of IVF cells: IVF_NLIST, or ~4*sqrt(n) with 39 points per cell."""
+    nlist = IVF_NLIST or int(4 * math.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // 39))
+
+
+def make_index(index_type: str = INDEX_TYPE, dim: int = EMBEDDING_DIM,
+               n_vectors: int = 0):
+    """
+    Create an empty, ID-capable index of the given type sized for
+    n_vectors. Types that need more training data than the corpus has
+    fall back to flat.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+    if index_type in TRAINED_INDEX_TYPES:
+        min_points = 39 * (2 ** PQ_NBITS if index_type == "ivf_pq" else 1)
+        if n_vectors < min_points:
+            logging.warning("Only %d vectors, too few to train %s; using flat",
+                            n_vectors, index_type)
+            index_type = "flat"
+
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    if index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return faiss.IndexIDMap2(hnsw)
+
+    quantizer = faiss.IndexFlatIP(dim)
+    nlist = _nlist(n_vectors)
+    if index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    return faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_M, PQ_NBITS,
+                            faiss.METRIC_INNER_PRODUCT)
+
+
+def index_type_of(index) -> str:
+    """Inverse of make_index for a built or loaded index."""
+    inner = index
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def supports_remove(index) -> bool:
+    """HNSW graphs cannot drop vectors; every other type can."""
+    return index_type_of(index) != "hnsw"
+
+
+def train_index(index, vectors, sample_size: int = INDEX_TRAIN_SAMPLE,
+                seed: int = 0) -> None:
+    """Train on a random sample of vectors if the index needs training."""
+    if index.is_trained:
+        return
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) > sample_size:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    logging.info("Training %s index on %d vectors...", index_type_of(index), len(vectors))
+    index.train(vectors)
+
+
+def set_search_params(index, nprobe: int = IVF_NPROBE,
+                      ef_search: int = HNSW_EF_SEARCH) -> None:
+    """Apply query-time knobs; ignored by index types that don't have them."""
+    index_type = index_type_of(index)
+    if index_type in TRAINED_INDEX_TYPES:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    elif index_type == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efSearch = ef_search
+
+
+def selector_search_params(index, selector):
+    """
+    Search parameters restricting a search to selector's IDs, keeping the
+    index's current nprobe / efSearch.
+    """
+    index_type = index_type_of(index)
+    if index_type in TRAINED_INDEX_TYPES:
+        return faiss.SearchParametersIVF(sel=selector,
+                                         nprobe=faiss.extract_index_ivf(index).nprobe)
+    if index_type == "hnsw":
+        return faiss.SearchParametersHNSW(
+            sel=selector, efSearch=faiss.downcast_index(index.index).hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def recall_at_k(index, reference, queries, k: int = 10) -> float:
+    """Fraction of the reference index's top-k IDs that index also returns."""
+    queries = np.asarray(queries, dtype=np.float32)
+    _, found = index.search(queries, k)
+    _, truth = reference.search(queries, k)
+    hits = sum(
+        len(set(f[f != -1]) & set(t[t != -1]))
+        for f, t in zip(found, truth)
+    )
+    total = sum(int((t != -1).sum()) for t in truth)
+    return hits / total if total else 1.0
+
+
+def split_queries(vectors, n_queries: int = 200, seed: int = 0):
+    """
+    Hold out n_queries rows of vectors as a query set that is neither
+    indexed nor used for training. Returns (remaining vectors, queries).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    n_queries = min(n_queries, max(1, len(vectors) // 10))
+    held_out = rng.choice(len(vectors), n_queries, replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[held_out] = False
+    return vectors[mask], vectors[held_out]
+
+
+def compare_index_types(vectors, queries, k: int = 10,
+                        index_types=INDEX_TYPES,
+                        nprobe: int = IVF_NPROBE,
+                        ef_search: int = HNSW_EF_SEARCH) -> list[dict]:
+    """
+    Build every index type over vectors and measure recall@k against flat
+    search on queries, together with build time, query latency and size.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    ids = np.arange(len(vectors), dtype=np.int64)
+    dim = vectors.shape[1]
+
+    reference = make_index("flat", dim)
+    reference.add_with_ids(vectors, ids)
+
+    rows = []
+    for index_type in index_types:
+        t0 = time.perf_counter()
+        index = make_index(index_type, dim, len(vectors))
+        train_index(index, vectors)
+        index.add_with_ids(vectors, ids)
+        build_s = time.perf_counter() - t0
+        set_search_params(index, nprobe, ef_search)
+
+        t0 = time.perf_counter()
+        index.search(queries, k)
+        query_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        rows.append({
+            "index_type": index_type,
+            "built_as": index_type_of(index),
+            f"recall@{k}": round(recall_at_k(index, reference, queries, k), 4),
+            "build_s": round(build_s, 3),
+            "query_ms": round(query_ms, 4),
+            "size_bytes": int(faiss.serialize_index(index).size),
+        })
+    return rows
+
+
+def print_comparison(rows: list[dict]) -> None:
+    if not rows:
+        return
+    headers = list(rows[0].keys())
+    print(" | ".join(f"{h:>12}" for h in headers))
+    for row in rows:
+        print(" | ".join(f"{str(row[h]):>12}" for h in headers))
@@ -0,0 +1,148 @@
+# answer_cache.py
+"""
+Semantic answer cache.
+
+A cached answer is reused when a new question's embedding is within
+ANSWER_CACHE_MIN_SIMILARITY (cosine) of a cached question AND retrieval
+returned exactly the same chunk IDs, so a reworded question only hits if it
+would have produced the same prompt context. Entries expire after
+ANSWER_CACHE_TTL seconds and the least recently used ones are evicted past
+ANSWER_CACHE_SIZE.
+
+The cache is tied to the version of the index it was filled from (a new
+one is written by every build or update, see VectorIndex.persist); binding
+it to a different version drops every entry.
+"""
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_MIN_SIMILARITY
+
+
+def _unit(embedding) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE,
+                 ttl: float = ANSWER_CACHE_TTL,
+                 min_similarity: float = ANSWER_CACHE_MIN_SIMILARITY,
+                 path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        # Where save() writes the cache; None keeps it in memory only
+        self.path = path
+        self.index_version = None
+        # entry number -> {"embedding", "chunk_ids", "answer", "created"},
+        # least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        # sorted chunk IDs (as strings) -> entry numbers retrieved with them
+        self._by_context: dict[tuple, set] = {}
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.index_version = data.get("index_version")
+        for entry in data.get("entries", []):
+            self._add(entry["embedding"], entry["chunk_ids"],
+                      entry["answer"], entry["created"])
+        self._expire()
+        logging.info("Answer cache loaded with %d entries", len(self))
+
+    def bind(self, index_version) -> None:
+        """Attach the cache to an index version, clearing it if it changed."""
+        if index_version != self.index_version and self._entries:
+            logging.info("Index changed since the answers were cached, clearing cache")
+            self.clear()
+        self.index_version = index_version
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_context.clear()
+
+    @staticmethod
+    def _context(chunk_ids) -> tuple:
+        # String IDs: sharded indexes return "<shard>:<id>" node IDs
+        return tuple(sorted(str(i) for i in chunk_ids))
+
+    def _add(self, embedding, chunk_ids, answer: str, created: float) -> None:
+        context = self._context(chunk_ids)
+        number = self._next
+        self._next += 1
+        self._entries[number] = {"embedding": _unit(embedding), "chunk_ids": context,
+                                 "answer": answer, "created": created}
+        self._by_context.setdefault(context, set()).add(number)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, number: int) -> None:
+        entry = self._entries.pop(number)
+        numbers = self._by_context[entry["chunk_ids"]]
+        numbers.discard(number)
+        if not numbers:
+            del self._by_context[entry["chunk_ids"]]
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl
+        for number in [n for n, e in self._entries.items() if e["created"] < cutoff]:
+            self._remove(number)
+
+    def get(self, embedding, chunk_ids) -> Optional[str]:
+        """Cached answer for a question embedding and its retrieved chunk IDs."""
+        context = self._context(chunk_ids)
+        numbers = self._by_context.get(context)
+        if numbers:
+            query = _unit(embedding)
+            cutoff = time.time() - self.ttl
+            best, best_sim = None, self.min_similarity
+            for number in list(numbers):
+                entry = self._entries[number]
+                if entry["created"] < cutoff:
+                    self._remove(number)
+                    continue
+                sim = float(np.dot(query, entry["embedding"]))
+                if sim >= best_sim:
+                    best, best_sim = number, sim
+            if best is not None:
+                self._entries.move_to_end(best)
+                self.hits += 1
+                return self._entries[best]["answer"]
+        self.misses += 1
+        return None
+
+    def put(self, embedding, chunk_ids, answer: str) -> None:
+        self._add(embedding, chunk_ids, answer, time.time())
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        self._expire()
+        data = {
+            "index_version": self.index_version,
+            "entries": [
+                {"embedding": e["embedding"].tolist(), "chunk_ids": list(e["chunk_ids"]),
+                 "answer": e["answer"], "created": e["created"]}
+                for e in self._entries.values()
+            ],
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,152 @@
+# batch_qa.py
+"""
+Batch question answering for evaluation sets.
+
+Questions are read from a file or stdin, one per line: either JSON objects
+(question from "question", "query" or "title", ID from "id" or
+"request_id", so a requests.jsonl-style file works as is) or plain text.
+
+Retrieval runs BATCH_QA_RETRIEVE_BATCH questions at a time, each batch
+being one embedding forward pass and one FAISS search, on a worker thread.
+While the next batch is retrieved, up to BATCH_QA_CONCURRENCY Ollama
+generations run for questions already retrieved (Ollama itself only runs
+that many in parallel if OLLAMA_NUM_PARALLEL allows it). Every answer is
+written as one JSON line as soon as it is ready, so output order follows
+completion; each line carries the input ID and index.
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import Callable, Iterable, Optional
+
+from config import BATCH_QA_CONCURRENCY, BATCH_QA_RETRIEVE_BATCH
+from utils.utils import citation_list
+
+
+def read_questions(lines: Iterable[str]) -> list[dict]:
+    """Parse input lines into {"index", "id", "question"} items, skipping blanks."""
+    items = []
+    for lineno, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        item_id, question = lineno, line
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                item_id = record.get("id", record.get("request_id", lineno))
+                question = str(record.get("question") or record.get("query")
+                               or record.get("title") or "").strip()
+        if not question:
+            logging.warning("Line %d has no question, skipped", lineno)
+            continue
+        items.append({"index": len(items), "id": item_id, "question": question})
+    return items
+
+
+async def answer_all(service, items: list[dict], write: Callable[[dict], None],
+                     concurrency: int = BATCH_QA_CONCURRENCY,
+                     batch_size: int = BATCH_QA_RETRIEVE_BATCH,
+                     filters: Optional[dict] = None) -> dict:
+    """
+    Answer items with service (a QueryService), calling write(result) for
+    each one; filters restricts retrieval for every item. Returns counts
+    of answered, cached and failed questions.
+    """
+    concurrency = max(1, concurrency)
+    batch_size = max(1, batch_size)
+    # Bounded, so retrieval stays at most a couple of batches ahead
+    queue: asyncio.Queue = asyncio.Queue(maxsize=batch_size + concurrency)
+    summary = {"questions": len(items), "answered": 0, "cached": 0, "failed": 0}
+
+    def fail(item: dict, error: Exception, timings: dict) -> None:
+        logging.warning("Question %s failed: %s", item["id"], error)
+        summary["failed"] += 1
+        write({**item, "error": str(error), "timings_ms": timings})
+
+    async def retrieve() -> None:
+        try:
+            for start in range(0, len(items), batch_size):
+                batch = items[start:start + batch_size]
+                t0 = time.perf_counter()
+                try:
+                    results, embeddings = await asyncio.to_thread(
+                        service.retrieve_many, [item["question"] for item in batch], True,
+                        filters)
+                except Exception as e:
+                    for item in batch:
+                        fail(item, e, {})
+                    continue
+                # Each question is charged its share of the batched call
+                retrieve_ms = round((time.perf_counter() - t0) * 1000 / len(batch), 2)
+                for item, nodes, embedding in zip(batch, results, embeddings):
+                    await queue.put((item, nodes, embedding, retrieve_ms, time.perf_counter()))
+        finally:
+            for _ in range(concurrency):
+                await queue.put(None)
+
+    async def generate() -> None:
+        while (job := await queue.get()) is not None:
+            item, nodes, embedding, retrieve_ms, queued = job
+            t0 = time.perf_counter()
+            timings = {"retrieve": retrieve_ms, "queue_wait": round((t0 - queued) * 1000, 2)}
+            try:
+                answer = service.cached_answer(embedding, nodes)
+                cached = answer is not None
+                if not cached:
+                    answer = await service.agenerate(service.build_prompt(item["question"], nodes))
+                    service.cache_answer(embedding, nodes, answer)
+            except Exception as e:
+                timings["generate"] = round((time.perf_counter() - t0) * 1000, 2)
+                fail(item, e, timings)
+                continue
+            timings["generate"] = round((time.perf_counter() - t0) * 1000, 2)
+            summary["answered"] += 1
+            summary["cached"] += cached
+            write({**item, "answer": answer, "cached": cached,
+                   "citations": citation_list(nodes), "timings_ms": timings})
+
+    await asyncio.gather(retrieve(), *(generate() for _ in range(concurrency)))
+    return summary
+
+
+def run_batch(service, input_path: str = "-", output_path: str = "-",
+              concurrency: int = BATCH_QA_CONCURRENCY,
+              batch_size: int = BATCH_QA_RETRIEVE_BATCH,
+              filters: Optional[dict] = None) -> dict:
+    """
+    Answer every question in input_path ("-" for stdin) and write JSONL
+    results to output_path ("-" for stdout). Returns the summary counts.
+    """
+    if input_path == "-":
+        items = read_questions(sys.stdin)
+    else:
+        with open(input_path, "r", encoding="utf-8") as f:
+            items = read_questions(f)
+
+    out = sys.stdout if output_path == "-" else open(output_path, "w", encoding="utf-8")
+
+    def write(result: dict) -> None:
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+
+    logging.info("Answering %d questions, %d generations in parallel",
+                 len(items), concurrency)
+    t0 = time.perf_counter()
+    try:
+        summary = asyncio.run(answer_all(service, items, write, concurrency, batch_size,
+                                         filters))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - t0
+    summary["elapsed_s"] = round(elapsed, 2)
+    logging.info("Batch done: %d answered (%d cached), %d failed in %.1fs (%.2f questions/s)",
+                 summary["answered"], summary["cached"], summary["failed"], elapsed,
+                 len(items) / elapsed if elapsed else 0.0)
+    return summary
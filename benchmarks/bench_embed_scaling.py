@@ -0,0 +1,112 @@
+# benchmarks/bench_embed_scaling.py
+"""
+Embedding throughput against the number of worker processes.
+
+Embeds the same synthetic chunks (Zipf-distributed domain vocabulary, like
+bench_pipeline.py) in the building process with torch's default threading,
+then with an EmbeddingPool of 1, 2, 4, ... workers at --threads torch
+threads each, and prints chunks/s, speedup over one worker and parallel
+efficiency per step. Model loading is excluded: each pool is warmed up
+before it is timed.
+
+    python benchmarks/bench_embed_scaling.py [--chunks 4096] [--threads 4] \
+        [--max-workers 8] [--output bench_embed_scaling.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_pipeline import DOMAIN_WORDS, FILLER_WORDS  # noqa: E402
+from config import EMBED_MODEL_NAME, EMBED_BATCH_SIZE, EMBED_PRECISION  # noqa: E402
+from embed_pool import EmbeddingPool, default_workers  # noqa: E402
+from embeddings import HFEmbedding  # noqa: E402
+
+
+def make_chunks(n: int, seed: int = 0, min_words: int = 40, max_words: int = 220) -> list[str]:
+    rng = random.Random(seed)
+    words = list(DOMAIN_WORDS) + list(FILLER_WORDS)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return [" ".join(rng.choices(words, weights, k=rng.randint(min_words, max_words)))
+            for _ in range(n)]
+
+
+def worker_counts(max_workers: int) -> list[int]:
+    counts, n = [], 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    return counts + [max_workers]
+
+
+def time_embedding(embedding: HFEmbedding, chunks: list[str]) -> float:
+    t0 = time.perf_counter()
+    embedding._embed_sorted(chunks)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=4096)
+    parser.add_argument("--threads", type=int, default=4, help="torch threads per worker")
+    parser.add_argument("--max-workers", type=int, default=None,
+                        help="Largest pool to time (default: CPUs / --threads)")
+    parser.add_argument("--precision", default=EMBED_PRECISION)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_embed_scaling.json")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks, args.seed)
+    embedding = HFEmbedding(precision=args.precision)
+    # Warm up the in-process model, then time it as the baseline
+    embedding._embed_sorted(chunks[:EMBED_BATCH_SIZE])
+    in_process_s = time_embedding(embedding, chunks)
+
+    rows = []
+    for workers in worker_counts(args.max_workers or default_workers(args.threads)):
+        with EmbeddingPool.for_embedding(embedding, workers, args.threads) as pool:
+            pool.warm()
+            # One batch per worker so every model has run once
+            pool.map_batches([chunks[:EMBED_BATCH_SIZE]] * workers)
+            embedding.pool = pool
+            try:
+                seconds = time_embedding(embedding, chunks)
+            finally:
+                embedding.pool = None
+        rows.append({"workers": workers, "threads_per_worker": args.threads,
+                     "elapsed_s": round(seconds, 3),
+                     "chunks_per_s": round(len(chunks) / seconds, 1)})
+
+    base = rows[0]["chunks_per_s"]
+    for row in rows:
+        row["speedup"] = round(row["chunks_per_s"] / base, 2)
+        row["efficiency"] = round(row["speedup"] / row["workers"], 2)
+
+    result = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "embed_model": EMBED_MODEL_NAME,
+                 "precision": args.precision, "embed_batch_size": EMBED_BATCH_SIZE,
+                 "chunks": len(chunks)},
+        "in_process": {"elapsed_s": round(in_process_s, 3),
+                       "chunks_per_s": round(len(chunks) / in_process_s, 1)},
+        "pool": rows,
+    }
+
+    print(f"in-process : {result['in_process']['chunks_per_s']:8.1f} chunks/s "
+          f"(torch default threads)")
+    for row in rows:
+        print(f"{row['workers']:3d} workers: {row['chunks_per_s']:8.1f} chunks/s  "
+              f"speedup {row['speedup']:5.2f}x  efficiency {row['efficiency']:.0%}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end benchmark: synthetic corpus -> ingestion -> embedding -> index
+build -> cold and warm queries, with a deterministic stub LLM so only this
+repo's code (and the embedding model) is timed.
+
+The corpus is written in the Title:/Section: format scrapper.py produces.
+"Cold" queries are the first pass right after the index is loaded from
+disk (memory-mapped FAISS file and docstore pages not yet touched); "warm"
+queries are the later passes over the same questions.
+
+Results are printed and written as JSON. Pass an earlier result file as
+--baseline to list every time, memory or size metric that got worse by
+more than --tolerance; the exit status is 1 if any did.
+
+    python benchmarks/bench_pipeline.py [--pages 200] [--sections 6] \
+        [--index-type flat] [--output bench_pipeline.json] [--baseline old.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np  # noqa: E402
+from llama_index.core.llms import MockLLM  # noqa: E402
+from llama_index.core.schema import MetadataMode  # noqa: E402
+
+from ann_index import INDEX_TYPES  # noqa: E402
+from config import (INDEX_TYPE, INGEST_WORKERS, EMBED_MODEL_NAME, EMBED_PRECISION,  # noqa: E402
+                    EMBED_BATCH_SIZE, HYBRID_SEARCH, CONTEXT_TOKEN_BUDGET)
+from embeddings import HFEmbedding, PRECISION_MODES  # noqa: E402
+from indexer import hash_file  # noqa: E402
+from ingest import IngestStats, iter_file_chunks, make_node  # noqa: E402
+from query_service import QueryService  # noqa: E402
+from vector_index import VectorIndex  # noqa: E402
+
+DOMAIN_WORDS = (
+    "api", "gateway", "deployment", "policy", "route", "backend", "token",
+    "certificate", "domain", "tenant", "authentication", "authorizer", "cache",
+    "response", "request", "header", "timeout", "compartment", "function",
+    "specification", "validation", "logging", "metrics", "usage", "plan",
+    "subscriber", "client", "quota", "rate", "limit", "cors", "json", "path",
+    "method", "endpoint", "oauth", "jwt", "scope", "claim", "issuer", "vault",
+    "secret", "mtls", "upload", "description", "file", "team", "member",
+)
+FILLER_WORDS = ("the", "a", "to", "of", "and", "in", "for", "is", "with", "on",
+                "can", "you", "this", "when", "each", "that", "by", "an", "be")
+# Lower is better for metrics with these suffixes, except throughput (_per_s)
+COMPARED_SUFFIXES = ("_s", "_ms", "_mb", "_bytes")
+
+
+def make_vocabulary(rng: random.Random, size: int = 5000) -> tuple[list, list]:
+    """Words with Zipf-like weights: filler first, then domain terms, then rare terms."""
+    words = list(FILLER_WORDS) + list(DOMAIN_WORDS) + [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 11)))
+        for _ in range(size)]
+    weights = [1.0 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def sentence(rng: random.Random, words: list, weights: list) -> str:
+    tokens = rng.choices(words, weights, k=rng.randint(8, 24))
+    return " ".join(tokens).capitalize() + "."
+
+
+def synthetic_page(rng: random.Random, words: list, weights: list,
+                   page: int, n_sections: int) -> str:
+    """One page as scrapper.py writes it: a Title: line, then Section: blocks."""
+    parts = [f"Title: {' '.join(rng.sample(DOMAIN_WORDS, 3)).title()} {page}\n\n"]
+    for s in range(rng.randint(max(1, n_sections // 2), n_sections)):
+        heading = " ".join(rng.sample(DOMAIN_WORDS, 2)).title()
+        paragraphs = [" ".join(sentence(rng, words, weights) for _ in range(rng.randint(2, 8)))
+                      for _ in range(rng.randint(1, 4))]
+        parts.append(f"Section: {heading} {s}\n")
+        parts.append("\n".join(paragraphs) + "\n\n")
+    return "".join(parts)
+
+
+def write_corpus(docs_dir: str, n_pages: int, n_sections: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    words, weights = make_vocabulary(rng)
+    os.makedirs(docs_dir, exist_ok=True)
+    total = 0
+    for page in range(n_pages):
+        text = synthetic_page(rng, words, weights, page, n_sections)
+        with open(os.path.join(docs_dir, f"page_{page:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        total += len(text.encode("utf-8"))
+    return {"pages": n_pages, "max_sections": n_sections, "seed": seed, "corpus_bytes": total}
+
+
+def make_questions(chunks_by_file: dict, n: int, seed: int) -> list[str]:
+    """Questions built from words of random chunks, so each has a real answer."""
+    rng = random.Random(seed)
+    chunks = [text for key in sorted(chunks_by_file) for text, _ in chunks_by_file[key]]
+    questions = []
+    for _ in range(n):
+        words = rng.choice(chunks).split()
+        start = rng.randrange(max(1, len(words) - 8))
+        questions.append(f"How do I {' '.join(words[start:start + 8]).rstrip('.')}?")
+    return questions
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, None where resource is missing."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def dir_size(path: str) -> dict:
+    sizes = {name + "_bytes": os.path.getsize(os.path.join(path, name))
+             for name in sorted(os.listdir(path))
+             if os.path.isfile(os.path.join(path, name))}
+    sizes["total_bytes"] = sum(sizes.values())
+    return sizes
+
+
+def percentiles(samples: list[float]) -> dict:
+    ms = np.asarray(samples) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            "mean_ms": round(float(ms.mean()), 3)}
+
+
+def bench_ingest(docs_dir: str, workers) -> tuple[dict, dict]:
+    keys = sorted(os.listdir(docs_dir))
+    stats = IngestStats()
+    chunks_by_file = {}
+    t0 = time.perf_counter()
+    for shard in iter_file_chunks(docs_dir, keys, workers, stats=stats):
+        chunks_by_file.update(shard)
+    elapsed = time.perf_counter() - t0
+    n_chunks = sum(len(c) for c in chunks_by_file.values())
+    return chunks_by_file, {
+        "elapsed_s": round(elapsed, 3), "files": len(keys), "chunks": n_chunks,
+        "files_per_s": round(len(keys) / elapsed, 1), "stages": stats.summary()["stages"]}
+
+
+def bench_embed(embed_model: HFEmbedding, chunks_by_file: dict) -> tuple[list, dict]:
+    # Embed the same text indexer._index_files does (metadata header + chunk)
+    texts = [make_node(text, md).get_content(metadata_mode=MetadataMode.EMBED)
+             for key in sorted(chunks_by_file) for text, md in chunks_by_file[key]]
+    t0 = time.perf_counter()
+    embeddings = embed_model.get_text_embedding_batch(texts)
+    elapsed = time.perf_counter() - t0
+    return embeddings, {"elapsed_s": round(elapsed, 3),
+                        "chunks_per_s": round(len(texts) / elapsed, 1) if elapsed else None}
+
+
+def bench_build(index_dir: str, docs_dir: str, index_type: str,
+                chunks_by_file: dict, embeddings: list) -> dict:
+    t0 = time.perf_counter()
+    vector_index = VectorIndex.create(index_dir, index_type=index_type)
+    vector_index.train(embeddings)
+    t1 = time.perf_counter()
+    offset = 0
+    for key in sorted(chunks_by_file):
+        nodes = [make_node(text, md) for text, md in chunks_by_file[key]]
+        vector_index.add_file(key, hash_file(os.path.join(docs_dir, key)), nodes,
+                              embeddings[offset:offset + len(nodes)])
+        offset += len(nodes)
+    t2 = time.perf_counter()
+    vector_index.persist()
+    t3 = time.perf_counter()
+    vector_index.docstore.close()
+    return {"index_type": vector_index.index_type, "elapsed_s": round(t3 - t0, 3),
+            "train_s": round(t1 - t0, 3), "add_s": round(t2 - t1, 3),
+            "persist_s": round(t3 - t2, 3)}
+
+
+def run_queries(service: QueryService, questions: list[str]) -> dict[str, list[float]]:
+    """Seconds per stage for each question, following QueryService.query."""
+    samples = {"embed": [], "retrieve": [], "prompt": [], "generate": [], "total": []}
+    for question in questions:
+        t0 = time.perf_counter()
+        embedding = service.embed_model.get_query_embedding(question)
+        t1 = time.perf_counter()
+        nodes = service.retrieve(question, embedding)
+        t2 = time.perf_counter()
+        prompt = service.build_prompt(question, nodes)
+        t3 = time.perf_counter()
+        service.generate(prompt)
+        t4 = time.perf_counter()
+        for stage, seconds in zip(samples, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t4 - t0)):
+            samples[stage].append(seconds)
+    return samples
+
+
+def bench_queries(index_dir: str, embed_model: HFEmbedding, questions: list[str],
+                  warm_passes: int, hybrid: bool, answer_tokens: int) -> dict:
+    t0 = time.perf_counter()
+    # MockLLM answers with answer_tokens fixed words, no Ollama needed
+    service = QueryService(index_dir, embed_model=embed_model,
+                           llm=MockLLM(max_tokens=answer_tokens), hybrid=hybrid)
+    load = time.perf_counter() - t0
+    cold = run_queries(service, questions)
+    warm = {stage: [] for stage in cold}
+    for _ in range(warm_passes):
+        for stage, seconds in run_queries(service, questions).items():
+            warm[stage].extend(seconds)
+    result = {"load_s": round(load, 3), "questions": len(questions),
+              "cold": {stage: percentiles(s) for stage, s in cold.items()}}
+    if warm_passes:
+        result["warm"] = {stage: percentiles(s) for stage, s in warm.items()}
+    service.vector_index.docstore.close()
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(result: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Metrics at least tolerance (a fraction) worse than in baseline."""
+    current, previous = flatten(result), flatten(baseline)
+    regressions = []
+    for key, value in sorted(current.items()):
+        old = previous.get(key)
+        if not old or key.startswith(("meta.", "corpus.")):
+            continue
+        if key.endswith("_per_s"):
+            worse = value < old * (1 - tolerance)
+        elif key.endswith(COMPARED_SUFFIXES):
+            worse = value > old * (1 + tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append(f"{key}: {old} -> {value} ({(value - old) / old:+.0%})")
+    return regressions
+
+
+def print_summary(result: dict) -> None:
+    print(f"corpus   : {result['corpus']['pages']} pages, {result['ingest']['chunks']} chunks, "
+          f"{result['corpus']['corpus_bytes'] / 1e6:.1f} MB")
+    print(f"ingest   : {result['ingest']['elapsed_s']:8.2f} s  "
+          f"({result['ingest']['files_per_s']} files/s)")
+    print(f"embed    : {result['embed']['elapsed_s']:8.2f} s  "
+          f"({result['embed']['chunks_per_s']} chunks/s)")
+    print(f"build    : {result['build']['elapsed_s']:8.2f} s  ({result['build']['index_type']}, "
+          f"{result['index_size']['total_bytes'] / 1e6:.1f} MB on disk)")
+    print(f"load     : {result['query']['load_s']:8.2f} s")
+    for phase in ("cold", "warm"):
+        for stage, row in result["query"].get(phase, {}).items():
+            print(f"{phase:<4} {stage:<9}: p50 {row['p50_ms']:8.2f} ms  "
+                  f"p95 {row['p95_ms']:8.2f} ms  p99 {row['p99_ms']:8.2f} ms")
+    print(f"peak RSS : {result['memory']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--sections", type=int, default=6, help="Max sections per page")
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--warm-passes", type=int, default=3)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE)
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--precision", choices=PRECISION_MODES, default=EMBED_PRECISION)
+    parser.add_argument("--no-hybrid", action="store_true")
+    parser.add_argument("--answer-tokens", type=int, default=64,
+                        help="Words in every stub LLM answer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Keep the corpus and index here instead of a temp dir")
+    parser.add_argument("--output", default="bench_pipeline.json")
+    parser.add_argument("--baseline", help="Earlier result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown/growth before a metric counts as a regression")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Keep INFO logging")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        docs_dir = os.path.join(workdir, "docs")
+        index_dir = os.path.join(workdir, "index")
+        result = {"meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "git_commit": git_commit(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "embed_model": EMBED_MODEL_NAME,
+            "precision": args.precision, "embed_batch_size": EMBED_BATCH_SIZE,
+            "hybrid": HYBRID_SEARCH and not args.no_hybrid,
+            "context_token_budget": CONTEXT_TOKEN_BUDGET}}
+        memory = {}
+
+        result["corpus"] = write_corpus(docs_dir, args.pages, args.sections, args.seed)
+        chunks_by_file, result["ingest"] = bench_ingest(docs_dir, args.workers)
+        memory["after_ingest_mb"] = peak_rss_mb()
+
+        t0 = time.perf_counter()
+        embed_model = HFEmbedding(precision=args.precision)
+        result["model_load_s"] = round(time.perf_counter() - t0, 3)
+        embeddings, result["embed"] = bench_embed(embed_model, chunks_by_file)
+        memory["after_embed_mb"] = peak_rss_mb()
+
+        result["build"] = bench_build(index_dir, docs_dir, args.index_type,
+                                      chunks_by_file, embeddings)
+        result["index_size"] = dir_size(index_dir)
+        memory["after_build_mb"] = peak_rss_mb()
+        del embeddings
+
+        questions = make_questions(chunks_by_file, args.questions, args.seed)
+        result["query"] = bench_queries(index_dir, embed_model, questions, args.warm_passes,
+                                        result["meta"]["hybrid"], args.answer_tokens)
+        memory["after_query_mb"] = peak_rss_mb()
+        result["memory"] = {"peak_rss": memory}
+
+    print_summary(result)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            print("\n".join("  " + line for line in regressions))
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
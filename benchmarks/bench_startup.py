@@ -0,0 +1,123 @@
+# benchmarks/bench_startup.py
+"""
+CLI startup benchmark: wall time of fresh interpreters running the entry
+points up to the point where they would start working, plus the slowest
+imports of `main.py --help` from `python -X importtime`.
+
+Each command runs --runs times in a new process; min and median are
+reported. Pass an earlier result file as --baseline to fail (exit status 1)
+when any median got slower by more than --tolerance, and --max-help-s to
+fail when `main.py --help` alone takes longer than that.
+
+    python benchmarks/bench_startup.py [--runs 10] [--output bench_startup.json] \
+        [--baseline old.json] [--max-help-s 0.5]
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# name -> interpreter arguments
+COMMANDS = {
+    "python": ["-c", "pass"],
+    "main_help": ["main.py", "--help"],
+    "scrapper_help": ["scrapper.py", "--help"],
+    "import_indexer": ["-c", "import indexer"],
+    "import_query_service": ["-c", "import query_service"],
+}
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def time_command(args: list, runs: int) -> dict:
+    """min / median wall seconds of `python args`, or the error if it fails."""
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, *args], cwd=ROOT,
+                              capture_output=True, text=True)
+        samples.append(time.perf_counter() - t0)
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1:]}
+    return {"min_s": round(min(samples), 4), "median_s": round(statistics.median(samples), 4)}
+
+
+def slowest_imports(args: list, top: int = 15) -> list[dict]:
+    """Top-level packages by cumulative import time, from -X importtime."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT,
+                          capture_output=True, text=True)
+    totals = {}
+    for match in IMPORTTIME_RE.finditer(proc.stderr):
+        _, cumulative, indent, name = match.groups()
+        # Nesting is shown by indentation; only count outermost imports
+        if len(indent) <= 1:
+            package = name.split(".")[0]
+            totals[package] = totals.get(package, 0) + int(cumulative)
+    ranked = sorted(totals.items(), key=lambda item: -item[1])[:top]
+    return [{"module": name, "cumulative_ms": round(us / 1000, 2)} for name, us in ranked]
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Commands whose median is at least tolerance (a fraction) slower than in baseline."""
+    regressions = []
+    for name, row in result["commands"].items():
+        old = baseline.get("commands", {}).get(name, {}).get("median_s")
+        new = row.get("median_s")
+        if old and new and new > old * (1 + tolerance):
+            regressions.append(f"{name}: {old} -> {new} s ({(new - old) / old:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", default="bench_startup.json")
+    parser.add_argument("--baseline", help="Earlier result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown as a fraction (default: %(default)s)")
+    parser.add_argument("--max-help-s", type=float, default=None,
+                        help="Fail when the median of `main.py --help` exceeds this")
+    args = parser.parse_args()
+
+    result = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                 "python": platform.python_version(), "platform": platform.platform()},
+        "commands": {name: time_command(cmd, args.runs) for name, cmd in COMMANDS.items()},
+        "main_help_imports": slowest_imports(COMMANDS["main_help"]),
+    }
+
+    for name, row in result["commands"].items():
+        if "error" in row:
+            print(f"{name:<22}: failed {row['error']}")
+        else:
+            print(f"{name:<22}: median {row['median_s'] * 1000:8.1f} ms  "
+                  f"min {row['min_s'] * 1000:8.1f} ms")
+    print("\nslowest imports of main.py --help:")
+    for row in result["main_help_imports"]:
+        print(f"  {row['module']:<24}{row['cumulative_ms']:8.1f} ms")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    failures = []
+    help_s = result["commands"]["main_help"].get("median_s")
+    if args.max_help_s is not None and (help_s is None or help_s > args.max_help_s):
+        failures.append(f"main_help: {help_s} s, limit {args.max_help_s} s")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            failures += compare(result, json.load(f), args.tolerance)
+    if failures:
+        print(f"\n{len(failures)} regression(s):")
+        print("\n".join("  " + line for line in failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# benchmarks/bench_text_cleaner.py
+"""
+Microbenchmark: the original per-element clean_text against the page-level
+text_cleaner.clean_texts, plus BeautifulSoup parse time with html.parser
+and lxml when they are installed.
+
+    python benchmarks/bench_text_cleaner.py [--pages 50] [--elements 400]
+"""
+import argparse
+import html
+import os
+import random
+import re
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from text_cleaner import clean_texts  # noqa: E402
+
+
+def legacy_clean_text(text: str) -> str:
+    """The per-element cleaner scrapper.py used before text_cleaner.py."""
+    text = html.unescape(text)
+    text = re.sub(r"https?://\S+|www\.\S+", "", text)
+    text = re.sub(r"\S+@\S+\.\S+", "", text)
+    text = re.sub(r"\[\d+\]|\(\d+\)", "", text)
+    text = re.sub(r"(?i)(page created by|last edited by)[^\n]*", "", text)
+    replacements = {
+        "“": "\"", "”": "\"", "‘": "'", "’": "'",
+        "—": "-", "–": "-"
+    }
+    for orig, repl in replacements.items():
+        text = text.replace(orig, repl)
+    text = unicodedata.normalize("NFKC", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch)[0] != "C")
+    text = text.lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    ascii_text = text.encode('ascii', 'ignore').decode('ascii')
+    return ascii_text.strip()
+
+
+WORDS = ("api", "gateway", "deployment", "policy", "route", "backend", "token",
+         "“quoted”", "—", "&amp;", "[1]", "(2)", "https://docs.example.com/a",
+         "admin@example.com", "ﬁle", " ", "\n", "\t")
+
+
+def synthetic_page(rng: random.Random, n_elements: int) -> list[str]:
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 80)))
+            for _ in range(n_elements)]
+
+
+def page_html(elements: list[str]) -> str:
+    body = "".join(f"<h2>Heading {i}</h2>" if i % 10 == 0 else f"<p>{html.escape(t)}</p>"
+                   for i, t in enumerate(elements))
+    return f"<html><head><title>Bench</title></head><body>{body}</body></html>"
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--elements", type=int, default=400)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pages = [synthetic_page(rng, args.elements) for _ in range(args.pages)]
+    assert [clean_texts(p) for p in pages] == \
+        [[legacy_clean_text(t) for t in p] for p in pages]
+
+    legacy = timed(lambda: [[legacy_clean_text(t) for t in p] for p in pages])
+    single = timed(lambda: [clean_texts(p) for p in pages])
+    print(f"legacy per-element : {legacy * 1000 / args.pages:8.2f} ms/page")
+    print(f"page-level         : {single * 1000 / args.pages:8.2f} ms/page "
+          f"({legacy / single:.1f}x)")
+
+    try:
+        from bs4 import BeautifulSoup
+    except ImportError:
+        return
+    docs = [page_html(p) for p in pages]
+    for backend in ("html.parser", "lxml"):
+        try:
+            BeautifulSoup("<p></p>", backend)
+        except Exception:
+            print(f"{backend:<19}: not installed")
+            continue
+        elapsed = timed(lambda: [BeautifulSoup(d, backend) for d in docs])
+        print(f"{backend:<19}: {elapsed * 1000 / args.pages:8.2f} ms/page parse")
+
+
+if __name__ == "__main__":
+    main()
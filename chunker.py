@@ -0,0 +1,101 @@
+# chunker.py
+"""
+Token-aware chunking with the embedding model's own fast tokenizer.
+
+A page is tokenized once, with character offsets, and its section bodies
+are cut into windows of tokens:
+
+- a window holds at most the section's token budget: CHUNK_TOKENS, capped
+  by the model's input limit minus the metadata header HFEmbedding embeds
+  in front of every chunk, so no chunk is truncated by the model;
+- it ends at the last sentence or line break before the limit if one lies
+  past CHUNK_MIN_TOKENS, otherwise on a plain token boundary;
+- consecutive windows share up to CHUNK_OVERLAP_TOKENS tokens, the overlap
+  starting at a sentence break when there is one.
+
+split() returns character spans, so chunk text is an exact slice of the
+page and the span can go into node metadata for citations.
+"""
+import re
+
+import numpy as np
+
+from config import EMBED_MODEL_NAME, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_MIN_TOKENS
+
+# A chunk may start right after sentence punctuation or a newline
+BREAK_RE = re.compile(r"(?<=[.!?:;])\s+|\n\s*")
+# [CLS] and [SEP] added around every model input
+SPECIAL_TOKENS = 2
+# Tokenizers without a real limit report a huge model_max_length
+UNLIMITED = 1_000_000
+
+
+class TokenChunker:
+    def __init__(self, tokenizer=None, model_name: str = EMBED_MODEL_NAME,
+                 max_tokens: int = CHUNK_TOKENS,
+                 overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 min_tokens: int = CHUNK_MIN_TOKENS):
+        if tokenizer is None:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+        if not min_tokens > overlap_tokens:
+            raise ValueError("min_tokens must be larger than overlap_tokens")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min_tokens
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def budget(self, header: str = "") -> int:
+        """Tokens a chunk may have so that header + chunk fit the model input."""
+        limit = getattr(self.tokenizer, "model_max_length", UNLIMITED) or UNLIMITED
+        if limit >= UNLIMITED:
+            return self.max_tokens
+        room = limit - SPECIAL_TOKENS - (self.count_tokens(header) + 1 if header else 0)
+        return max(self.min_tokens, min(self.max_tokens, room))
+
+    def _token_offsets(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                                  truncation=False, verbose=False)
+        offsets = np.asarray(encoding["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+        return offsets[:, 0], offsets[:, 1]
+
+    def split(self, text: str, spans: list[tuple[int, int]],
+              budgets: list[int]) -> list[list[tuple[int, int]]]:
+        """
+        Cut each (start, end) character span of text into chunks of at most
+        the matching budget tokens. Returns the (start, end) character
+        spans of the chunks of every input span.
+        """
+        starts, ends = self._token_offsets(text)
+        # Index of the first token after every sentence/line break
+        break_tokens = np.unique(np.searchsorted(
+            starts, [m.end() for m in BREAK_RE.finditer(text)]))
+
+        result = []
+        for (span_start, span_end), budget in zip(spans, budgets):
+            lo = int(np.searchsorted(starts, span_start))
+            hi = int(np.searchsorted(starts, span_end))
+            breaks = break_tokens[np.searchsorted(break_tokens, lo, "right"):
+                                  np.searchsorted(break_tokens, hi)]
+            windows = []
+            i = lo
+            while i < hi:
+                if i + budget >= hi:
+                    windows.append((i, hi))
+                    break
+                k = int(np.searchsorted(breaks, i + budget, "right")) - 1
+                cut = int(breaks[k]) if k >= 0 and breaks[k] >= i + self.min_tokens else i + budget
+                windows.append((i, cut))
+
+                nxt = cut - self.overlap_tokens
+                if self.overlap_tokens:
+                    # Start the overlap at the first sentence inside it
+                    k = int(np.searchsorted(breaks, nxt))
+                    if k < len(breaks) and breaks[k] < cut:
+                        nxt = int(breaks[k])
+                i = nxt if nxt > i else cut
+            result.append([(int(starts[a]), int(ends[b - 1])) for a, b in windows])
+        return result
@@ -1,11 +1,144 @@
 DOCS_DIR = "./confluence_docs"
 FAISS_INDEX_PATH = "faiss_index"
+# Named index shards, one per Confluence space or docs directory:
+# {"name": "./docs_dir"}. Each is built into SHARDS_DIR/<name> on its own
+# and queries search all of them (or those picked with --shard) in
+# parallel. Empty: the single DOCS_DIR / FAISS_INDEX_PATH index is used.
+SHARDS = {}
+SHARDS_DIR = "shards"
+# Threads searching shards at once; None uses one per selected shard
+SHARD_SEARCH_THREADS = None
 EMBED_MODEL_NAME = "BAAI/bge-small-en-v1.5"
 EMBEDDING_DIM = 384
 
+# FAISS index type: "flat" (exact), "ivf_flat", "hnsw" or "ivf_pq"
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+INDEX_TYPE = "flat"
+# IVF cells; None picks ~4*sqrt(n_vectors)
+IVF_NLIST = None
+# IVF cells scanned per query, higher is slower and more accurate
+IVF_NPROBE = 16
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+# HNSW candidate list size per query, higher is slower and more accurate
+HNSW_EF_SEARCH = 64
+# Sub-quantizers (must divide EMBEDDING_DIM) and bits per code for IVF-PQ
+PQ_M = 48
+PQ_NBITS = 8
+# Max vectors sampled to train IVF/PQ indexes
+INDEX_TRAIN_SAMPLE = 50000
+# Texts per model forward pass when embedding chunks
+EMBED_BATCH_SIZE = 32
+# Texts LlamaIndex hands to the embedder at once; they are sorted by
+# token length inside this window so each forward pass pads less
+EMBED_SORT_WINDOW = 1024
+# "cls" (recommended for bge models) or "mean" (attention-masked average)
+EMBED_POOLING = "cls"
+# CPU inference precision: "fp32", "int8" (dynamic quantization) or "bf16"
+EMBED_PRECISION = "fp32"
+# Lowest acceptable cosine similarity to fp32 in HFEmbedding.parity_check
+EMBED_PARITY_MIN_COSINE = 0.99
+# On-disk cache of chunk embeddings keyed by model name + chunk text
+EMBED_CACHE_DIR = "embedding_cache"
+# Embedding worker processes for index builds (embed_pool.py), each with its
+# own model copy: 0 embeds in the building process, None starts one per
+# EMBED_WORKER_THREADS CPUs
+EMBED_WORKERS = 0
+# torch intra-op threads per embedding worker
+EMBED_WORKER_THREADS = 4
+
+# Token-aware chunking (chunker.py) with the embedding model's tokenizer:
+# max tokens per chunk (also capped by the model input minus the metadata
+# header), tokens shared by consecutive chunks, and the shortest chunk a
+# sentence break may end
+CHUNK_TOKENS = 256
+CHUNK_OVERLAP_TOKENS = 24
+CHUNK_MIN_TOKENS = 64
+
+# Processes that load, section and chunk documents; None uses every CPU
+INGEST_WORKERS = None
+# Files handed to an ingestion worker at a time
+INGEST_SHARD_SIZE = 64
+
 OLLAMA_MODEL_NAME = "llama3.2:latest"
 OLLAMA_API_URL = "http://localhost:11434/api/generate"
+OLLAMA_BASE_URL = OLLAMA_API_URL.rsplit("/api/", 1)[0]
+
+# Hybrid retrieval: BM25 hits fused with dense hits by reciprocal rank
+HYBRID_SEARCH = True
+# Dense and BM25 candidates per query fed into the fusion
+HYBRID_CANDIDATES = 20
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+# Cross-encoder re-ranking (reranker.py), off unless enabled here or with
+# main.py / server.py --rerank
+RERANK_ENABLED = False
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Chunks retrieved per question for the cross-encoder to score
+RERANK_CANDIDATES = 20
+# Best-scored chunks passed on to the prompt
+RERANK_TOP_N = 4
+# (question, chunk) pairs per cross-encoder forward pass
+RERANK_BATCH_SIZE = 10
+# No new batch starts once re-ranking would run past this many ms
+RERANK_BUDGET_MS = 250
+# Cached (question, chunk text) scores
+RERANK_CACHE_SIZE = 4096
+
+# Filtered search: selections of up to this many chunks are scored exactly
+# on their reconstructed vectors, larger ones go through a FAISS ID selector
+FILTER_EXACT_MAX = 4096
+
+# Context packer (context_packer.py): max prompt context tokens, None = no limit
+CONTEXT_TOKEN_BUDGET = 1500
+# tiktoken encoding used to count context tokens
+CONTEXT_TOKENIZER = "cl100k_base"
+
+# Answer cache (answer_cache.py): a cached answer is reused for a question
+# whose embedding is at least this similar and that retrieves the same chunks
+ANSWER_CACHE_MIN_SIMILARITY = 0.95
+ANSWER_CACHE_SIZE = 256
+# Seconds before a cached answer expires
+ANSWER_CACHE_TTL = 24 * 3600
+ANSWER_CACHE_PATH = "answer_cache.json"
+
+# Batch question answering (batch_qa.py, main.py --batch)
+# Ollama generations in flight at once
+BATCH_QA_CONCURRENCY = 4
+# Questions per batched embedding pass and FAISS search
+BATCH_QA_RETRIEVE_BATCH = 64
+
+# Tracing (tracing.py): per-stage spans and counters, off unless enabled
+# here or with main.py --metrics / --profile
+TRACING_ENABLED = False
+# Slowest individual spans kept for the profiling dump, 0 keeps none
+TRACING_PROFILE_TOP = 0
+
+# Local HTTP query server (server.py)
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+# Queries arriving within this window share one embedding forward pass
+SERVER_BATCH_WINDOW_MS = 10
+SERVER_MAX_BATCH = 32
+# Ollama generations allowed in flight at once
+SERVER_GENERATION_CONCURRENCY = 2
 
 VALID_LINK_SUBSTRING = "Content/APIGateway"
 VALID_LINK_EXTENSION = ".htm"
 EXCLUDE_EXTENSIONS = ['.pdf', '.zip']
+
+# Crawler (scrapper.py)
+# BeautifulSoup backend: "html.parser" or "lxml" (faster, needs the lxml package)
+SCRAPE_HTML_PARSER = "html.parser"
+CRAWL_WORKERS = 4
+# Minimum seconds between two requests to the same host
+CRAWL_HOST_DELAY = 1.0
+CRAWL_TIMEOUT = 10
+# Frontier and visited set of an unfinished crawl, used to resume it
+CRAWL_STATE_PATH = "crawl_state.json"
+# Per-URL ETag / Last-Modified / content hash, kept across crawls
+CRAWL_PAGES_PATH = "crawl_pages.json"
+# Files added, modified and removed by the last completed crawl
+CRAWL_CHANGES_PATH = "crawl_changes.json"
@@ -0,0 +1,154 @@
+# context_packer.py
+"""
+Context assembly between retrieval and generation.
+
+Retrieved chunks overlap: consecutive chunks of a section share up to
+chunk_overlap characters, several hits often come from the same section,
+and identical paragraphs appear on several pages. Prompt evaluation time
+on the local model grows with every token, so before the prompt is built:
+
+1. chunks whose text is contained in a higher-scored chunk are dropped,
+2. consecutive chunks (chunk_id i, i+1, ...) of the same file_path and
+   section are merged into one block, with the shared overlap kept once
+   (located by char_start / char_end when the chunks carry them),
+3. blocks are taken in score order until CONTEXT_TOKEN_BUDGET tokens are
+   used (counted with a tiktoken encoding, close to llama3's tokenizer);
+   the block that crosses the budget is cut on a token boundary.
+"""
+import logging
+from typing import Optional
+
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_TOKENIZER
+from ingest import make_node
+
+# Shorter suffix/prefix matches between consecutive chunks are coincidence
+MIN_OVERLAP_CHARS = 16
+# Blocks cut to fewer tokens than this are dropped instead
+MIN_BLOCK_TOKENS = 32
+
+
+def _chunk_id(n: NodeWithScore) -> int:
+    chunk_id = n.node.metadata.get("chunk_id")
+    return chunk_id if isinstance(chunk_id, int) else -1
+
+
+def span_overlap(a: dict, b: dict):
+    """
+    Characters b's text shares with the end of a's, from the char_start /
+    char_end metadata of consecutive chunks; None if they lack it.
+    """
+    try:
+        return max(0, a["char_end"] - b["char_start"])
+    except (KeyError, TypeError):
+        return None
+
+
+def overlap_length(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is also a prefix of b."""
+    for n in range(min(len(a), len(b)), MIN_OVERLAP_CHARS - 1, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+
+class ContextPacker:
+    def __init__(self, budget_tokens: Optional[int] = CONTEXT_TOKEN_BUDGET,
+                 encoding=CONTEXT_TOKENIZER):
+        # None disables trimming
+        self.budget_tokens = budget_tokens
+        # A tiktoken encoding name, loaded on first use, or any object with
+        # tiktoken's encode/decode
+        self._encoding = encoding
+
+    @property
+    def encoding(self):
+        if isinstance(self._encoding, str):
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(self._encoding)
+        return self._encoding
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def _dedupe(self, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        kept = []
+        for n in sorted(nodes, key=lambda n: -(n.score or 0.0)):
+            text = n.node.get_content().strip()
+            if any(text in k.node.get_content() for k in kept):
+                continue
+            kept.append(n)
+        return kept
+
+    def _merge(self, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        groups: dict[tuple, list[NodeWithScore]] = {}
+        for n in nodes:
+            md = n.node.metadata
+            groups.setdefault((md.get("file_path"), md.get("section")), []).append(n)
+
+        blocks = []
+        for group in groups.values():
+            run: list[NodeWithScore] = []
+            for n in sorted(group, key=_chunk_id):
+                if run and (_chunk_id(n) < 0 or _chunk_id(n) != _chunk_id(run[-1]) + 1):
+                    blocks.append(self._join(run))
+                    run = []
+                run.append(n)
+            blocks.append(self._join(run))
+        return sorted(blocks, key=lambda n: -(n.score or 0.0))
+
+    @staticmethod
+    def _join(run: list[NodeWithScore]) -> NodeWithScore:
+        if len(run) == 1:
+            return run[0]
+        text = run[0].node.get_content()
+        for prev, n in zip(run, run[1:]):
+            nxt = n.node.get_content()
+            overlap = span_overlap(prev.node.metadata, n.node.metadata)
+            if overlap is None:
+                overlap = overlap_length(text, nxt)
+            text += nxt[overlap:] if overlap else "\n" + nxt
+        metadata = dict(run[0].node.metadata)
+        metadata["chunk_id"] = f"{run[0].node.metadata.get('chunk_id')}-" \
+                               f"{run[-1].node.metadata.get('chunk_id')}"
+        if "char_end" in run[-1].node.metadata:
+            metadata["char_end"] = run[-1].node.metadata["char_end"]
+        node = make_node(text, metadata, id_=run[0].node.id_)
+        return NodeWithScore(node=node, score=max(n.score or 0.0 for n in run))
+
+    def _trim(self, blocks: list[NodeWithScore]) -> list[NodeWithScore]:
+        rendered = [b.node.get_content(metadata_mode=MetadataMode.LLM) for b in blocks]
+        # A token is at least one byte, so contexts this small always fit
+        if sum(len(r.encode("utf-8")) for r in rendered) <= self.budget_tokens:
+            return blocks
+
+        packed, used = [], 0
+        for block, text in zip(blocks, rendered):
+            tokens = self.count_tokens(text)
+            if used + tokens <= self.budget_tokens:
+                packed.append(block)
+                used += tokens
+                continue
+            remaining = self.budget_tokens - used
+            if remaining >= MIN_BLOCK_TOKENS:
+                # Cut the chunk text; the metadata header stays intact
+                header_tokens = tokens - self.count_tokens(block.node.get_content())
+                body_tokens = remaining - header_tokens
+                # A citation header without any text is not worth its tokens
+                if body_tokens > 0:
+                    body = self.encoding.encode(block.node.get_content(), disallowed_special=())
+                    cut = self.encoding.decode(body[:body_tokens])
+                    node = make_node(cut, block.node.metadata, id_=block.node.id_)
+                    packed.append(NodeWithScore(node=node, score=block.score))
+            break
+        return packed
+
+    def pack(self, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        """Deduplicated, merged and budget-trimmed context blocks for nodes."""
+        blocks = self._merge(self._dedupe(nodes))
+        if self.budget_tokens is not None:
+            blocks = self._trim(blocks)
+        logging.info("Packed %d retrieved chunks into %d context blocks",
+                     len(nodes), len(blocks))
+        return blocks
@@ -0,0 +1,88 @@
+# docstore.py
+"""
+SQLite-backed node store. Chunk text and metadata stay on disk and only the
+rows for the top-k search hits are read, so memory and startup time do not
+grow with the size of the corpus.
+"""
+import json
+import sqlite3
+import threading
+
+from llama_index.core.schema import TextNode
+
+from ingest import make_node
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id       INTEGER PRIMARY KEY,
+    file_key TEXT NOT NULL,
+    text     TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS nodes_file_key ON nodes (file_key);
+"""
+
+
+class SQLiteDocStore:
+    def __init__(self, path: str):
+        self.path = path
+        # Shared by the server's worker threads; the lock serializes access
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def add_nodes(self, file_key: str, ids: list, nodes: list[TextNode]) -> None:
+        rows = [
+            (int(vid), file_key, node.get_content(), json.dumps(node.metadata))
+            for vid, node in zip(ids, nodes)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO nodes (id, file_key, text, metadata) "
+                "VALUES (?, ?, ?, ?)", rows)
+
+    def delete_file(self, file_key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM nodes WHERE file_key = ?", (file_key,))
+
+    def get_nodes(self, ids: list) -> dict[int, TextNode]:
+        """Fetch nodes by ID; missing IDs are simply absent from the result."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, text, metadata FROM nodes WHERE id IN ({placeholders})",
+                ids).fetchall()
+        return {
+            vid: make_node(text, json.loads(metadata), id_=str(vid))
+            for vid, text, metadata in rows
+        }
+
+    def iter_nodes(self, batch_size: int = 1000):
+        """Yield (id, text, metadata) for every node in ID order."""
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, text, metadata FROM nodes WHERE id > ? ORDER BY id LIMIT ?",
+                    (last, batch_size)).fetchall()
+            if not rows:
+                return
+            for vid, text, metadata in rows:
+                yield vid, text, json.loads(metadata)
+            last = rows[-1][0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,112 @@
+# embed_pool.py
+"""
+Multi-process embedding for large builds.
+
+One PyTorch model in one process leaves most cores of a big indexing host
+idle: intra-op threading stops scaling after a few threads on the small
+matrices of a MiniLM/bge-small forward pass. EmbeddingPool starts N spawned
+worker processes instead, each with torch pinned to EMBED_WORKER_THREADS
+intra-op threads (and one inter-op thread) so the workers don't
+oversubscribe the cores, and each loading its own copy of the model once,
+when it starts.
+
+HFEmbedding hands the pool its length-sorted forward-pass batches (see
+HFEmbedding._embed_sorted); map_batches returns the results in submission
+order, so output order never depends on which worker was fastest. The
+embedding cache, tokenization for the length sort and query embedding stay
+in the parent process.
+
+Workers use the spawn start method regardless of the global setting:
+forking a process that already runs torch threads can deadlock.
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+from config import (EMBED_MODEL_NAME, EMBED_BATCH_SIZE, EMBED_POOLING, EMBED_PRECISION,
+                    EMBED_WORKERS, EMBED_WORKER_THREADS)
+
+# The embedding model of this worker process, set by _init_worker
+_worker_model = None
+
+
+def load_embedding(model_name: str = EMBED_MODEL_NAME, batch_size: int = EMBED_BATCH_SIZE,
+                   pooling: str = EMBED_POOLING, precision: str = EMBED_PRECISION):
+    """Default worker model: an uncached HFEmbedding."""
+    from embeddings import HFEmbedding
+    return HFEmbedding(model_name, batch_size=batch_size, pooling=pooling, precision=precision)
+
+
+def _init_worker(threads: int, factory: Callable, kwargs: dict) -> None:
+    global _worker_model
+    # Set before torch is imported, so OpenMP / MKL size their pools to match
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    _worker_model = factory(**kwargs)
+
+
+def _encode_batch(texts: list):
+    return _worker_model._encode(texts)
+
+
+def _worker_pid(_) -> int:
+    return os.getpid()
+
+
+def default_workers(threads_per_worker: int = EMBED_WORKER_THREADS) -> int:
+    """As many workers as fit the CPUs at threads_per_worker each."""
+    return max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+
+
+class EmbeddingPool:
+    def __init__(self, workers: Optional[int] = EMBED_WORKERS,
+                 threads_per_worker: int = EMBED_WORKER_THREADS,
+                 factory: Callable = load_embedding, **model_kwargs):
+        """
+        Start workers processes (None: default_workers()) that each build
+        their model with factory(**model_kwargs); factory must be picklable,
+        i.e. a module-level function or class.
+        """
+        self.workers = workers or default_workers(threads_per_worker)
+        self.threads_per_worker = max(1, threads_per_worker)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker, factory, model_kwargs))
+        logging.info("Started %d embedding workers with %d threads each",
+                     self.workers, self.threads_per_worker)
+
+    @classmethod
+    def for_embedding(cls, embedding, workers: Optional[int] = EMBED_WORKERS,
+                      threads_per_worker: int = EMBED_WORKER_THREADS) -> "EmbeddingPool":
+        """Pool whose workers load the same model configuration as embedding (an HFEmbedding)."""
+        return cls(workers, threads_per_worker, model_name=embedding.model_name,
+                   batch_size=embedding.batch_size, pooling=embedding.pooling,
+                   precision=embedding.precision)
+
+    def warm(self) -> int:
+        """
+        Start every worker now rather than on the first batch; returns the
+        number of worker processes that answered.
+        """
+        return len(set(self._executor.map(_worker_pid, range(self.workers))))
+
+    def map_batches(self, batches: list[list[str]]) -> list:
+        """Embed every batch of texts on the workers; results are in batch order."""
+        return list(self._executor.map(_encode_batch, batches))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "EmbeddingPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,161 @@
+# embedding_cache.py
+"""
+Persistent, content-addressed cache of chunk embeddings.
+
+Vectors live in a memory-mapped float32 file (one row per entry) and a
+small JSON index maps each key to its row. A key is a hash of the embedding
+model name (HFEmbedding.fingerprint, which also covers pooling and precision)
+plus the chunk text, so changing the model never serves stale vectors and
+unchanged chunks are never re-embedded across index builds.
+"""
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from config import EMBED_CACHE_DIR, EMBED_MODEL_NAME, EMBEDDING_DIM
+
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.json"
+MIN_CAPACITY = 1024
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str = EMBED_CACHE_DIR,
+                 model_name: str = EMBED_MODEL_NAME,
+                 dim: int = EMBEDDING_DIM):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.dim = dim
+        self._vectors_path = os.path.join(cache_dir, VECTORS_FILE)
+        self._keys_path = os.path.join(cache_dir, KEYS_FILE)
+        # key -> row in the vectors file
+        self._rows: dict[str, int] = {}
+        # keys read or written since the cache was opened
+        self._touched: set[str] = set()
+        self._count = 0
+        self._capacity = 0
+        self._vectors = None
+        self._load()
+
+    def _load(self) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        meta = {}
+        if os.path.exists(self._keys_path) and os.path.exists(self._vectors_path):
+            with open(self._keys_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta.get("dim") != self.dim:
+            if meta:
+                logging.info("Embedding cache dimension changed, starting empty")
+            meta = {}
+
+        self._rows = meta.get("rows", {})
+        self._count = meta.get("count", 0)
+        if meta:
+            row_bytes = self.dim * np.dtype(np.float32).itemsize
+            self._capacity = os.path.getsize(self._vectors_path) // row_bytes
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32,
+                                      mode="r+", shape=(self._capacity, self.dim))
+        else:
+            self._capacity = MIN_CAPACITY
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32,
+                                      mode="w+", shape=(self._capacity, self.dim))
+        logging.info("Embedding cache loaded with %d entries", self._count)
+
+    def _grow(self, needed: int) -> None:
+        """Extend the vectors file so it can hold `needed` rows."""
+        new_capacity = max(self._capacity * 2, needed, MIN_CAPACITY)
+        self._vectors.flush()
+        self._vectors = None
+        row_bytes = self.dim * np.dtype(np.float32).itemsize
+        with open(self._vectors_path, "r+b") as f:
+            f.truncate(new_capacity * row_bytes)
+        self._capacity = new_capacity
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32,
+                                  mode="r+", shape=(self._capacity, self.dim))
+
+    def key(self, text: str) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.model_name.encode("utf-8"))
+        h.update(b"\0")
+        h.update(text.encode("utf-8"))
+        return h.hexdigest()
+
+    def get_many(self, texts: list) -> list:
+        """
+        Return a list aligned with texts holding the cached vector
+        (np.ndarray) for each hit and None for each miss.
+        """
+        found = []
+        for text in texts:
+            k = self.key(text)
+            row = self._rows.get(k)
+            if row is None:
+                found.append(None)
+            else:
+                self._touched.add(k)
+                found.append(np.array(self._vectors[row]))
+        return found
+
+    def put_many(self, texts: list, vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for text, vec in zip(texts, vectors):
+            k = self.key(text)
+            self._touched.add(k)
+            if k in self._rows:
+                continue
+            if self._count >= self._capacity:
+                self._grow(self._count + 1)
+            self._vectors[self._count] = vec
+            self._rows[k] = self._count
+            self._count += 1
+
+    def flush(self) -> None:
+        """Write the vectors and key index to disk."""
+        self._vectors.flush()
+        tmp_path = self._keys_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": self._count,
+                       "rows": self._rows}, f)
+        os.replace(tmp_path, self._keys_path)
+
+    def evict_unused(self) -> int:
+        """
+        Drop every entry that was not read or written since the cache was
+        opened, compacting the vectors file. Call once a full rebuild has
+        embedded the whole corpus. Returns the number of evicted entries.
+        """
+        live = sorted((row, k) for k, row in self._rows.items()
+                      if k in self._touched)
+        evicted = len(self._rows) - len(live)
+        if not evicted:
+            self.flush()
+            return 0
+
+        kept = np.array(self._vectors[[row for row, _ in live]]) \
+            if live else np.empty((0, self.dim), dtype=np.float32)
+        self._vectors.flush()
+        self._vectors = None
+
+        capacity = max(len(live), MIN_CAPACITY)
+        tmp_path = self._vectors_path + ".tmp"
+        compacted = np.memmap(tmp_path, dtype=np.float32, mode="w+",
+                              shape=(capacity, self.dim))
+        compacted[:len(live)] = kept
+        compacted.flush()
+        del compacted
+        os.replace(tmp_path, self._vectors_path)
+
+        self._rows = {k: i for i, (_, k) in enumerate(live)}
+        self._count = len(live)
+        self._capacity = capacity
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32,
+                                  mode="r+", shape=(self._capacity, self.dim))
+        self.flush()
+        logging.info("Evicted %d stale embeddings from cache", evicted)
+        return evicted
+
+    def __len__(self) -> int:
+        return self._count
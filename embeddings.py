@@ -1,37 +1,194 @@
 # embeddings.py
+import contextlib
+import logging
 import torch
 from llama_index.core.base.embeddings.base import BaseEmbedding
 from transformers import AutoTokenizer, AutoModel
-from sklearn.preprocessing import normalize
 import numpy as np
-from config import EMBED_MODEL_NAME
+import tracing
+from config import (EMBED_MODEL_NAME, EMBED_BATCH_SIZE, EMBED_SORT_WINDOW,
+                    EMBED_POOLING, EMBED_PRECISION, EMBED_PARITY_MIN_COSINE)
 from typing import Any
 
+POOLING_MODES = ("cls", "mean")
+PRECISION_MODES = ("fp32", "int8", "bf16")
+
+
+def load_model(model_name: str = EMBED_MODEL_NAME, precision: str = "fp32"):
+    """
+    Load the transformer in inference mode at the requested CPU precision:
+    fp32 and bf16 load as-is (bf16 runs under CPU autocast in HFEmbedding),
+    int8 gets dynamic quantization of the Linear layers.
+    """
+    if precision not in PRECISION_MODES:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISION_MODES}")
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+    if precision == "int8":
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def pool(last_hidden_state, attention_mask, pooling: str = EMBED_POOLING):
+    """
+    Reduce token states to one vector per text. "cls" takes the first
+    token (what bge models are trained for); "mean" averages real tokens
+    only, so padding never leaks between texts of a batch.
+    """
+    if pooling == "cls":
+        return last_hidden_state[:, 0]
+    mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+    summed = (last_hidden_state * mask).sum(dim=1)
+    return summed / mask.sum(dim=1).clamp(min=1e-9)
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Unit-length rows, all-zero rows left as they are (like sklearn's normalize)."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
 
 class HFEmbedding(BaseEmbedding):
     # Declare the fields so they are recognized
     tokenizer: Any = None
     model: Any = None
+    # Number of texts per model forward pass
+    batch_size: int = EMBED_BATCH_SIZE
+    # Optional EmbeddingCache consulted before running the model
+    cache: Any = None
+    # Optional EmbeddingPool that runs the forward passes of large batches
+    pool: Any = None
+    pooling: str = EMBED_POOLING
+    precision: str = EMBED_PRECISION
+
+    def __init__(self, model_name=EMBED_MODEL_NAME,
+                 batch_size: int = EMBED_BATCH_SIZE,
+                 embed_batch_size: int = EMBED_SORT_WINDOW,
+                 cache: Any = None,
+                 pooling: str = EMBED_POOLING,
+                 precision: str = EMBED_PRECISION):
+        # embed_batch_size is how many texts LlamaIndex passes to
+        # _get_text_embeddings at once; batch_size is the forward pass size
+        super().__init__(model_name=model_name,
+                         embed_batch_size=embed_batch_size)
+        if pooling not in POOLING_MODES:
+            raise ValueError(f"Unknown pooling {pooling!r}, expected one of {POOLING_MODES}")
+        self.batch_size = batch_size
+        self.cache = cache
+        self.pooling = pooling
+        self.precision = precision
+        with tracing.span("embed.model_load", model=model_name, precision=precision):
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+            self.model = load_model(model_name, precision)
 
-    def __init__(self, model_name=EMBED_MODEL_NAME):
-        super().__init__()  # Call the parent initializer if needed
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identifies everything that changes the vectors this instance
+        produces; use it to key cached embeddings.
+        """
+        return f"{self.model_name}|{self.pooling}|{self.precision}"
+
+    def _encode(self, texts: list, model: Any = None) -> np.ndarray:
+        """
+        Run one forward pass over texts and return normalized embeddings.
+        """
+        model = model if model is not None else self.model
+        tracing.count("embed.texts", len(texts))
+        with tracing.span("embed.forward", texts=len(texts)):
+            inputs = self.tokenizer(
+                texts,
+                padding=True,
+                truncation=True,
+                return_tensors="pt")
+            autocast = (
+                torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+                if model is self.model and self.precision == "bf16"
+                else contextlib.nullcontext()
+            )
+            with torch.no_grad(), autocast:
+                outputs = model(**inputs)
+                embeddings = pool(outputs.last_hidden_state,
+                                  inputs["attention_mask"], self.pooling)
+            return l2_normalize(embeddings.float().cpu().numpy())
+
+    def parity_check(self, texts: list,
+                     min_cosine: float = EMBED_PARITY_MIN_COSINE) -> float:
+        """
+        Compare this instance's embeddings with an fp32 copy of the model
+        on texts. Returns the lowest cosine similarity and logs a warning
+        when it falls below min_cosine.
+        """
+        reference_model = load_model(self.model_name, "fp32")
+        ours = self._encode(texts)
+        reference = self._encode(texts, model=reference_model)
+        worst = float((ours * reference).sum(axis=1).min())
+        if worst < min_cosine:
+            logging.warning("%s embeddings drift from fp32: min cosine %.4f < %.4f",
+                            self.precision, worst, min_cosine)
+        else:
+            logging.info("%s embeddings match fp32: min cosine %.4f",
+                         self.precision, worst)
+        return worst
 
     def _get_text_embedding(self, text: str) -> list:
-        # Tokenize the input text
-        inputs = self.tokenizer(
-            text,
-            padding=True,
-            truncation=True,
-            return_tensors="pt")
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            # Mean pooling over token embeddings
-            embedding = outputs.last_hidden_state.mean(dim=1)
-        embedding_np = embedding.cpu().numpy()
-        normalized_vec = normalize(embedding_np)[0]
-        return normalized_vec.tolist()
+        return self._encode([text])[0].tolist()
+
+    def _get_text_embeddings(self, texts: list) -> list:
+        """
+        Batched embedding used by LlamaIndex's get_text_embedding_batch.
+        Cached texts are served from the embedding cache; the rest go
+        through the model and are added to it.
+        """
+        if self.cache is None:
+            return self._embed_sorted(texts)
+
+        results = self.cache.get_many(texts)
+        misses = [i for i, vec in enumerate(results) if vec is None]
+        tracing.count("embed.cache_hits", len(texts) - len(misses))
+        tracing.count("embed.cache_misses", len(misses))
+        if misses:
+            computed = self._embed_sorted([texts[i] for i in misses])
+            self.cache.put_many([texts[i] for i in misses], computed)
+            for i, vec in zip(misses, computed):
+                results[i] = vec
+        return [
+            vec.tolist() if isinstance(vec, np.ndarray) else vec
+            for vec in results
+        ]
+
+    def _embed_sorted(self, texts: list) -> list:
+        """
+        Texts are sorted by token length so each forward pass pads as
+        little as possible, then results are put back in input order.
+        With a pool, the forward passes run on its worker processes.
+        """
+        if not texts:
+            return []
+        with tracing.span("embed.length_sort", texts=len(texts)):
+            lengths = [
+                len(ids) for ids in
+                self.tokenizer(texts, truncation=True)["input_ids"]
+            ]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+
+        batches = [order[start:start + self.batch_size]
+                   for start in range(0, len(order), self.batch_size)]
+        if self.pool is not None and len(batches) > 1:
+            tracing.count("embed.texts", len(texts))
+            with tracing.span("embed.pool", texts=len(texts), batches=len(batches)):
+                encoded = self.pool.map_batches(
+                    [[texts[i] for i in batch_idx] for batch_idx in batches])
+        else:
+            encoded = (self._encode([texts[i] for i in batch_idx]) for batch_idx in batches)
+
+        results: list = [None] * len(texts)
+        for batch_idx, vecs in zip(batches, encoded):
+            for i, vec in zip(batch_idx, vecs):
+                results[i] = vec.tolist()
+        return results
 
     def _get_query_embedding(self, text: str) -> list:
         # Use the same method for query embedding
@@ -46,14 +203,4 @@ class HFEmbedding(BaseEmbedding):
 
     def get_batch_text_embeddings(self, texts: list) -> list:
         # Batch processing for multiple texts
-        inputs = self.tokenizer(
-            texts,
-            padding=True,
-            truncation=True,
-            return_tensors="pt")
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            embeddings = outputs.last_hidden_state.mean(dim=1)
-        embeddings_np = embeddings.cpu().numpy()
-        normalized_vecs = normalize(embeddings_np)
-        return normalized_vecs.tolist()
+        return self._get_text_embeddings(texts)
@@ -1,141 +1,322 @@
 # indexer.py
-import faiss
-import os, re
+import hashlib
+import os
+import json
 import logging
-from typing import Any
-from llama_index.core import VectorStoreIndex, StorageContext, Document, load_index_from_storage
-from llama_index.vector_stores.faiss import FaissVectorStore
-from config import DOCS_DIR, EMBEDDING_DIM, FAISS_INDEX_PATH
-from embeddings import HFEmbedding
-from llm_adapter import create_ollama_llm
-from prompt import NO_HALLU_TEMPLATE
-from utils.utils import load_documents_with_metadata, chunk_document, get_citation_and_score
-
-# Setup basic logging configuration
-logging.basicConfig(level=logging.INFO)
-
-def extract_sections(full_text: str):
-    """
-    Parses 'Section: {heading}\n{body}\n\n' blocks.
-    If none are found, yields a single default section.
-    """
-    import re
-    pattern = r"Section: (?P<heading>.+?)\n(?P<body>.*?)(?=(?:Section: )|\Z)"
-    matches = list(re.finditer(pattern, full_text, flags=re.DOTALL))
-
-    if matches:
-        for m in matches:
-            heading = m.group("heading").strip()
-            body    = m.group("body").strip()
-            yield heading, body
-    else:
-        # Fallback: no explicit sections, treat everything as one chunk
-        yield "ROOT", full_text.strip()
+from typing import TYPE_CHECKING, Optional
+from llama_index.core.schema import MetadataMode
+import tracing
+from config import (DOCS_DIR, FAISS_INDEX_PATH, INDEX_TYPE, INGEST_WORKERS, EMBED_WORKERS,
+                    EMBED_CACHE_DIR)
+from embedding_cache import EmbeddingCache
+# extract_sections is re-exported for callers that imported it from here
+from ingest import IngestStats, extract_sections, iter_file_chunks, make_node
+from shards import select_shards, shard_index_dir, shard_cache_dir
+from vector_index import VectorIndex
+
+# torch / transformers (embeddings) and the Ollama client (query_service)
+# are imported where they are used: an update with nothing to re-embed
+# needs neither
+if TYPE_CHECKING:
+    from embeddings import HFEmbedding
+
+
+def hash_file(path: str) -> str:
+    """Content hash used to detect changed files between builds."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
 
 
-def build_index() -> None:
+def file_key(path: str, docs_dir: str = DOCS_DIR) -> str:
+    """Manifest key of a document: its path relative to docs_dir."""
+    return os.path.relpath(path, docs_dir)
+
+
+def scan_docs_dir(docs_dir: str = DOCS_DIR,
+                  keys: Optional[set] = None) -> dict[str, str]:
     """
-    Build the FAISS index:
-    1. Load documents from DOCS_DIR.
-    2. Compute embeddings using HFEmbedding.
-    3. Create a FAISS index (using IndexFlatIP) with the specified embedding dimension.
-    4. Build a StorageContext with FaissVectorStore.
-    5. Construct a VectorStoreIndex using LlamaIndex and persist it.
-    """
-    logging.info("Clean and loading documents from: %s", DOCS_DIR)
-
-    raw_docs = load_documents_with_metadata(DOCS_DIR)
-    documents = []
-
-    for doc in raw_docs:
-        full_text = doc.text
-        md        = getattr(doc, "extra_info", {})
-
-        # Split into sections
-        for heading, body in extract_sections(full_text):
-            # Chunk each section body
-            chunks = chunk_document(body)
-            # Add chunks with metadata
-            for i, chunk in enumerate(chunks):
-                documents.append(
-                    Document(
-                        text=chunk,
-                        metadata={
-                            "file_path": md.get("source", md.get("file_path", "unknown")),
-                            "section": heading,
-                            "chunk_id": i,
-                        }
-                    )
-                )
+    Return {file key: content hash} for every file the directory reader
+    would load (non-hidden regular files directly inside docs_dir).
+    If keys is given, only those files are looked at.
+    """
+    hashes = {}
+    names = sorted(os.listdir(docs_dir)) if keys is None else sorted(keys)
+    for name in names:
+        path = os.path.join(docs_dir, name)
+        if name.startswith(".") or not os.path.isfile(path):
+            continue
+        hashes[file_key(path, docs_dir)] = hash_file(path)
+    return hashes
+
+
+def _cached_embedding(embed_workers: Optional[int] = EMBED_WORKERS,
+                      cache_dir: str = EMBED_CACHE_DIR) -> "HFEmbedding":
+    """
+    HFEmbedding backed by the embedding cache in cache_dir for its exact
+    configuration, running its forward passes on an EmbeddingPool unless embed_workers is 0.
+    Close it with _close_embedding.
+    """
+    from embeddings import HFEmbedding
 
-    logging.info("Initializing Hugging Face embedding model...")
     hf_embedding = HFEmbedding()
+    hf_embedding.cache = EmbeddingCache(cache_dir, model_name=hf_embedding.fingerprint)
+    if embed_workers != 0:
+        from embed_pool import EmbeddingPool
+        hf_embedding.pool = EmbeddingPool.for_embedding(hf_embedding, embed_workers)
+        # Hand over enough batches per call to keep every worker busy
+        # (LlamaIndex caps embed_batch_size at 2048)
+        hf_embedding.embed_batch_size = min(2048, max(
+            hf_embedding.embed_batch_size,
+            4 * hf_embedding.pool.workers * hf_embedding.batch_size))
+    return hf_embedding
+
 
-    logging.info("Creating FAISS index...")
-    faiss_index = faiss.IndexFlatIP(EMBEDDING_DIM)
-    faiss_store = FaissVectorStore(faiss_index=faiss_index)
+def _close_embedding(hf_embedding: "HFEmbedding") -> None:
+    if hf_embedding.pool is not None:
+        hf_embedding.pool.close()
+        hf_embedding.pool = None
 
-    logging.info("Building storage context with FAISS vector store...")
-    storage_context = StorageContext.from_defaults(vector_store=faiss_store)
 
-    logging.info("Building vector store index from documents...")
-    index = VectorStoreIndex.from_documents(
-        documents,
-        embed_model=hf_embedding,
-        storage_context=storage_context,
-        show_progress=True
-    )
+def _index_files(vector_index: VectorIndex, hf_embedding: "HFEmbedding",
+                 keys: list[str], hashes: dict[str, str],
+                 docs_dir: str = DOCS_DIR,
+                 workers: int = INGEST_WORKERS) -> list:
+    """
+    Run keys through the parallel ingestion pipeline, embedding each shard
+    as soon as the workers hand it over, and add the chunks to vector_index
+    with one manifest entry per file. A fresh IVF/PQ index is trained on
+    the whole corpus, so those builds hold the shards back until the last
+    one is embedded. Returns the embeddings.
+    """
+    stats = IngestStats()
+    stream = not vector_index.needs_training
+    embeddings = []
+    # (file key, nodes, embeddings) not yet added to the index
+    pending = []
+
+    def add_pending():
+        with stats.stage("index", sum(len(nodes) for _, nodes, _ in pending)):
+            for key, nodes, file_embeddings in pending:
+                file_hash = hashes.get(key) or hash_file(os.path.join(docs_dir, key))
+                vector_index.add_file(key, file_hash, nodes, file_embeddings)
+        pending.clear()
+
+    for chunks_by_file in iter_file_chunks(docs_dir, keys, workers, stats=stats):
+        nodes_by_file = {
+            key: [make_node(text, md) for text, md in chunks]
+            for key, chunks in chunks_by_file.items()
+        }
+        shard_nodes = [node for nodes in nodes_by_file.values() for node in nodes]
+        # Embed the same text LlamaIndex would (metadata header + chunk)
+        with stats.stage("embed", len(shard_nodes)):
+            shard_embeddings = hf_embedding.get_text_embedding_batch(
+                [node.get_content(metadata_mode=MetadataMode.EMBED) for node in shard_nodes])
+        embeddings.extend(shard_embeddings)
+
+        offset = 0
+        for key, nodes in nodes_by_file.items():
+            pending.append((key, nodes, shard_embeddings[offset:offset + len(nodes)]))
+            offset += len(nodes)
+        if stream:
+            add_pending()
+
+    # Creates and trains the FAISS index on a fresh build, no-op otherwise
+    with stats.stage("train", len(embeddings)):
+        vector_index.train(embeddings)
+    add_pending()
+    stats.log()
+    return embeddings
+
+
+@tracing.traced("build_index")
+def build_index(docs_dir: str = DOCS_DIR,
+                index_dir: str = FAISS_INDEX_PATH,
+                index_type: str = INDEX_TYPE,
+                recall_check: bool = False,
+                workers: int = INGEST_WORKERS,
+                embed_workers: Optional[int] = EMBED_WORKERS,
+                cache_dir: str = EMBED_CACHE_DIR) -> None:
+    """
+    Build the FAISS index:
+    1. Load documents from DOCS_DIR and split them into section chunks,
+       sharded across `workers` processes (see ingest.py).
+    2. Compute embeddings using HFEmbedding, reusing cached vectors for
+       chunks whose text has not changed since the last build (cached in
+       cache_dir, which drops every vector this build did not use); the model
+       runs on `embed_workers` processes (see embed_pool.py) unless 0.
+    3. Train (for IVF/PQ) and fill a FAISS index of index_type with a
+       docstore entry per chunk.
+    4. Persist the index together with a manifest of file hashes so later
+       runs can update it incrementally.
+    With recall_check, also print recall@k of every index type against
+    flat search on a held-out sample of the embeddings.
+    """
+    logging.info("Clean and loading documents from: %s", docs_dir)
+    with tracing.span("build.scan"):
+        hashes = scan_docs_dir(docs_dir)
+
+    logging.info("Initializing Hugging Face embedding model...")
+    hf_embedding = _cached_embedding(embed_workers, cache_dir)
+
+    logging.info("Creating %s FAISS index...", index_type)
+    vector_index = VectorIndex.create(index_dir, index_type=index_type)
+    try:
+        embeddings = _index_files(vector_index, hf_embedding, list(hashes), hashes,
+                                  docs_dir, workers)
+    finally:
+        _close_embedding(hf_embedding)
+
+    # Every live chunk has now been looked up, anything else is stale
+    hf_embedding.cache.evict_unused()
 
-    if not os.path.exists("faiss_index"):
-        os.makedirs("faiss_index")
     logging.info("Persisting index")
-    index.storage_context.persist(persist_dir=FAISS_INDEX_PATH)
+    with tracing.span("build.persist"):
+        vector_index.persist()
     logging.info("Index built and saved successfully.")
 
+    if recall_check and embeddings:
+        from ann_index import compare_index_types, split_queries, print_comparison
+        logging.info("Comparing index types against flat search...")
+        print_comparison(compare_index_types(*split_queries(embeddings)))
+
 
-def query_index(question: str) -> None:
+def load_crawl_changes(path: str) -> list[str]:
     """
-    Query the FAISS index:
-    1. Initialize HFEmbedding for query-time embedding.
-    2. Load the persisted FAISS index.
-    3. Reconstruct the VectorStoreIndex from the loaded FaissVectorStore.
-    4. Use LlamaIndex's query engine to retrieve the top relevant context.
-    5. Assemble a prompt (context + question) and send it to the local LLaMA 3.2 via Ollama.
-    6. Print the generated answer.
+    Read the change manifest written by the crawler and return every
+    added, modified or removed file path in it.
     """
-    logging.info("Initializing Hugging Face embedding model for querying...")
-    hf_embedding = HFEmbedding()
+    with open(path, "r", encoding="utf-8") as f:
+        changes = json.load(f)
+    return sorted({fn for kind in ("added", "modified", "removed")
+                   for fn in changes.get(kind, [])})
+
+
+@tracing.traced("update_index")
+def update_index(docs_dir: str = DOCS_DIR,
+                 index_dir: str = FAISS_INDEX_PATH,
+                 changed_files: Optional[list] = None,
+                 workers: int = INGEST_WORKERS,
+                 embed_workers: Optional[int] = EMBED_WORKERS,
+                 cache_dir: str = EMBED_CACHE_DIR) -> dict[str, list[str]]:
+    """
+    Bring a persisted index up to date with docs_dir without a full rebuild:
+    files whose content hash differs from the manifest are removed and
+    re-added, deleted files are removed, new files are added.
+    changed_files (e.g. from load_crawl_changes) limits the diff to those
+    paths instead of hashing the whole directory.
+    Falls back to build_index when no index exists yet.
+    Returns the file keys that were added, modified and removed.
+    """
+    if not VectorIndex.exists(index_dir):
+        logging.info("No existing index in %s, running a full build", index_dir)
+        build_index(docs_dir, index_dir, workers=workers, embed_workers=embed_workers,
+                    cache_dir=cache_dir)
+        return {"added": sorted(scan_docs_dir(docs_dir)), "modified": [], "removed": []}
+
+    candidates = None
+    if changed_files is not None:
+        candidates = {file_key(path, docs_dir) for path in changed_files}
+    with tracing.span("build.scan"):
+        current  = scan_docs_dir(docs_dir, keys=candidates)
+    vector_index = VectorIndex.load(index_dir)
+    known        = {k: v for k, v in vector_index.files.items()
+                    if candidates is None or k in candidates}
+
+    changes = {
+        "added":    [k for k in current if k not in known],
+        "modified": [k for k in current if k in known and known[k]["hash"] != current[k]],
+        "removed":  [k for k in known if k not in current],
+    }
+    logging.info("Index update: %d added, %d modified, %d removed",
+                 len(changes["added"]), len(changes["modified"]), len(changes["removed"]))
+    if not any(changes.values()):
+        return changes
+
+    if (changes["removed"] or changes["modified"]) and not vector_index.supports_remove:
+        logging.info("%s index cannot remove vectors, running a full build",
+                     vector_index.index_type)
+        build_index(docs_dir, index_dir, index_type=vector_index.index_type,
+                    workers=workers, embed_workers=embed_workers, cache_dir=cache_dir)
+        return changes
+
+    for key in changes["removed"] + changes["modified"]:
+        vector_index.remove_file(key)
+
+    changed = changes["added"] + changes["modified"]
+    if changed:
+        # No eviction here: unchanged files are never looked up in the cache
+        hf_embedding = _cached_embedding(embed_workers, cache_dir)
+        try:
+            _index_files(vector_index, hf_embedding, changed,
+                         {k: current[k] for k in changed}, docs_dir, workers)
+        finally:
+            _close_embedding(hf_embedding)
+        hf_embedding.cache.flush()
+
+    logging.info("Persisting index")
+    with tracing.span("build.persist"):
+        vector_index.persist()
+    return changes
 
-    logging.info("Loading FAISS index from")
-    faiss_store = FaissVectorStore.from_persist_path(
-        "./faiss_index/default__vector_store.json")
-    storage_context = StorageContext.from_defaults(
-        vector_store=faiss_store, persist_dir=FAISS_INDEX_PATH)
-
-    logging.info("Reconstructing index from FAISS vector store...")
-    # index = VectorStoreIndex.from_vector_store(faiss_store, embed_model=hf_embedding)
-    index = load_index_from_storage(
-        storage_context=storage_context,
-        embed_model=hf_embedding)
-
-    logging.info("Querying index for relevant context...")
-    # query_engine = index.as_query_engine(embed_model=hf_embedding)
-    ollama_llm = create_ollama_llm()
-    query_engine = index.as_query_engine(
-        llm=ollama_llm, 
-        embed_model=hf_embedding,
-        text_qa_template=NO_HALLU_TEMPLATE,
-        similarity_top_k=6,
-        verbose=False)
-
-    response: Any = query_engine.query(question)
-    answer = getattr(response, "response", str(response))
-
-    print("\n=== QUESTION ===")
-    print(question) 
-
-    print("\n=== ANSWER ===")
-    print(answer) 
-
-    print("\n=== CITATION (chunk_id: score) ===")
-    get_citation_and_score(response)
+
+def build_shards(names: Optional[list] = None,
+                 index_type: str = INDEX_TYPE,
+                 recall_check: bool = False,
+                 workers: int = INGEST_WORKERS,
+                 embed_workers: Optional[int] = EMBED_WORKERS) -> None:
+    """
+    Build the named shards (every configured one by default), each on its
+    own. Every shard has its own embedding cache, since a build evicts the
+    vectors it did not use.
+    """
+    for name, docs_dir in select_shards(names).items():
+        logging.info("Building shard %s from %s", name, docs_dir)
+        build_index(docs_dir, shard_index_dir(name), index_type, recall_check, workers,
+                    embed_workers, cache_dir=shard_cache_dir(name))
+
+
+def update_shards(names: Optional[list] = None,
+                  changed_files: Optional[list] = None,
+                  workers: int = INGEST_WORKERS,
+                  embed_workers: Optional[int] = EMBED_WORKERS) -> dict[str, dict[str, list[str]]]:
+    """
+    Incrementally update the named shards (every configured one by
+    default). changed_files is split by shard docs directory, and shards
+    with none of them changed are not touched. Returns the changes per shard.
+    """
+    results = {}
+    for name, docs_dir in select_shards(names).items():
+        shard_files = None
+        if changed_files is not None:
+            root = os.path.abspath(docs_dir) + os.sep
+            shard_files = [p for p in changed_files if os.path.abspath(p).startswith(root)]
+            if not shard_files:
+                continue
+        logging.info("Updating shard %s from %s", name, docs_dir)
+        results[name] = update_index(docs_dir, shard_index_dir(name), shard_files, workers,
+                                     embed_workers, cache_dir=shard_cache_dir(name))
+    return results
+
+
+@tracing.traced("query_index")
+def query_index(question: str, stream: bool = False,
+                filters: Optional[dict] = None) -> None:
+    """
+    Answer a single question and print the answer with its citations.
+    filters ({"file_path": "*deployment*"}, ...) restricts retrieval to the
+    matching pages or sections.
+    With stream=True the citations are printed first and the answer token
+    by token as it is generated.
+    Loads the model and index for this one call; to answer several
+    questions, create one QueryService and reuse it.
+    """
+    from query_service import QueryService, print_answer, print_streaming_answer
+
+    service = QueryService()
+    if stream:
+        print_streaming_answer(question, service.stream_query(question, filters=filters))
+    else:
+        print_answer(question, service.query(question, filters=filters))
@@ -0,0 +1,222 @@
+# ingest.py
+"""
+Parallel document ingestion: load -> extract sections -> chunk.
+
+Files are split into shards and handed to a process pool. Each worker loads
+its shard with SimpleDirectoryReader, parses the Section: blocks and chunks
+them, then returns plain (text, metadata) pairs. iter_file_chunks yields
+every finished shard right away, so the caller can embed one shard while
+the workers are still parsing the next ones.
+
+Workers start with the multiprocessing start method in effect (main.py sets
+spawn), so they only import what this module needs and never load the
+embedding model or FAISS; each loads the model's tokenizer once, for the
+token-aware chunker.
+"""
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator, Optional
+
+from llama_index.core.schema import TextNode
+
+import tracing
+from config import DOCS_DIR, INGEST_WORKERS, INGEST_SHARD_SIZE
+
+# Chunk metadata that locates the chunk in its page
+SPAN_KEYS = ("char_start", "char_end")
+
+SECTION_PATTERN = re.compile(
+    r"Section: (?P<heading>.+?)\n(?P<body>.*?)(?=(?:Section: )|\Z)", flags=re.DOTALL)
+
+
+def section_spans(full_text: str) -> Iterator[tuple[str, int, int]]:
+    """
+    Yield (heading, body start, body end) for every 'Section: {heading}\n'
+    block of full_text, or one ("ROOT", 0, len) span if there are none.
+    """
+    matches = list(SECTION_PATTERN.finditer(full_text))
+
+    if matches:
+        for m in matches:
+            yield m.group("heading").strip(), m.start("body"), m.end("body")
+    else:
+        # Fallback: no explicit sections, treat everything as one chunk
+        yield "ROOT", 0, len(full_text)
+
+
+def extract_sections(full_text: str):
+    """
+    Parses 'Section: {heading}\n{body}\n\n' blocks.
+    If none are found, yields a single default section.
+    """
+    for heading, start, end in section_spans(full_text):
+        yield heading, full_text[start:end].strip()
+
+
+def make_node(text: str, metadata: dict, id_: Optional[str] = None) -> TextNode:
+    """
+    TextNode for a chunk. The character span keys stay in the metadata for
+    citations but out of the text that is embedded and put in prompts.
+    """
+    kwargs = {"id_": id_} if id_ is not None else {}
+    return TextNode(text=text, metadata=metadata,
+                    excluded_embed_metadata_keys=list(SPAN_KEYS),
+                    excluded_llm_metadata_keys=list(SPAN_KEYS), **kwargs)
+
+
+@lru_cache(maxsize=None)
+def _chunker():
+    """One TokenChunker (and tokenizer) per process."""
+    from chunker import TokenChunker
+    return TokenChunker()
+
+
+def embed_header(file_path: str, section: str) -> str:
+    """Metadata header LlamaIndex puts before a chunk's text when embedding it."""
+    # Widest chunk_id a section is expected to reach
+    return f"file_path: {file_path}\nsection: {section}\nchunk_id: 9999\n\n"
+
+
+def document_chunks(doc) -> list[tuple[str, dict]]:
+    """
+    Split one loaded document into (chunk text, metadata) pairs, the
+    metadata holding file_path, section, chunk_id and the chunk's
+    char_start / char_end in the document text. The page is tokenized once
+    and cut on token boundaries (see chunker.py).
+    """
+    md        = getattr(doc, "extra_info", {})
+    file_path = md.get("source", md.get("file_path", "unknown"))
+
+    text     = doc.text
+    chunker  = _chunker()
+    sections = list(section_spans(text))
+    spans    = chunker.split(text, [(start, end) for _, start, end in sections],
+                             [chunker.budget(embed_header(file_path, heading))
+                              for heading, _, _ in sections])
+
+    chunks = []
+    for (heading, _, _), chunk_spans in zip(sections, spans):
+        for i, (start, end) in enumerate(chunk_spans):
+            chunks.append((text[start:end], {"file_path": file_path,
+                                             "section": heading,
+                                             "chunk_id": i,
+                                             "char_start": start,
+                                             "char_end": end}))
+    return chunks
+
+
+def process_shard(docs_dir: str, keys: list[str]):
+    """
+    Worker entry point: load, section and chunk the files in keys.
+    Returns ({file key: [(text, metadata), ...]}, {stage: seconds}).
+    """
+    from utils.utils import load_documents_with_metadata
+
+    seconds = {}
+    t0 = time.perf_counter()
+    raw_docs = load_documents_with_metadata(
+        docs_dir, input_files=[os.path.join(docs_dir, k) for k in keys])
+    seconds["load"] = time.perf_counter() - t0
+
+    # Every requested file gets an entry, even if it yields no chunks
+    chunks_by_file = {key: [] for key in keys}
+    seconds["section+chunk"] = 0.0
+    for doc in raw_docs:
+        t0 = time.perf_counter()
+        md  = getattr(doc, "extra_info", {})
+        key = os.path.relpath(md.get("file_path", md.get("source", "unknown")), docs_dir)
+        chunks_by_file.setdefault(key, []).extend(document_chunks(doc))
+        seconds["section+chunk"] += time.perf_counter() - t0
+    return chunks_by_file, seconds
+
+
+class IngestStats:
+    """
+    Wall-clock seconds and item counts per pipeline stage. Worker stages
+    are summed across processes, so they can exceed the elapsed time.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add(self, stage: str, seconds: float, count: int = 0) -> None:
+        self.seconds[stage] += seconds
+        self.counts[stage] += count
+        tracing.record(f"ingest.{stage}", seconds, items=count)
+
+    @contextmanager
+    def stage(self, name: str, count: int = 0):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0, count)
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        stages = {
+            name: {"seconds": round(s, 3), "items": self.counts[name],
+                   "items_per_s": round(self.counts[name] / s, 1) if s > 0 else None}
+            for name, s in self.seconds.items()
+        }
+        return {"elapsed_s": round(elapsed, 3), "stages": stages}
+
+    def log(self) -> None:
+        summary = self.summary()
+        logging.info("Ingestion finished in %.2fs", summary["elapsed_s"])
+        for name, row in summary["stages"].items():
+            logging.info("  %-14s %8.2fs %8d items %10s items/s", name,
+                         row["seconds"], row["items"], row["items_per_s"])
+
+
+def _shards(keys: list[str], shard_size: int) -> list[list[str]]:
+    return [keys[i:i + shard_size] for i in range(0, len(keys), shard_size)]
+
+
+def iter_file_chunks(docs_dir: str = DOCS_DIR,
+                     keys: list[str] = (),
+                     workers: int = INGEST_WORKERS,
+                     shard_size: int = INGEST_SHARD_SIZE,
+                     stats: IngestStats = None) -> Iterator[dict]:
+    """
+    Yield {file key: [(text, metadata), ...]} for each shard of keys, in
+    completion order. Small inputs (a single shard) or workers <= 1 are
+    processed inline, skipping the pool start-up cost.
+    """
+    stats = stats or IngestStats()
+    keys = list(keys)
+    shards = _shards(keys, max(1, shard_size))
+    workers = min(workers or os.cpu_count() or 1, len(shards))
+
+    def account(chunks_by_file, seconds):
+        stats.add("load", seconds["load"], len(chunks_by_file))
+        stats.add("section+chunk", seconds["section+chunk"],
+                  sum(len(c) for c in chunks_by_file.values()))
+
+    if workers <= 1:
+        for shard in shards:
+            chunks_by_file, seconds = process_shard(docs_dir, shard)
+            account(chunks_by_file, seconds)
+            yield chunks_by_file
+        return
+
+    logging.info("Ingesting %d files in %d shards on %d processes",
+                 len(keys), len(shards), workers)
+    done_files = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(process_shard, docs_dir, shard) for shard in shards]
+        for future in as_completed(futures):
+            chunks_by_file, seconds = future.result()
+            account(chunks_by_file, seconds)
+            done_files += len(chunks_by_file)
+            logging.info("Parsed %d/%d files (%.1f files/s)", done_files, len(keys),
+                         done_files / (time.perf_counter() - stats.started))
+            yield chunks_by_file
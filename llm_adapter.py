@@ -1,16 +1,18 @@
 # llm_adapter.py
 from llama_index.llms.ollama import Ollama
-from config import OLLAMA_API_URL, OLLAMA_MODEL_NAME
+from config import OLLAMA_API_URL, OLLAMA_BASE_URL, OLLAMA_MODEL_NAME
 
 
-def create_ollama_llm():
+def create_ollama_llm(base_url: str = OLLAMA_BASE_URL):
     """
     Create and return an instance of the official Ollama LLM adapter.
     You can adjust request_timeout (in seconds) if needed.
     Also, adjust the temperature and top_p to achieve optimal response.
+    base_url points the adapter at another Ollama (or a local stub).
     """
     return Ollama(
         model=OLLAMA_MODEL_NAME,
+        base_url=base_url,
         api_url=OLLAMA_API_URL,
         request_timeout=120.0,
         # Increase T if the model repeating the same phrase over and over
@@ -1,6 +1,13 @@
 import argparse
+import logging
 import multiprocessing
-from indexer import build_index, query_index
+import tracing
+from config import (INDEX_TYPE, INDEX_TYPES, IVF_NPROBE, HNSW_EF_SEARCH, INGEST_WORKERS,
+                    EMBED_WORKERS, ANSWER_CACHE_PATH, RERANK_ENABLED, BATCH_QA_CONCURRENCY, SHARDS)
+# Everything that pulls in torch, transformers, faiss or LlamaIndex is
+# imported inside run(), once the arguments say it is needed, so --help,
+# argument errors and cron runs with nothing to do return immediately
+# (guarded by tests/test_startup.py and benchmarks/bench_startup.py)
 
 DEFAULT_QUESTIONS = [
     "How do I set up custom domains and tls certificates with api gateway?",
@@ -15,16 +22,133 @@ def main():
     parser = argparse.ArgumentParser(
         description="Build/rebuild FAISS index and/or query it from the command line"
     )
-    parser.add_argument(
+    build_mode = parser.add_mutually_exclusive_group()
+    build_mode.add_argument(
         "-b", "--build-index",
         action="store_true",
         help="Build (or rebuild) the FAISS index before querying"
     )
+    build_mode.add_argument(
+        "-u", "--update",
+        action="store_true",
+        help="Incrementally update the index with files added, changed or removed since the last build"
+    )
+    parser.add_argument(
+        "--changes",
+        metavar="PATH",
+        help="With --update, only look at the files listed in this crawler change manifest (e.g. crawl_changes.json)"
+    )
     parser.add_argument(
         "-B", "--build-only",
         action="store_true",
         help="After building the index, exit immediately without running any queries"
     )
+    parser.add_argument(
+        "--shard",
+        action="append",
+        metavar="NAME",
+        help="Build, update or query only this shard from config.SHARDS. Can be specified multiple times "
+             "(default: every configured shard, or the single index when SHARDS is empty)"
+    )
+    parser.add_argument(
+        "--index-type",
+        choices=INDEX_TYPES,
+        default=INDEX_TYPE,
+        help="FAISS index type to build (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--recall-check",
+        action="store_true",
+        help="After building, print recall@k of every index type against flat search"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=INGEST_WORKERS,
+        help="Processes used to load and chunk documents when building or updating (default: one per CPU)"
+    )
+    parser.add_argument(
+        "--embed-workers",
+        type=int,
+        default=EMBED_WORKERS,
+        help="Processes that run the embedding model when building or updating, each with "
+             "EMBED_WORKER_THREADS torch threads; 0 embeds in this process (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--nprobe",
+        type=int,
+        default=IVF_NPROBE,
+        help="IVF cells scanned per query (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--ef-search",
+        type=int,
+        default=HNSW_EF_SEARCH,
+        help="HNSW candidate list size per query (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--check-embedding-parity",
+        action="store_true",
+        help="Compare the configured EMBED_PRECISION against fp32 embeddings and exit"
+    )
+    parser.add_argument(
+        "-s", "--stream",
+        action="store_true",
+        help="Print citations as soon as retrieval finishes and the answer as it is generated"
+    )
+    parser.add_argument(
+        "--no-hybrid",
+        action="store_true",
+        help="Dense retrieval only, without fusing BM25 keyword hits"
+    )
+    parser.add_argument(
+        "--rerank",
+        action="store_true",
+        default=RERANK_ENABLED,
+        help="Re-rank a wider candidate set with a cross-encoder and prompt with the best few chunks"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always generate, never reuse answers cached for similar questions"
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="Record per-stage spans and counters and write them to PATH on exit (Prometheus text for *.prom, JSON otherwise)"
+    )
+    parser.add_argument(
+        "--profile",
+        type=int,
+        metavar="N",
+        default=0,
+        help="Record spans and log the N slowest ones on exit"
+    )
+    parser.add_argument(
+        "--filter",
+        action="append",
+        metavar="FIELD=PATTERN",
+        help="Only search chunks whose file_path or section matches PATTERN (glob, case-insensitive), "
+             "e.g. --filter 'file_path=*deployment*'. Repeat a field to allow several patterns; "
+             "different fields must all match"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="PATH",
+        help="Answer every question in PATH ('-' for stdin; JSONL with question/title fields or plain lines) and write JSONL results"
+    )
+    parser.add_argument(
+        "--output",
+        metavar="PATH",
+        default="-",
+        help="With --batch, file to write the JSONL results to (default: stdout)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=BATCH_QA_CONCURRENCY,
+        help="With --batch, Ollama generations run in parallel (default: %(default)s)"
+    )
     parser.add_argument(
         "-q", "--query",
         action="append",
@@ -36,26 +160,108 @@ def main():
 
     # Safe multiprocessing setup on Mac/Linux
     multiprocessing.set_start_method("spawn", force=True)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.metrics or args.profile:
+        tracing.enable(profile_top=args.profile)
+    try:
+        run(args)
+    finally:
+        if args.metrics:
+            tracing.write_metrics(args.metrics)
+        tracing.dump_slowest()
+
+
+def parse_filters(specs):
+    """['file_path=*gateway*', 'section=Routes'] -> {field: [patterns]}"""
+    filters = {}
+    for spec in specs or []:
+        field, sep, pattern = spec.partition("=")
+        if not sep or not field.strip():
+            raise SystemExit(f"Invalid --filter {spec!r}, expected FIELD=PATTERN")
+        filters.setdefault(field.strip(), []).append(pattern.strip())
+    return filters or None
+
+
+def run(args):
+    """Build, update and/or query as requested by the parsed CLI args."""
+    if args.check_embedding_parity:
+        from embeddings import HFEmbedding
+        worst = HFEmbedding().parity_check(args.query or DEFAULT_QUESTIONS)
+        print(f"[*] Minimum cosine similarity to fp32: {worst:.4f}")
+        return
+
+    sharded = bool(args.shard or SHARDS)
 
     # Build or rebuild the index if requested
+    if args.build_index or args.update:
+        from indexer import (build_index, update_index, load_crawl_changes,
+                             build_shards, update_shards)
     if args.build_index:
         print("[*] Building FAISS index…")
-        build_index()
+        if sharded:
+            build_shards(args.shard, index_type=args.index_type,
+                         recall_check=args.recall_check, workers=args.workers,
+                         embed_workers=args.embed_workers)
+        else:
+            build_index(index_type=args.index_type, recall_check=args.recall_check,
+                        workers=args.workers, embed_workers=args.embed_workers)
         print("[✓] Index built successfully.\n")
+    elif args.update:
+        print("[*] Updating FAISS index…")
+        changed_files = load_crawl_changes(args.changes) if args.changes else None
+        if sharded:
+            changes_by_shard = update_shards(args.shard, changed_files, workers=args.workers,
+                                             embed_workers=args.embed_workers)
+        else:
+            changes_by_shard = {None: update_index(changed_files=changed_files,
+                                                   workers=args.workers,
+                                                   embed_workers=args.embed_workers)}
+        for shard, changes in changes_by_shard.items():
+            print(f"[✓] {f'Shard {shard}' if shard else 'Index'} updated: "
+                  f"{len(changes['added'])} added, "
+                  f"{len(changes['modified'])} modified, "
+                  f"{len(changes['removed'])} removed.\n")
 
     # If user explicitly asked for build-only, exit now
     if args.build_only:
         print("[*] Build-only flag set; skipping all queries.")
         return
 
-    # Choose which questions to run
-    questions = args.query if args.query else DEFAULT_QUESTIONS
+    # Load the model and index once, then run queries
+    from answer_cache import AnswerCache
+    from query_service import QueryService, print_answer, print_streaming_answer
 
-    # Run queries
-    for q in questions:
-        print(f"Query: {q!r}")
-        query_index(q)
-        print("=" * 70)
+    answer_cache = None if args.no_cache else AnswerCache(path=ANSWER_CACHE_PATH)
+    reranker = None
+    if args.rerank:
+        from reranker import CrossEncoderReranker
+        reranker = CrossEncoderReranker()
+    vector_index = None
+    if sharded:
+        from shards import ShardRouter
+        vector_index = ShardRouter.load(args.shard, nprobe=args.nprobe,
+                                        ef_search=args.ef_search)
+    service = QueryService(nprobe=args.nprobe, ef_search=args.ef_search,
+                           answer_cache=answer_cache, hybrid=not args.no_hybrid,
+                           reranker=reranker, vector_index=vector_index)
+    filters = parse_filters(args.filter)
+    if args.batch:
+        from batch_qa import run_batch
+        run_batch(service, args.batch, args.output, concurrency=args.concurrency,
+                  filters=filters)
+    else:
+        # Choose which questions to run
+        questions = args.query if args.query else DEFAULT_QUESTIONS
+        for q in questions:
+            print(f"Query: {q!r}")
+            if args.stream:
+                print_streaming_answer(q, service.stream_query(q, filters=filters))
+            else:
+                print_answer(q, service.query(q, filters=filters))
+            print("=" * 70)
+    if answer_cache is not None:
+        answer_cache.save()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,190 @@
+# partitions.py
+"""
+Metadata partition map for filtered search.
+
+VectorIndex.add_file gives the chunks of one file consecutive vector IDs,
+and a file's sections are chunked in order, so each file_path and section
+value covers a few contiguous ID ranges. The map
+
+    {field: {value: [[start, end), ...]}}
+
+is built from the docstore on a full build and updated with the removed
+and added chunks on an incremental one (like the BM25 index), and saved as
+partitions.json.
+
+A filter {field: pattern or [patterns]} selects the values of each field
+that match any of its fnmatch-style patterns (case-insensitive); the fields
+are ANDed. resolve() turns it into sorted, disjoint [start, end) ID ranges
+without looking at individual vectors.
+"""
+import fnmatch
+import json
+import logging
+import os
+
+import numpy as np
+
+PARTITIONS_FILE = "partitions.json"
+FILTER_FIELDS = ("file_path", "section")
+
+
+def merge_ranges(ranges) -> np.ndarray:
+    """Sort [start, end) ranges and merge the overlapping or adjacent ones."""
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    if len(ranges) == 0:
+        return ranges
+    ranges = ranges[np.argsort(ranges[:, 0], kind="stable")]
+    merged = [list(ranges[0])]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return np.asarray(merged, dtype=np.int64)
+
+
+def intersect_ranges(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Intersection of two sorted, disjoint range lists."""
+    out = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start, end = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+        if start < end:
+            out.append([start, end])
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return np.asarray(out, dtype=np.int64).reshape(-1, 2)
+
+
+def in_ranges(ids: np.ndarray, ranges: np.ndarray) -> np.ndarray:
+    """Boolean mask of the ids that fall inside sorted, disjoint ranges."""
+    if len(ranges) == 0:
+        return np.zeros(len(ids), dtype=bool)
+    slot = np.searchsorted(ranges[:, 0], ids, side="right") - 1
+    return (slot >= 0) & (ids < ranges[np.maximum(slot, 0), 1])
+
+
+def subtract_ranges(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """The parts of sorted, disjoint ranges a not covered by sorted, disjoint ranges b."""
+    out = []
+    j = 0
+    for start, end in a:
+        while j < len(b) and b[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] < end:
+            if b[k][0] > start:
+                out.append([start, b[k][0]])
+            start = max(start, b[k][1])
+            k += 1
+        if start < end:
+            out.append([start, end])
+    return np.asarray(out, dtype=np.int64).reshape(-1, 2)
+
+
+def ids_to_ranges(ids) -> np.ndarray:
+    """Sorted, disjoint [start, end) ranges covering exactly ids."""
+    ids = np.unique(np.asarray(ids, dtype=np.int64))
+    if len(ids) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+    starts = ids[np.concatenate([[0], breaks])]
+    ends = ids[np.concatenate([breaks - 1, [len(ids) - 1]])] + 1
+    return np.stack([starts, ends], axis=1)
+
+
+def range_ids(ranges: np.ndarray) -> np.ndarray:
+    """Every ID covered by ranges."""
+    if len(ranges) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate([np.arange(start, end, dtype=np.int64) for start, end in ranges])
+
+
+class PartitionIndex:
+    def __init__(self, partitions: dict):
+        self.partitions = partitions
+
+    @classmethod
+    def build(cls, docs, fields=FILTER_FIELDS) -> "PartitionIndex":
+        """Run-length encode the field values of (node ID, text, metadata) in ID order."""
+        partitions = {field: {} for field in fields}
+        cls._add_runs(partitions, docs)
+        logging.info("Built partition map: %s", ", ".join(
+            f"{len(values)} {field} values" for field, values in partitions.items()))
+        return cls(partitions)
+
+    def update(self, removed_ids, docs) -> "PartitionIndex":
+        """
+        New map without removed_ids and with the (node ID, text, metadata)
+        triples of docs added; docs must be in ID order, after every ID
+        already mapped. Costs O(map size + changed chunks).
+        """
+        removed = ids_to_ranges(list(removed_ids))
+        lo, hi = (int(removed[0][0]), int(removed[-1][1])) if len(removed) else (0, 0)
+        partitions = {}
+        for field, values in self.partitions.items():
+            partitions[field] = {}
+            for value, ranges in values.items():
+                if any(start < hi and end > lo for start, end in ranges):
+                    ranges = subtract_ranges(
+                        np.asarray(ranges, dtype=np.int64).reshape(-1, 2), removed).tolist()
+                if ranges:
+                    # Copied, _add_runs appends to it
+                    partitions[field][value] = list(ranges)
+        self._add_runs(partitions, docs)
+        return PartitionIndex(partitions)
+
+    @staticmethod
+    def _add_runs(partitions: dict, docs) -> None:
+        """Append the runs of consecutive IDs sharing a value to partitions[field][value]."""
+        fields = list(partitions)
+        runs = {}
+        for vid, _, metadata in docs:
+            for field in fields:
+                value = str(metadata.get(field))
+                run = runs.get(field)
+                if run is not None and run[0] == value and run[2] == vid:
+                    run[2] = vid + 1
+                    continue
+                if run is not None:
+                    partitions[field].setdefault(run[0], []).append(run[1:])
+                runs[field] = [value, vid, vid + 1]
+        for field, run in runs.items():
+            partitions[field].setdefault(run[0], []).append(run[1:])
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, PARTITIONS_FILE))
+
+    @classmethod
+    def load(cls, index_dir: str) -> "PartitionIndex":
+        with open(os.path.join(index_dir, PARTITIONS_FILE), "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, index_dir: str) -> None:
+        tmp_path = os.path.join(index_dir, PARTITIONS_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.partitions, f)
+        os.replace(tmp_path, os.path.join(index_dir, PARTITIONS_FILE))
+
+    def values(self, field: str) -> list[str]:
+        return sorted(self.partitions.get(field, {}))
+
+    def resolve(self, filters: dict) -> np.ndarray:
+        """Sorted, disjoint [start, end) ID ranges matching every field of filters."""
+        result = None
+        for field, patterns in filters.items():
+            if field not in self.partitions:
+                raise ValueError(f"Cannot filter on {field!r}, expected one of "
+                                 f"{tuple(self.partitions)}")
+            if isinstance(patterns, str):
+                patterns = [patterns]
+            patterns = [p.lower() for p in patterns]
+            ranges = [r for value, value_ranges in self.partitions[field].items()
+                      if any(fnmatch.fnmatchcase(value.lower(), p) for p in patterns)
+                      for r in value_ranges]
+            ranges = merge_ranges(ranges)
+            result = ranges if result is None else intersect_ranges(result, ranges)
+        return result if result is not None else np.zeros((0, 2), dtype=np.int64)
@@ -0,0 +1,296 @@
+# query_service.py
+"""
+Long-lived query engine: loads the embedding model, the FAISS index with its
+docstore and the Ollama client once, then answers any number of questions.
+The CLI and any server wrapper should hold a single QueryService.
+"""
+import logging
+import time
+from typing import Iterator, Optional
+
+from llama_index.core.base.response.schema import Response, StreamingResponse
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+import tracing
+from answer_cache import AnswerCache
+from context_packer import ContextPacker
+from config import FAISS_INDEX_PATH, IVF_NPROBE, HNSW_EF_SEARCH, HYBRID_SEARCH, HYBRID_CANDIDATES
+from prompt import NO_HALLU_TEMPLATE
+from utils.utils import get_citation_and_score
+from vector_index import VectorIndex
+
+
+def log_prompt_eval(prompt: str, raw) -> None:
+    """Log prompt size and, when Ollama reports them, its token count and eval time."""
+    raw = raw or {}
+    get = raw.get if hasattr(raw, "get") else lambda key: getattr(raw, key, None)
+    count, duration_ns = get("prompt_eval_count"), get("prompt_eval_duration")
+    logging.info("Prompt: %d chars, %s tokens, prompt eval %s ms", len(prompt), count,
+                 round(duration_ns / 1e6, 1) if duration_ns else None)
+
+
+class QueryService:
+    def __init__(self, index_dir: str = FAISS_INDEX_PATH,
+                 similarity_top_k: int = 6,
+                 embed_model=None, vector_index: Optional[VectorIndex] = None,
+                 llm=None, nprobe: int = IVF_NPROBE,
+                 ef_search: int = HNSW_EF_SEARCH,
+                 answer_cache: Optional[AnswerCache] = None,
+                 hybrid: bool = HYBRID_SEARCH,
+                 hybrid_candidates: int = HYBRID_CANDIDATES,
+                 context_packer: Optional[ContextPacker] = None,
+                 reranker=None):
+        # Components can be passed in to share them or to swap in stubs
+        self.similarity_top_k = similarity_top_k
+        # Fuse BM25 with dense hits when the index has a sparse part
+        self.hybrid = hybrid
+        self.hybrid_candidates = hybrid_candidates
+        # Optional CrossEncoderReranker: retrieves reranker.candidates
+        # chunks and keeps its top_n instead of similarity_top_k
+        self.reranker = reranker
+
+        # torch / transformers and the Ollama client are only imported when
+        # no component is passed in
+        if embed_model is None:
+            from embeddings import HFEmbedding
+            logging.info("Initializing Hugging Face embedding model for querying...")
+            embed_model = HFEmbedding()
+        self.embed_model = embed_model
+
+        if vector_index is None:
+            logging.info("Loading FAISS index from %s", index_dir)
+            with tracing.span("query.index_load"):
+                vector_index = VectorIndex.load(
+                    index_dir, mmap=True, nprobe=nprobe, ef_search=ef_search)
+        self.vector_index = vector_index
+
+        if llm is None:
+            from llm_adapter import create_ollama_llm
+            llm = create_ollama_llm()
+        self.llm = llm
+        self.context_packer = context_packer if context_packer is not None else ContextPacker()
+
+        # Optional; without one every question is generated
+        self.answer_cache = answer_cache
+        if answer_cache is not None:
+            answer_cache.bind(vector_index.version)
+
+    def embed_queries(self, questions: list) -> list:
+        """Embed several questions in one batched forward pass."""
+        return self.embed_model.get_text_embedding_batch(questions)
+
+    def retrieve_many(self, questions: list,
+                      return_embeddings: bool = False,
+                      filters: Optional[dict] = None):
+        """
+        Retrieve for several questions with one embedding forward pass
+        and one FAISS search over the whole batch. With return_embeddings,
+        returns (results, query embeddings). filters ({field: pattern(s)}
+        on file_path / section) restricts the search to matching chunks.
+        """
+        if not questions:
+            return ([], []) if return_embeddings else []
+        timings = {}
+        t0 = time.perf_counter()
+        embeddings = self.embed_queries(questions)
+        timings["embed"] = time.perf_counter() - t0
+        results = self._search(embeddings, questions, timings, filters)
+        return (results, embeddings) if return_embeddings else results
+
+    def retrieve(self, question: str,
+                 embedding: Optional[list] = None,
+                 filters: Optional[dict] = None) -> list[NodeWithScore]:
+        """
+        Return the top-k chunks for question, among the chunks matching
+        filters if given. Pass a precomputed query embedding to skip the
+        embedding step.
+        """
+        timings = {}
+        if embedding is None:
+            t0 = time.perf_counter()
+            embedding = self.embed_model.get_query_embedding(question)
+            timings["embed"] = time.perf_counter() - t0
+        return self._search([embedding], [question], timings, filters)[0]
+
+    def _search(self, embeddings, questions: list, timings: dict,
+                filters: Optional[dict] = None) -> list[list[NodeWithScore]]:
+        """
+        Dense or hybrid search for a batch, then re-ranking if enabled,
+        logging time per stage.
+        """
+        top_k = self.reranker.candidates if self.reranker else self.similarity_top_k
+        if self.hybrid:
+            results = self.vector_index.hybrid_search(
+                embeddings, questions, top_k, self.hybrid_candidates, timings, filters)
+        else:
+            t0 = time.perf_counter()
+            results = self.vector_index.search(embeddings, top_k, filters)
+            timings["dense"] = time.perf_counter() - t0
+        if self.reranker:
+            t0 = time.perf_counter()
+            results = [self.reranker.rerank(q, nodes) for q, nodes in zip(questions, results)]
+            timings["rerank"] = time.perf_counter() - t0
+        logging.info("Retrieved %d queries: %s", len(questions), ", ".join(
+            f"{stage} {seconds * 1000:.2f} ms" for stage, seconds in timings.items()))
+        tracing.count("query.questions", len(questions))
+        for stage, seconds in timings.items():
+            tracing.record(f"retrieve.{stage}", seconds, queries=len(questions))
+        return results
+
+    def build_prompt(self, question: str, nodes: list[NodeWithScore]) -> str:
+        """
+        Fill NO_HALLU_TEMPLATE with the retrieved chunks, deduplicated,
+        merged and trimmed to the token budget by the context packer.
+        """
+        with tracing.span("query.prompt"):
+            context_str = "\n\n".join(
+                n.node.get_content(metadata_mode=MetadataMode.LLM)
+                for n in self.context_packer.pack(nodes))
+            return NO_HALLU_TEMPLATE.format(
+                context_str=context_str, query_str=question)
+
+    def cached_answer(self, embedding, nodes: list[NodeWithScore]) -> Optional[str]:
+        """Answer cached for a similar question with the same retrieved chunks."""
+        if self.answer_cache is None:
+            return None
+        answer = self.answer_cache.get(embedding, [n.node.id_ for n in nodes])
+        tracing.count("query.cache_hits" if answer is not None else "query.cache_misses")
+        return answer
+
+    def cache_answer(self, embedding, nodes: list[NodeWithScore], answer: str) -> None:
+        if self.answer_cache is not None:
+            self.answer_cache.put(embedding, [n.node.id_ for n in nodes], answer)
+
+    def generate(self, prompt: str) -> str:
+        with tracing.span("query.generate", prompt_chars=len(prompt)):
+            response = self.llm.complete(prompt)
+        log_prompt_eval(prompt, response.raw)
+        return response.text
+
+    async def agenerate(self, prompt: str) -> str:
+        with tracing.span("query.generate", prompt_chars=len(prompt)):
+            response = await self.llm.acomplete(prompt)
+        log_prompt_eval(prompt, response.raw)
+        return response.text
+
+    def stream_generate(self, prompt: str) -> Iterator[str]:
+        """Yield the answer text piece by piece as Ollama produces it."""
+        raw = None
+        for chunk in self.llm.stream_complete(prompt):
+            raw = chunk.raw
+            if chunk.delta:
+                yield chunk.delta
+        # Ollama reports prompt statistics on the final chunk
+        log_prompt_eval(prompt, raw)
+
+    @tracing.traced("query.total")
+    def query(self, question: str,
+              embedding: Optional[list] = None,
+              filters: Optional[dict] = None) -> Response:
+        """
+        Retrieve (among chunks matching filters, if given), prompt and
+        generate; returns answer plus source nodes. metadata["cached"]
+        tells whether the answer came from the cache.
+        """
+        if embedding is None:
+            with tracing.span("retrieve.embed"):
+                embedding = self.embed_model.get_query_embedding(question)
+        nodes = self.retrieve(question, embedding, filters)
+        answer = self.cached_answer(embedding, nodes)
+        cached = answer is not None
+        if not cached:
+            answer = self.generate(self.build_prompt(question, nodes))
+            self.cache_answer(embedding, nodes, answer)
+        return Response(response=answer, source_nodes=nodes,
+                        metadata={"cached": cached})
+
+    def stream_query(self, question: str,
+                     embedding: Optional[list] = None,
+                     filters: Optional[dict] = None) -> StreamingResponse:
+        """
+        Retrieve, then stream the answer. The source nodes are set as soon
+        as retrieval finishes, generation starts when response_gen is first
+        iterated. metadata["timings"] is filled in while streaming:
+        retrieve_ms, ttft_ms and total_ms (all from the start of the query),
+        tokens and tokens_per_s. metadata["cached"] tells whether the
+        answer came from the cache.
+        """
+        start = time.perf_counter()
+        if embedding is None:
+            with tracing.span("retrieve.embed"):
+                embedding = self.embed_model.get_query_embedding(question)
+        nodes = self.retrieve(question, embedding, filters)
+        timings = {"retrieve_ms": round((time.perf_counter() - start) * 1000, 2)}
+        cached = self.cached_answer(embedding, nodes)
+        if cached is not None:
+            # A cache hit streams the stored answer as one piece
+            tokens = self._timed_stream(iter([cached]), start, timings)
+        else:
+            tokens = self._timed_stream(
+                self.stream_generate(self.build_prompt(question, nodes)), start, timings,
+                on_done=lambda answer: self.cache_answer(embedding, nodes, answer))
+        return StreamingResponse(response_gen=tokens, source_nodes=nodes,
+                                 metadata={"timings": timings, "cached": cached is not None})
+
+    def _timed_stream(self, stream: Iterator[str], start: float,
+                      timings: dict, on_done=None) -> Iterator[str]:
+        first = None
+        count = 0
+        pieces = []
+        for token in stream:
+            if first is None:
+                first = time.perf_counter()
+                timings["ttft_ms"] = round((first - start) * 1000, 2)
+            count += 1
+            pieces.append(token)
+            yield token
+        end = time.perf_counter()
+        if on_done is not None:
+            on_done("".join(pieces))
+        timings["total_ms"] = round((end - start) * 1000, 2)
+        timings["tokens"] = count
+        if first is not None:
+            tracing.record("query.ttft", first - start)
+        tracing.record("query.total", end - start, tokens=count)
+        # Decode rate: tokens after the first over the time they took
+        timings["tokens_per_s"] = (
+            round((count - 1) / (end - first), 2) if count > 1 and end > first else None)
+        logging.info("Streamed %d tokens, first after %s ms, %s tokens/s",
+                     count, timings.get("ttft_ms"), timings["tokens_per_s"])
+
+
+def print_answer(question: str, response: Response) -> None:
+    """Print a question, its answer and the citation map."""
+    print("\n=== QUESTION ===")
+    print(question)
+
+    cached = (getattr(response, "metadata", None) or {}).get("cached")
+    print("\n=== ANSWER (cached) ===" if cached else "\n=== ANSWER ===")
+    print(getattr(response, "response", str(response)))
+
+    print("\n=== CITATION (chunk_id: score) ===")
+    get_citation_and_score(response)
+
+
+def print_streaming_answer(question: str, response: StreamingResponse) -> None:
+    """
+    Print a question and its citation map, then the answer token by token
+    as it streams in, followed by time to first token and tokens/sec.
+    """
+    print("\n=== QUESTION ===")
+    print(question)
+
+    # Retrieval is done, so citations can go out before the first token
+    print("\n=== CITATION (chunk_id: score) ===")
+    get_citation_and_score(response)
+
+    metadata = response.metadata or {}
+    print("\n=== ANSWER (cached) ===" if metadata.get("cached") else "\n=== ANSWER ===")
+    for token in response.response_gen:
+        print(token, end="", flush=True)
+    print()
+
+    timings = metadata.get("timings", {})
+    if "ttft_ms" in timings:
+        print(f"\n[first token after {timings['ttft_ms']:.0f} ms, "
+              f"{timings['tokens']} tokens, {timings['tokens_per_s'] or 0:.1f} tokens/s]")
@@ -0,0 +1,120 @@
+# reranker.py
+"""
+Optional cross-encoder re-ranking between retrieval and prompt building.
+
+Retrieval fetches RERANK_CANDIDATES chunks instead of the usual top-k; a
+small local cross-encoder scores every (question, chunk) pair and only the
+best RERANK_TOP_N chunks go into the prompt. A smaller prompt is the cheapest
+way to speed up CPU-bound generation, and the cross-encoder ranks better
+than embedding similarity alone.
+
+Latency is bounded: candidates are scored in retrieval order, one batch at a
+time, and no new batch starts once the next one would end past
+RERANK_BUDGET_MS (the first batch always runs). Candidates left unscored keep
+their retrieval order behind the scored ones. Scores are cached per
+(question, chunk text), so repeated questions skip the model; the key does
+not use node IDs, which change when the index is rebuilt.
+"""
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from llama_index.core.schema import NodeWithScore
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+import tracing
+from config import (RERANK_MODEL_NAME, RERANK_CANDIDATES, RERANK_TOP_N,
+                    RERANK_BATCH_SIZE, RERANK_BUDGET_MS, RERANK_CACHE_SIZE)
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str = RERANK_MODEL_NAME,
+                 candidates: int = RERANK_CANDIDATES,
+                 top_n: int = RERANK_TOP_N,
+                 batch_size: int = RERANK_BATCH_SIZE,
+                 budget_ms: float = RERANK_BUDGET_MS,
+                 cache_size: int = RERANK_CACHE_SIZE):
+        # Chunks retrieved per question before re-ranking
+        self.candidates = candidates
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.budget = budget_ms / 1000.0
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self.model_name = model_name
+        self._load_model(model_name)
+
+    def _load_model(self, model_name: str) -> None:
+        with tracing.span("rerank.model_load", model=model_name):
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+            self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
+            self.model.eval()
+
+    def score_batch(self, question: str, texts: list[str]) -> list[float]:
+        """Relevance of each text to question, in [0, 1]."""
+        inputs = self.tokenizer([question] * len(texts), texts, padding=True,
+                                truncation=True, return_tensors="pt")
+        with torch.no_grad():
+            logits = self.model(**inputs).logits
+        # Single-logit rerankers (ms-marco, bge-reranker) output relevance logits
+        return torch.sigmoid(logits[:, 0]).float().tolist()
+
+    @staticmethod
+    def _key(question: str, text: str) -> str:
+        return hashlib.sha1(f"{question}\0{text}".encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str):
+        score = self._cache.get(key)
+        if score is not None:
+            self._cache.move_to_end(key)
+        return score
+
+    def _cache_put(self, key: str, score: float) -> None:
+        self._cache[key] = score
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def rerank(self, question: str, nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        """
+        Top top_n of nodes by cross-encoder score; node scores become the
+        cross-encoder scores (unscored nodes keep their retrieval score).
+        """
+        t0 = time.perf_counter()
+        keys = [self._key(question, n.node.get_content()) for n in nodes]
+        scores = [self._cache_get(k) for k in keys]
+        hits = sum(s is not None for s in scores)
+        todo = [i for i, s in enumerate(scores) if s is None]
+
+        batch_seconds = 0.0
+        scored_batches = 0
+        for start in range(0, len(todo), self.batch_size):
+            elapsed = time.perf_counter() - t0
+            if scored_batches and elapsed + batch_seconds > self.budget:
+                break
+            batch = todo[start:start + self.batch_size]
+            b0 = time.perf_counter()
+            batch_scores = self.score_batch(
+                question, [nodes[i].node.get_content() for i in batch])
+            batch_seconds = time.perf_counter() - b0
+            scored_batches += 1
+            for i, score in zip(batch, batch_scores):
+                scores[i] = score
+                self._cache_put(keys[i], score)
+
+        scored = [i for i, s in enumerate(scores) if s is not None]
+        unscored = [i for i, s in enumerate(scores) if s is None]
+        # Stable sort keeps retrieval order among equal scores
+        order = [scored[j] for j in np.argsort([-scores[i] for i in scored], kind="stable")]
+        ranked = [NodeWithScore(node=nodes[i].node, score=scores[i]) for i in order]
+        ranked += [nodes[i] for i in unscored]
+
+        tracing.count("rerank.cache_hits", hits)
+        tracing.count("rerank.unscored", len(unscored))
+        if unscored:
+            logging.info("Re-ranking budget of %.0f ms reached, %d of %d candidates unscored",
+                         self.budget * 1000, len(unscored), len(nodes))
+        return ranked[:self.top_n]
@@ -1,20 +1,27 @@
+import argparse
+import hashlib
+import json
+import logging
 import os
 import re
+import threading
 import time
-import unicodedata
-import html  
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 import requests
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 
-from config import VALID_LINK_SUBSTRING, VALID_LINK_EXTENSION, EXCLUDE_EXTENSIONS
+import tracing
+from config import (DOCS_DIR, VALID_LINK_SUBSTRING, VALID_LINK_EXTENSION, EXCLUDE_EXTENSIONS,
+                    CRAWL_WORKERS, CRAWL_HOST_DELAY, CRAWL_TIMEOUT, CRAWL_STATE_PATH,
+                    CRAWL_PAGES_PATH, CRAWL_CHANGES_PATH, SCRAPE_HTML_PARSER)
+# clean_text is re-exported for callers that imported it from here
+from text_cleaner import clean_text, clean_texts
 
-# Directory to store scraped documents (ensure this exists or will be created)
-DOCS_DIR = "./confluence_docs"
-visited = set()
-session = requests.Session()
-session.headers.update({"User-Agent": "Mozilla/5.0"})
+USER_AGENT = "Mozilla/5.0"
+CHANGE_KINDS = ("added", "modified", "removed")
 
 
 def load_base_urls(file_path):
@@ -35,132 +42,414 @@ def is_valid_link(link):
     )
 
 
-def clean_text(text: str) -> str:
+def html_parser(name: str = SCRAPE_HTML_PARSER) -> str:
+    """BeautifulSoup backend to use: name if it is installed, else html.parser."""
+    if name == "lxml":
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            logging.warning("lxml is not installed, falling back to html.parser")
+            return "html.parser"
+    return name
+
+def slugify(text):
+    text = text.lower()
+    text = re.sub(r'[^a-z0-9]+', '_', text)
+    return text.strip('_')
+
+def parse_page(url: str, page_html: str,
+               parser: str = "html.parser") -> tuple[str, str, list[str]]:
     """
-    Optimized text cleaning for improved embedding quality:
-    - Unescape HTML entities
-    - Remove code fences, inline code, HTML tags, wiki markup
-    - Strip markdown links, URLs, emails, citations
-    - Normalize punctuation and unicode
-    - Lowercase and normalize whitespace
+    Turn a fetched page into (title, full_text, valid outgoing links).
+    full_text is written in the 'Title:' / 'Section:' format the indexer
+    parses. parser is the BeautifulSoup backend, see html_parser().
     """
-    # Unescape HTML entities
-    text = html.unescape(text)
+    soup = BeautifulSoup(page_html, parser)
 
-    # Remove URLs and email addresses
-    text = re.sub(r"https?://\S+|www\.\S+", "", text)
-    text = re.sub(r"\S+@\S+\.\S+", "", text)
+    title = soup.title.string.strip() if soup.title and soup.title.string else "no_title"
 
-    # Remove inline citations like [1], (1)
-    text = re.sub(r"\[\d+\]|\(\d+\)", "", text)
+    # ─── Pre‑segment into sections ───
+    sections = []
+    current = {"heading": "ROOT", "texts": []}
 
-    # Remove boilerplate lines
-    text = re.sub(r"(?i)(page created by|last edited by)[^\n]*", "", text)
+    for elem in soup.find_all(['h1','h2','h3','p','li','pre','code']):
+        tag = elem.name
+        raw = elem.get_text()
+        if not raw or not raw.strip():
+            continue
 
-    # Normalize punctuation: fancy quotes to ASCII, dashes
-    replacements = {
-        "“": "\"", "”": "\"", "‘": "'", "’": "'",
-        "—": "-", "–": "-"
-    }
-    for orig, repl in replacements.items():
-        text = text.replace(orig, repl)
+        if tag in ('h1','h2','h3'):
+            # start a new section
+            if current["texts"]:
+                sections.append(current)
+            current = {"heading": raw.strip(), "texts": []}
+        else:
+            current["texts"].append(raw)
 
-    # Normalize unicode characters
-    text = unicodedata.normalize("NFKC", text)
+    # flush last
+    if current["texts"]:
+        sections.append(current)
 
-    # Remove control characters
-    text = "".join(ch for ch in text if unicodedata.category(ch)[0] != "C")
+    # ─── Clean every element of the page in one pass ───
+    cleaned = iter(clean_texts([raw for sec in sections for raw in sec["texts"]]))
+    for sec in sections:
+        sec["texts"] = [text for text in (next(cleaned) for _ in sec["texts"]) if text]
+    # Sections whose text cleaned away entirely are dropped
+    sections = [sec for sec in sections if sec["texts"]]
 
-    # Lowercase for consistency
-    text = text.lower()
+    # ─── Build full_text with real newlines ───
+    parts = []
+    parts.append(f"Title: {title}\n\n")
 
-    # Normalize whitespace
-    text = re.sub(r"\s+", " ", text).strip()
+    for sec in sections:
+        hdr  = sec["heading"]
+        body = "\n".join(sec["texts"])
+        parts.append(f"Section: {hdr}\n")
+        parts.append(body + "\n\n")
 
-    # final ASCII filter: drop any non‑ASCII
-    ascii_text = text.encode('ascii', 'ignore').decode('ascii')
-    return ascii_text.strip()
+    full_text = "".join(parts)
 
-def slugify(text):
-    text = text.lower()
-    text = re.sub(r'[^a-z0-9]+', '_', text)
-    return text.strip('_')
+    links = []
+    for a in soup.find_all('a', href=True):
+        nxt = urljoin(url, a['href'])
+        if is_valid_link(nxt):
+            links.append(nxt)
+    return title, full_text, links
 
-def scrape(url):
-    if url in visited:
-        return
-    print(f"[+] Scraping: {url}")
-    try:
-        response = session.get(url, timeout=10)
-        response.encoding = "utf-8"       # force correct decoding
-        if response.status_code != 200:
-            print(f"[-] Skipped {url} with status {response.status_code}")
+
+def page_path(url: str, title: str, docs_dir: str = DOCS_DIR) -> str:
+    safe_title = slugify(title) or slugify(url)
+    return os.path.join(docs_dir, f"{safe_title}.txt")
+
+
+def save_page(url: str, title: str, full_text: str, docs_dir: str = DOCS_DIR) -> str:
+    fn = page_path(url, title, docs_dir)
+    os.makedirs(docs_dir, exist_ok=True)
+    with open(fn, "w", encoding="utf-8") as f:
+        f.write(full_text)
+    return fn
+
+
+def _write_json(path: str, data) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class HostRateLimiter:
+    """
+    Spaces requests to the same host at least min_interval seconds apart,
+    across all worker threads. Different hosts don't wait on each other.
+    """
+
+    def __init__(self, min_interval: float = CRAWL_HOST_DELAY):
+        self.min_interval = min_interval
+        self._next_slot: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CrawlState:
+    """
+    Frontier queue and visited set of a crawl, checkpointed to a JSON file
+    so an interrupted crawl picks up where it stopped.
+    """
+
+    def __init__(self, path: str = CRAWL_STATE_PATH, resume: bool = True):
+        self.path = path
+        self.frontier: deque = deque()
+        self.visited: set = set()
+        self.in_flight: set = set()
+        # every URL ever queued, so nothing is queued twice
+        self.seen: set = set()
+        # pages added / modified / removed so far in this crawl
+        self.changes: dict = {kind: [] for kind in CHANGE_KINDS}
+        if resume and path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            self.visited = set(saved.get("visited", []))
+            self.changes.update(saved.get("changes", {}))
+            self.seen = set(self.visited)
+            self.add(saved.get("frontier", []))
+            print(f"[*] Resuming crawl: {len(self.visited)} visited, "
+                  f"{len(self.frontier)} queued")
+
+    def add(self, urls) -> None:
+        for url in urls:
+            if url not in self.seen:
+                self.seen.add(url)
+                self.frontier.append(url)
+
+    def pop(self) -> str:
+        url = self.frontier.popleft()
+        self.in_flight.add(url)
+        return url
+
+    def finish(self, url: str, links: list) -> None:
+        self.in_flight.discard(url)
+        self.visited.add(url)
+        self.add(links)
+
+    @property
+    def pending(self) -> bool:
+        return bool(self.frontier or self.in_flight)
+
+    def save(self) -> None:
+        if not self.path:
             return
+        # In-flight pages weren't saved yet, so they go back in the queue
+        _write_json(self.path, {"frontier": sorted(self.in_flight) + list(self.frontier),
+                                "visited": sorted(self.visited),
+                                "changes": self.changes})
+
+    def clear(self) -> None:
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Crawler:
+    """
+    Breadth-first crawler: a frontier queue drained by a bounded pool of
+    worker threads, with per-host politeness and checkpointed state.
+
+    Every fetched URL keeps a record (ETag, Last-Modified, content hash,
+    saved file, outgoing links) across crawls. Requests are conditional,
+    unchanged pages are not rewritten, and a completed crawl writes a
+    change manifest of added, modified and removed files for the indexer.
+    """
+
+    def __init__(self, docs_dir: str = DOCS_DIR,
+                 state_path: str = CRAWL_STATE_PATH,
+                 workers: int = CRAWL_WORKERS,
+                 host_delay: float = CRAWL_HOST_DELAY,
+                 timeout: float = CRAWL_TIMEOUT,
+                 resume: bool = True,
+                 checkpoint_every: int = 20,
+                 pages_path: str = CRAWL_PAGES_PATH,
+                 changes_path: str = CRAWL_CHANGES_PATH,
+                 parser: str = SCRAPE_HTML_PARSER):
+        self.docs_dir = docs_dir
+        self.parser = html_parser(parser)
+        self.workers = workers
+        self.timeout = timeout
+        self.checkpoint_every = checkpoint_every
+        self.pages_path = pages_path
+        self.changes_path = changes_path
+        self.state = CrawlState(state_path, resume=resume)
+        # url -> {"etag", "last_modified", "hash", "file", "links"}
+        self.pages: dict = {}
+        if pages_path and os.path.exists(pages_path):
+            with open(pages_path, "r", encoding="utf-8") as f:
+                self.pages = json.load(f)
+        self.rate_limiter = HostRateLimiter(host_delay)
+        # requests.Session isn't thread-safe, keep one per worker
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({"User-Agent": USER_AGENT})
+            self._local.session = session
+        return session
+
+    def fetch(self, url: str) -> tuple[list, str, dict]:
+        """
+        Fetch one page, conditionally if it was seen before, and save it if
+        its content changed. Returns (valid links, change, new record) where
+        change is "added", "modified", "removed", "unchanged" or "failed".
+        Runs on worker threads, so it only reads self.pages.
+        """
+        print(f"[+] Scraping: {url}")
+        record = self.pages.get(url)
+        known = record is not None and os.path.exists(record.get("file", ""))
+        headers = {}
+        if known:
+            if record.get("etag"):
+                headers["If-None-Match"] = record["etag"]
+            if record.get("last_modified"):
+                headers["If-Modified-Since"] = record["last_modified"]
+        try:
+            with tracing.span("scrape.rate_wait"):
+                self.rate_limiter.wait(url)
+            with tracing.span("scrape.fetch", url=url):
+                response = self._session().get(url, headers=headers, timeout=self.timeout)
+            tracing.count("scrape.bytes", len(response.content))
+            if response.status_code == 304 and known:
+                print(f"[=] Not modified: {url}")
+                return record["links"], "unchanged", record
+            if response.status_code in (404, 410):
+                print(f"[-] Gone {url} with status {response.status_code}")
+                return [], ("removed" if record else "failed"), record
+            if response.status_code != 200:
+                print(f"[-] Skipped {url} with status {response.status_code}")
+                return [], "failed", record
+
+            response.encoding = "utf-8"       # force correct decoding
+            with tracing.span("scrape.parse", url=url):
+                title, full_text, links = parse_page(url, response.text, self.parser)
+            content_hash = hashlib.sha256(full_text.encode("utf-8")).hexdigest()
+            fn = page_path(url, title, self.docs_dir)
+            new_record = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "hash": content_hash,
+                "file": fn,
+                "links": links,
+            }
+            if known and record.get("hash") == content_hash and record["file"] == fn:
+                print(f"[=] Unchanged: {url}")
+                return links, "unchanged", new_record
+
+            with tracing.span("scrape.save"):
+                save_page(url, title, full_text, self.docs_dir)
+            print(f"[✓] Saved: {fn}")
+            return links, ("modified" if record else "added"), new_record
+
+        except Exception as e:
+            print(f"[!] Failed to scrape {url}: {e}")
+            return [], "failed", record
+
+    def _record(self, url: str, change: str, record: dict) -> None:
+        """Apply one fetch result to the page records (main thread only)."""
+        old = self.pages.get(url)
+        if change == "removed":
+            self._drop_page(url)
+            return
+        if record is None:
+            return
+        if old and old.get("file") != record["file"]:
+            # Title changed: the page now lives in a different file
+            self._remove_file(old["file"], url)
+        self.pages[url] = record
+        if change in CHANGE_KINDS:
+            self.state.changes[change].append(record["file"])
+
+    def _drop_page(self, url: str) -> None:
+        old = self.pages.pop(url, None)
+        if old:
+            self._remove_file(old["file"], url)
+
+    def _remove_file(self, fn: str, url: str) -> None:
+        # Another URL may have been saved under the same title
+        if any(r["file"] == fn for u, r in self.pages.items() if u != url):
+            return
+        if os.path.exists(fn):
+            os.remove(fn)
+        self.state.changes["removed"].append(fn)
+
+    def _checkpoint(self) -> None:
+        self.state.save()
+        if self.pages_path:
+            _write_json(self.pages_path, self.pages)
+
+    def _finish_crawl(self) -> dict:
+        """
+        Drop pages that were not reached by this (complete) crawl and write
+        the change manifest.
+        """
+        for url in [u for u in self.pages if u not in self.state.visited]:
+            print(f"[-] No longer linked: {url}")
+            self._drop_page(url)
+        changes = {kind: sorted(set(self.state.changes[kind])) for kind in CHANGE_KINDS}
+        # A file removed and re-created in the same crawl was modified
+        for fn in set(changes["removed"]) & (set(changes["added"]) | set(changes["modified"])):
+            changes["removed"].remove(fn)
+        if self.changes_path:
+            _write_json(self.changes_path, changes)
+        print(f"[*] Changes: {len(changes['added'])} added, "
+              f"{len(changes['modified'])} modified, {len(changes['removed'])} removed")
+        return changes
+
+    def crawl(self, seeds, max_pages: int = None) -> int:
+        """
+        Crawl from seeds (plus any resumed frontier) until the frontier is
+        empty or max_pages pages were fetched. Returns the pages fetched.
+        Once the crawl completes the change manifest is written and the
+        state file removed.
+        """
+        self.state.add(seeds)
+        fetched = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                running = {}
+                while True:
+                    while (self.state.frontier and len(running) < self.workers
+                           and (max_pages is None or fetched + len(running) < max_pages)):
+                        url = self.state.pop()
+                        running[pool.submit(self.fetch, url)] = url
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        url = running.pop(future)
+                        links, change, record = future.result()
+                        tracing.count(f"scrape.pages.{change}")
+                        self._record(url, change, record)
+                        self.state.finish(url, links)
+                        fetched += 1
+                        if fetched % self.checkpoint_every == 0:
+                            self._checkpoint()
+        finally:
+            if self.state.pending:
+                self._checkpoint()
+        if self.state.pending:
+            return fetched
+        self._finish_crawl()
+        self._checkpoint()
+        self.state.clear()
+        return fetched
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Crawl Confluence pages into DOCS_DIR"
+    )
+    parser.add_argument("--base-urls", default="base_urls.txt",
+                        help="File with one start URL per line")
+    parser.add_argument("--docs-dir", default=DOCS_DIR)
+    parser.add_argument("--workers", type=int, default=CRAWL_WORKERS)
+    parser.add_argument("--delay", type=float, default=CRAWL_HOST_DELAY,
+                        help="Minimum seconds between requests to one host")
+    parser.add_argument("--state", default=CRAWL_STATE_PATH,
+                        help="Checkpoint file used to resume an interrupted crawl")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Ignore any saved crawl state and start over")
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--parser", choices=("html.parser", "lxml"),
+                        default=SCRAPE_HTML_PARSER,
+                        help="HTML parser backend; lxml is faster but must be installed")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Record fetch/parse/save spans and write them to PATH "
+                             "(Prometheus text for *.prom, JSON otherwise)")
+    parser.add_argument("--profile", type=int, metavar="N", default=0,
+                        help="Record spans and log the N slowest ones at the end")
+    args = parser.parse_args()
+    if args.metrics or args.profile:
+        logging.basicConfig(level=logging.INFO)
+        tracing.enable(profile_top=args.profile)
+
+    crawler = Crawler(docs_dir=args.docs_dir, state_path=args.state,
+                      workers=args.workers, host_delay=args.delay,
+                      resume=not args.fresh, parser=args.parser)
+    try:
+        crawler.crawl(load_base_urls(args.base_urls), max_pages=args.max_pages)
+    finally:
+        if args.metrics:
+            tracing.write_metrics(args.metrics)
+        tracing.dump_slowest()
+
+    print("[✓] Done. Scraped pages have been saved in", args.docs_dir)
+
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        title = soup.title.string.strip() if soup.title else "no_title"
-
-        # ─── Pre‑segment into sections ───
-        sections = []
-        current = {"heading": "ROOT", "texts": []}
-
-        for elem in soup.find_all(['h1','h2','h3','p','li','pre','code']):
-            tag = elem.name
-            raw = elem.get_text()
-            if not raw or not raw.strip():
-                continue
-
-            if tag in ('h1','h2','h3'):
-                # start a new section
-                if current["texts"]:
-                    sections.append(current)
-                current = {"heading": raw.strip(), "texts": []}
-            else:
-                # clean and aggregate
-                cleaned = clean_text(raw)
-                if cleaned:
-                    current["texts"].append(cleaned)
-
-        # flush last
-        if current["texts"]:
-            sections.append(current)
-
-        # ─── Build full_text with real newlines ───
-        parts = []
-        parts.append(f"Title: {title}\n\n")
-
-        for sec in sections:
-            hdr  = sec["heading"]
-            body = "\n".join(sec["texts"])
-            parts.append(f"Section: {hdr}\n")
-            parts.append(body + "\n\n")
-
-        full_text = "".join(parts)
-
-        # ─── Save to disk ───
-        safe_title = slugify(title) or slugify(url)
-        os.makedirs(DOCS_DIR, exist_ok=True)
-        fn = os.path.join(DOCS_DIR, f"{safe_title}.txt")
-        with open(fn, "w", encoding="utf-8") as f:
-            f.write(full_text)
-
-        print(f"[✓] Saved: {fn}")
-        visited.add(url)
-
-        # ─── Follow links ───
-        for a in soup.find_all('a', href=True):
-            nxt = urljoin(url, a['href'])
-            if is_valid_link(nxt) and nxt not in visited:
-                time.sleep(3)
-                scrape(nxt)
-
-    except Exception as e:
-        print(f"[!] Failed to scrape {url}: {e}")
-
-
-BASE_URLS = load_base_urls("base_urls.txt")
-for base in BASE_URLS:
-    scrape(base)
-
-print("[✓] Done. Scraped pages have been saved in", DOCS_DIR)
+if __name__ == "__main__":
+    main()
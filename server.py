@@ -0,0 +1,247 @@
+# server.py
+"""
+Local asyncio HTTP query service.
+
+Keeps one QueryService (embedding model, FAISS index, Ollama client) resident
+and serves concurrent questions:
+- queries arriving within SERVER_BATCH_WINDOW_MS are embedded in a single
+  forward pass and searched with a single FAISS call,
+- Ollama generations run with at most SERVER_GENERATION_CONCURRENCY in flight,
+- with an answer cache on the service, repeated questions skip generation.
+
+Endpoints:
+    POST /query    {"question": "...", "filters": {"file_path": "*gateway*"}}
+                   -> answer, cached flag, citations, timings; filtered
+                   queries are retrieved on their own, outside the batcher
+    GET  /health   liveness plus index size
+    GET  /latency  latency percentiles per stage over recent requests
+    GET  /metrics  pipeline spans and counters in Prometheus text format
+                   (empty unless started with --metrics)
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiohttp import web
+
+import tracing
+from answer_cache import AnswerCache
+from config import (SERVER_HOST, SERVER_PORT, SERVER_BATCH_WINDOW_MS,
+                    SERVER_MAX_BATCH, SERVER_GENERATION_CONCURRENCY, ANSWER_CACHE_PATH,
+                    RERANK_ENABLED, SHARDS)
+from query_service import QueryService
+from utils.utils import citation_list
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent retrievals into one batched embed + search call.
+    The first query of a batch waits up to window_ms for company; a full
+    batch is flushed immediately.
+    """
+
+    def __init__(self, service: QueryService,
+                 window_ms: float = SERVER_BATCH_WINDOW_MS,
+                 max_batch: int = SERVER_MAX_BATCH):
+        self.service = service
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer = None
+        # Strong references so in-flight batches aren't garbage collected
+        self._tasks: set = set()
+
+    async def retrieve(self, question: str) -> tuple[list, list]:
+        """Return (retrieved nodes, query embedding) for question."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((question, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list) -> None:
+        questions = [q for q, _ in batch]
+        try:
+            # Model forward pass and FAISS search release the GIL, keep
+            # them off the event loop
+            results, embeddings = await asyncio.to_thread(
+                self.service.retrieve_many, questions, True)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), nodes, embedding in zip(batch, results, embeddings):
+            if not future.done():
+                future.set_result((nodes, embedding))
+
+
+class LatencyTracker:
+    """Keeps the most recent latencies per stage and reports percentiles."""
+
+    def __init__(self, maxlen: int = 1000):
+        self.maxlen = maxlen
+        self._samples: dict[str, deque] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        self._samples.setdefault(stage, deque(maxlen=self.maxlen)).append(seconds)
+
+    def summary(self) -> dict:
+        report = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+
+            def pct(p):
+                return round(ordered[min(n - 1, int(p * n))] * 1000, 2)
+
+            report[stage] = {
+                "count": n,
+                "mean_ms": round(sum(ordered) / n * 1000, 2),
+                "p50_ms": pct(0.50),
+                "p95_ms": pct(0.95),
+                "p99_ms": pct(0.99),
+            }
+        return report
+
+
+def create_app(service: QueryService,
+               window_ms: float = SERVER_BATCH_WINDOW_MS,
+               max_batch: int = SERVER_MAX_BATCH,
+               generation_concurrency: int = SERVER_GENERATION_CONCURRENCY) -> web.Application:
+    batcher = QueryBatcher(service, window_ms, max_batch)
+    latency = LatencyTracker()
+
+    async def query(request: web.Request) -> web.Response:
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="Body must be JSON")
+        question = (payload.get("question") or "").strip() if isinstance(payload, dict) else ""
+        if not question:
+            raise web.HTTPBadRequest(text="Missing 'question'")
+        filters = payload.get("filters")
+        if filters is not None and not isinstance(filters, dict):
+            raise web.HTTPBadRequest(text="'filters' must be an object")
+
+        t0 = time.perf_counter()
+        if filters:
+            try:
+                results, embeddings = await asyncio.to_thread(
+                    service.retrieve_many, [question], True, filters)
+            except ValueError as e:
+                raise web.HTTPBadRequest(text=str(e))
+            nodes, embedding = results[0], embeddings[0]
+        else:
+            nodes, embedding = await batcher.retrieve(question)
+        t1 = time.perf_counter()
+        answer = service.cached_answer(embedding, nodes)
+        cached = answer is not None
+        t2 = t1
+        if not cached:
+            async with request.app["generation_slots"]:
+                t2 = time.perf_counter()
+                answer = await service.agenerate(service.build_prompt(question, nodes))
+            service.cache_answer(embedding, nodes, answer)
+        t3 = time.perf_counter()
+
+        latency.record("retrieve", t1 - t0)
+        if not cached:
+            latency.record("generation_wait", t2 - t1)
+            latency.record("generate", t3 - t2)
+        latency.record("total", t3 - t0)
+        return web.json_response({
+            "question": question,
+            "answer": answer,
+            "cached": cached,
+            "citations": citation_list(nodes),
+            "timings_ms": {
+                "retrieve": round((t1 - t0) * 1000, 2),
+                "generation_wait": round((t2 - t1) * 1000, 2),
+                "generate": round((t3 - t2) * 1000, 2),
+                "total": round((t3 - t0) * 1000, 2),
+            },
+        })
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "vectors": service.vector_index.ntotal,
+        })
+
+    async def latency_report(request: web.Request) -> web.Response:
+        return web.json_response(latency.summary())
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=tracing.prometheus_text(),
+                            content_type="text/plain", charset="utf-8")
+
+    async def on_startup(app: web.Application) -> None:
+        # Created here so it belongs to the loop the app runs on
+        app["generation_slots"] = asyncio.Semaphore(generation_concurrency)
+
+    async def on_cleanup(app: web.Application) -> None:
+        if service.answer_cache is not None:
+            service.answer_cache.save()
+
+    app = web.Application()
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post("/query", query)
+    app.router.add_get("/health", health)
+    app.router.add_get("/latency", latency_report)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve questions against the FAISS index over HTTP"
+    )
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always generate, never reuse cached answers")
+    parser.add_argument("--rerank", action="store_true", default=RERANK_ENABLED,
+                        help="Re-rank retrieved chunks with a cross-encoder")
+    parser.add_argument("--shard", action="append", metavar="NAME",
+                        help="Serve only this shard from config.SHARDS (repeatable; "
+                             "default: every configured shard)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Record pipeline spans and counters, served at /metrics")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.metrics:
+        tracing.enable()
+    answer_cache = None if args.no_cache else AnswerCache(path=ANSWER_CACHE_PATH)
+    reranker = None
+    if args.rerank:
+        from reranker import CrossEncoderReranker
+        reranker = CrossEncoderReranker()
+    vector_index = None
+    if args.shard or SHARDS:
+        from shards import ShardRouter
+        vector_index = ShardRouter.load(args.shard)
+    service = QueryService(answer_cache=answer_cache, reranker=reranker,
+                           vector_index=vector_index)
+    web.run_app(create_app(service), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
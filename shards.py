@@ -0,0 +1,185 @@
+# shards.py
+"""
+Named index shards, one per Confluence space or docs directory.
+
+SHARDS maps a shard name to its docs directory; each shard is a complete
+VectorIndex (FAISS file, docstore, manifest, BM25 and partition map) under
+SHARDS_DIR/<name>, built and updated on its own with its own embedding
+cache, so rebuilding one space leaves the others untouched.
+
+ShardRouter stands in for a VectorIndex at query time. It searches the
+selected shards in parallel threads (FAISS and SQLite release the GIL).
+Dense scores are inner products of the same embedding model, so dense
+hits are merged across shards by score. Per-shard RRF scores would not
+compare (every shard's best hit gets the same score, relevant or not), so
+hybrid search collects each shard's dense hits and BM25 candidates, merges
+each kind by score and runs one reciprocal-rank fusion over the two merged
+rankings, as a single index would. Node IDs are only unique within a shard,
+so returned nodes get "<shard>:<id>" IDs and a "shard" metadata key.
+"""
+import hashlib
+import heapq
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from llama_index.core.schema import NodeWithScore
+
+from config import (SHARDS, SHARDS_DIR, SHARD_SEARCH_THREADS, IVF_NPROBE, HNSW_EF_SEARCH,
+                    EMBED_CACHE_DIR)
+from sparse_index import reciprocal_rank_fusion
+from vector_index import VectorIndex
+
+
+def shard_index_dir(name: str, shards_dir: str = SHARDS_DIR) -> str:
+    return os.path.join(shards_dir, name)
+
+
+def shard_cache_dir(name: str, shards_dir: str = SHARDS_DIR) -> str:
+    """Embedding cache of one shard, kept next to its index."""
+    return os.path.join(shard_index_dir(name, shards_dir), EMBED_CACHE_DIR)
+
+
+def select_shards(names: Optional[list] = None, shards: dict = SHARDS) -> dict[str, str]:
+    """{name: docs dir} of the named shards, or of every shard without names."""
+    if not names:
+        return dict(shards)
+    unknown = [name for name in names if name not in shards]
+    if unknown:
+        raise ValueError(f"Unknown shard(s) {unknown}, configured: {sorted(shards)}")
+    return {name: shards[name] for name in names}
+
+
+def _tag(name: str, results: list[list[NodeWithScore]]) -> list[list[NodeWithScore]]:
+    for row in results:
+        for hit in row:
+            node = hit.node
+            # fetch() shares one node object between the queries that hit it
+            if node.metadata.get("shard") == name:
+                continue
+            node.id_ = f"{name}:{node.id_}"
+            node.metadata["shard"] = name
+            for keys in (node.excluded_embed_metadata_keys, node.excluded_llm_metadata_keys):
+                if "shard" not in keys:
+                    keys.append("shard")
+    return results
+
+
+class ShardRouter:
+    def __init__(self, indexes: dict[str, VectorIndex],
+                 threads: Optional[int] = SHARD_SEARCH_THREADS):
+        if not indexes:
+            raise ValueError("ShardRouter needs at least one shard")
+        self.indexes = indexes
+        self._pool = ThreadPoolExecutor(max_workers=threads or len(indexes),
+                                        thread_name_prefix="shard")
+
+    @classmethod
+    def load(cls, names: Optional[list] = None,
+             shards_dir: str = SHARDS_DIR,
+             nprobe: int = IVF_NPROBE,
+             ef_search: int = HNSW_EF_SEARCH,
+             threads: Optional[int] = SHARD_SEARCH_THREADS) -> "ShardRouter":
+        """Memory-map the named shards (every configured one by default) for querying."""
+        indexes = {}
+        for name in select_shards(names):
+            index_dir = shard_index_dir(name, shards_dir)
+            if not VectorIndex.exists(index_dir):
+                logging.warning("Shard %s has no index in %s, skipped", name, index_dir)
+                continue
+            indexes[name] = VectorIndex.load(index_dir, mmap=True,
+                                             nprobe=nprobe, ef_search=ef_search)
+        if not indexes:
+            raise ValueError(f"No shard index found in {shards_dir}, build the shards first")
+        logging.info("Loaded %d shards: %s", len(indexes), ", ".join(indexes))
+        return cls(indexes, threads)
+
+    @property
+    def version(self) -> str:
+        """Changes whenever any shard is rebuilt or updated."""
+        versions = ",".join(f"{name}={index.version}"
+                            for name, index in sorted(self.indexes.items()))
+        return hashlib.sha1(versions.encode("utf-8")).hexdigest()
+
+    @property
+    def ntotal(self) -> int:
+        return sum(index.ntotal for index in self.indexes.values())
+
+    def _fan_out(self, top_k: int, search) -> list[list[NodeWithScore]]:
+        """Run search(name, index) on every shard in parallel and merge the top_k per query."""
+        futures = {name: self._pool.submit(search, name, index)
+                   for name, index in self.indexes.items()}
+        per_shard = [_tag(name, future.result()) for name, future in futures.items()]
+        return [
+            heapq.nlargest(top_k, (hit for rows in row_group for hit in rows),
+                           key=lambda hit: hit.score)
+            for row_group in zip(*per_shard)
+        ]
+
+    def search(self, query_embeddings, top_k: int,
+               filters: Optional[dict] = None) -> list[list[NodeWithScore]]:
+        """Top_k scored nodes per query embedding over every shard."""
+        return self._fan_out(
+            top_k, lambda name, index: index.search(query_embeddings, top_k, filters))
+
+    def hybrid_search(self, query_embeddings, queries: list[str], top_k: int,
+                      candidates: int, timings: Optional[dict] = None,
+                      filters: Optional[dict] = None) -> list[list[NodeWithScore]]:
+        """
+        Merge the dense hits of all shards by inner product and their BM25
+        hits by BM25 score, fuse the two rankings with reciprocal-rank
+        fusion and return the top_k per query; node scores are RRF scores.
+        Dense and BM25 stages run per shard in parallel, timings gets the
+        slowest shard's time.
+        """
+        n = max(top_k, candidates)
+
+        def shard_candidates(name: str, index: VectorIndex) -> tuple[list, list, dict]:
+            ranges = index.resolve_filters(filters)
+            t0 = time.perf_counter()
+            dense = index.dense_search(query_embeddings, n, ranges)
+            t1 = time.perf_counter()
+            sparse = ([index.sparse.search(q, n, ranges) for q in queries]
+                      if index.sparse is not None else [[] for _ in queries])
+            return dense, sparse, {"dense": t1 - t0, "sparse": time.perf_counter() - t1}
+
+        futures = {name: self._pool.submit(shard_candidates, name, index)
+                   for name, index in self.indexes.items()}
+        per_shard = {name: future.result() for name, future in futures.items()}
+
+        t0 = time.perf_counter()
+        fused = []
+        for i in range(len(queries)):
+            dense = heapq.nlargest(n, ((score, name, vid) for name, (rows, _, _) in
+                                       per_shard.items() for vid, score in rows[i]))
+            sparse = heapq.nlargest(n, ((score, name, vid) for name, (_, rows, _) in
+                                        per_shard.items() for vid, score in rows[i]))
+            fused.append(reciprocal_rank_fusion(
+                [[(name, vid) for _, name, vid in dense],
+                 [(name, vid) for _, name, vid in sparse]], top_k))
+
+        # One docstore read per shard for the fused hits it owns
+        fetches = {
+            name: self._pool.submit(index.fetch, [
+                [(vid, score) for (shard, vid), score in row if shard == name]
+                for row in fused])
+            for name, index in self.indexes.items()
+        }
+        fetched = {name: _tag(name, future.result()) for name, future in fetches.items()}
+        results = []
+        for i, row in enumerate(fused):
+            hits = {hit.node.id_: hit for rows in fetched.values() for hit in rows[i]}
+            results.append([hits[f"{shard}:{vid}"] for (shard, vid), _ in row
+                            if f"{shard}:{vid}" in hits])
+
+        if timings is not None:
+            for _, _, stages in per_shard.values():
+                for stage, seconds in stages.items():
+                    timings[stage] = max(timings.get(stage, 0.0), seconds)
+            timings["fuse_fetch"] = timings.get("fuse_fetch", 0.0) + time.perf_counter() - t0
+        return results
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
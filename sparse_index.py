@@ -0,0 +1,214 @@
+# sparse_index.py
+"""
+BM25 inverted index over the docstore, plus reciprocal-rank fusion with
+dense FAISS results.
+
+Dense retrieval misses exact-term queries (policy names such as
+responsecachelookup, error codes); BM25 catches them. The index is built
+from the docstore on a full build and updated with the removed and added
+chunks on an incremental one (only those are read and tokenized), so it
+always covers the same node IDs. It is stored as:
+
+    sparse_terms.json   term -> [offset, document frequency], plus corpus stats
+    sparse_ids.npy      uint32 node IDs of every posting list, term by term
+    sparse_tfs.npy      uint16 term frequencies aligned with sparse_ids
+    sparse_lens.npy     uint32 token count per node ID
+
+The .npy files are memory-mapped at query time, so only the posting lists
+of the query terms are read.
+"""
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from config import BM25_K1, BM25_B, RRF_K
+from partitions import in_ranges
+
+TERMS_FILE = "sparse_terms.json"
+IDS_FILE = "sparse_ids.npy"
+TFS_FILE = "sparse_tfs.npy"
+LENS_FILE = "sparse_lens.npy"
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class SparseIndex:
+    def __init__(self, terms: dict, ids, tfs, doc_lens, n_docs: int,
+                 avg_len: float, k1: float = BM25_K1, b: float = BM25_B):
+        self.terms = terms
+        self.ids = ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.n_docs = n_docs
+        self.avg_len = avg_len
+        self.k1 = k1
+        self.b = b
+
+    @staticmethod
+    def _postings(docs) -> tuple[dict, dict]:
+        """term -> [(node ID, tf)] and node ID -> token count of (ID, text, metadata) triples."""
+        postings: dict[str, list] = defaultdict(list)
+        lens = {}
+        for vid, text, metadata in docs:
+            tokens = tokenize(f"{metadata.get('section') or ''} {text}")
+            lens[vid] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings[term].append((vid, tf))
+        return postings, lens
+
+    @classmethod
+    def build(cls, docs) -> "SparseIndex":
+        """
+        Index (node ID, text, metadata) triples, e.g. SQLiteDocStore.iter_nodes().
+        The section heading is indexed along with the chunk text.
+        """
+        t0 = time.perf_counter()
+        postings, lens = cls._postings(docs)
+
+        terms = {}
+        ids, tfs = [], []
+        for term in sorted(postings):
+            plist = sorted(postings[term])
+            terms[term] = [len(ids), len(plist)]
+            ids.extend(vid for vid, _ in plist)
+            tfs.extend(min(tf, 65535) for _, tf in plist)
+
+        doc_lens = np.zeros(max(lens, default=-1) + 1, dtype=np.uint32)
+        for vid, n in lens.items():
+            doc_lens[vid] = n
+        avg_len = sum(lens.values()) / len(lens) if lens else 0.0
+        logging.info("Built BM25 index: %d chunks, %d terms in %.2fs",
+                     len(lens), len(terms), time.perf_counter() - t0)
+        return cls(terms, np.asarray(ids, dtype=np.uint32),
+                   np.asarray(tfs, dtype=np.uint16), doc_lens, len(lens), avg_len)
+
+    def update(self, removed_ids, docs) -> "SparseIndex":
+        """
+        New index without the postings of removed_ids and with the
+        (node ID, text, metadata) triples of docs added. Only docs are
+        tokenized; the existing posting arrays are filtered and merged in
+        bulk. Added IDs must be larger than every indexed one, which holds
+        for the IDs VectorIndex.add_file hands out.
+        """
+        t0 = time.perf_counter()
+        removed = np.asarray(sorted(removed_ids), dtype=np.int64)
+        postings, lens = self._postings(docs)
+
+        old_terms = list(self.terms)
+        vocab = sorted(set(old_terms) | set(postings))
+        slot = {term: i for i, term in enumerate(vocab)}
+        # (term slot, node ID, tf) of every posting, old ones minus removed
+        offsets = np.asarray([self.terms[t][0] for t in old_terms], dtype=np.int64)
+        dfs = np.asarray([self.terms[t][1] for t in old_terms], dtype=np.int64)
+        order = np.argsort(offsets, kind="stable")
+        term_slots = np.repeat(np.asarray([slot[old_terms[i]] for i in order], dtype=np.int64),
+                               dfs[order])
+        ids = np.asarray(self.ids, dtype=np.int64)
+        tfs = np.asarray(self.tfs, dtype=np.uint16)
+        if len(removed):
+            keep = ~np.isin(ids, removed)
+            term_slots, ids, tfs = term_slots[keep], ids[keep], tfs[keep]
+        new = [(slot[term], vid, min(tf, 65535))
+               for term, plist in postings.items() for vid, tf in plist]
+        if new:
+            new_slots, new_ids, new_tfs = (np.asarray(col) for col in zip(*new))
+            term_slots = np.concatenate([term_slots, new_slots.astype(np.int64)])
+            ids = np.concatenate([ids, new_ids.astype(np.int64)])
+            tfs = np.concatenate([tfs, new_tfs.astype(np.uint16)])
+        by_term = np.lexsort((ids, term_slots))
+        term_slots, ids, tfs = term_slots[by_term], ids[by_term], tfs[by_term]
+
+        counts = np.bincount(term_slots, minlength=len(vocab))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        terms = {term: [int(starts[i]), int(counts[i])]
+                 for i, term in enumerate(vocab) if counts[i]}
+
+        doc_lens = np.zeros(max(len(self.doc_lens), max(lens, default=-1) + 1), dtype=np.uint32)
+        doc_lens[:len(self.doc_lens)] = self.doc_lens
+        n_removed = int(np.count_nonzero(removed < len(self.doc_lens)))
+        doc_lens[removed[removed < len(doc_lens)]] = 0
+        for vid, n in lens.items():
+            doc_lens[vid] = n
+        n_docs = self.n_docs - n_removed + len(lens)
+        avg_len = float(doc_lens.sum()) / n_docs if n_docs else 0.0
+        logging.info("Updated BM25 index: -%d +%d chunks, %d terms in %.2fs",
+                     n_removed, len(lens), len(terms), time.perf_counter() - t0)
+        return SparseIndex(terms, ids.astype(np.uint32), tfs, doc_lens, n_docs, avg_len,
+                           self.k1, self.b)
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return all(os.path.exists(os.path.join(index_dir, name))
+                   for name in (TERMS_FILE, IDS_FILE, TFS_FILE, LENS_FILE))
+
+    @classmethod
+    def load(cls, index_dir: str) -> "SparseIndex":
+        with open(os.path.join(index_dir, TERMS_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(index_dir, name), mmap_mode="r")
+                  for name in (IDS_FILE, TFS_FILE, LENS_FILE)]
+        return cls(meta["terms"], *arrays, n_docs=meta["n_docs"], avg_len=meta["avg_len"])
+
+    def save(self, index_dir: str) -> None:
+        for name, array in ((IDS_FILE, self.ids), (TFS_FILE, self.tfs),
+                            (LENS_FILE, self.doc_lens)):
+            tmp_path = os.path.join(index_dir, name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.asarray(array))
+            os.replace(tmp_path, os.path.join(index_dir, name))
+        tmp_path = os.path.join(index_dir, TERMS_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"n_docs": self.n_docs, "avg_len": self.avg_len,
+                       "terms": self.terms}, f)
+        os.replace(tmp_path, os.path.join(index_dir, TERMS_FILE))
+
+    def search(self, query: str, top_k: int, ranges=None) -> list[tuple[int, float]]:
+        """
+        Top-k (node ID, BM25 score) pairs for a query string, only among
+        the IDs in ranges (see partitions.py) if given.
+        """
+        hit_ids, hit_scores = [], []
+        for term in set(tokenize(query)):
+            entry = self.terms.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            ids = np.asarray(self.ids[offset:offset + df], dtype=np.int64)
+            tf = np.asarray(self.tfs[offset:offset + df], dtype=np.float32)
+            if ranges is not None:
+                keep = in_ranges(ids, ranges)
+                ids, tf = ids[keep], tf[keep]
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lens[ids] / max(self.avg_len, 1e-9))
+            hit_ids.append(ids)
+            hit_scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        if not hit_ids:
+            return []
+
+        ids, inverse = np.unique(np.concatenate(hit_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(hit_scores))
+        top = np.argsort(-scores, kind="stable")[:top_k]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+def reciprocal_rank_fusion(rankings: list[list[int]], top_k: int,
+                           k: int = RRF_K) -> list[tuple[int, float]]:
+    """
+    Fuse ranked ID lists: each ID scores sum(1 / (k + rank)) over the lists
+    it appears in (rank starting at 1). Returns the top_k (ID, score).
+    """
+    fused: dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, vid in enumerate(ranking, start=1):
+            fused[vid] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])[:top_k]
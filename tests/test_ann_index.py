@@ -0,0 +1,37 @@
+import numpy as np
+
+from ann_index import (INDEX_TYPES, compare_index_types, index_type_of,
+                       make_index, recall_at_k, set_search_params,
+                       split_queries, train_index)
+
+
+def random_unit_vectors(n, dim=32, seed=0):
+    vecs = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def test_exhaustive_ivf_matches_flat():
+    vectors, queries = split_queries(random_unit_vectors(2000), n_queries=50)
+    ids = np.arange(len(vectors), dtype=np.int64)
+
+    flat = make_index("flat", 32)
+    flat.add_with_ids(vectors, ids)
+    ivf = make_index("ivf_flat", 32, len(vectors))
+    train_index(ivf, vectors)
+    ivf.add_with_ids(vectors, ids)
+    # Probing every cell is an exact search
+    set_search_params(ivf, nprobe=ivf.nlist)
+
+    assert index_type_of(ivf) == "ivf_flat"
+    assert recall_at_k(ivf, flat, queries, k=10) == 1.0
+
+
+def test_small_corpus_falls_back_to_flat():
+    assert index_type_of(make_index("ivf_pq", 32, n_vectors=100)) == "flat"
+
+
+def test_compare_reports_every_type():
+    vectors, queries = split_queries(random_unit_vectors(500), n_queries=20)
+    rows = compare_index_types(vectors, queries, k=5)
+    assert [r["index_type"] for r in rows] == list(INDEX_TYPES)
+    assert rows[0]["recall@5"] == 1.0
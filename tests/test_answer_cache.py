@@ -0,0 +1,53 @@
+import numpy as np
+
+from answer_cache import AnswerCache
+
+
+def unit(*values):
+    vec = np.asarray(values, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def test_hit_needs_similar_question_and_same_chunks():
+    cache = AnswerCache(min_similarity=0.95)
+    cache.put(unit(1, 0, 0), [3, 1, 2], "answer")
+
+    assert cache.get(unit(1, 0.1, 0), [1, 2, 3]) == "answer"
+    # Same chunks, different question
+    assert cache.get(unit(0, 1, 0), [1, 2, 3]) is None
+    # Same question, different context
+    assert cache.get(unit(1, 0, 0), [1, 2, 4]) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("answer_cache.time.time", lambda: now[0])
+    cache = AnswerCache(max_entries=2, ttl=60)
+    cache.put(unit(1, 0), [1], "a")
+    cache.put(unit(0, 1), [2], "b")
+    # Touch "a" so "b" is the least recently used
+    assert cache.get(unit(1, 0), [1]) == "a"
+    cache.put(unit(1, 1), [3], "c")
+    assert cache.get(unit(0, 1), [2]) is None
+    assert len(cache) == 2
+
+    now[0] += 61
+    assert cache.get(unit(1, 0), [1]) is None
+    assert cache.get(unit(1, 1), [3]) is None
+
+
+def test_saved_cache_is_dropped_for_a_new_index(tmp_path):
+    path = str(tmp_path / "answers.json")
+    cache = AnswerCache(path=path)
+    cache.bind("build-1")
+    cache.put(unit(1, 0), [1], "a")
+    cache.save()
+
+    same = AnswerCache(path=path)
+    same.bind("build-1")
+    assert same.get(unit(1, 0), [1]) == "a"
+
+    rebuilt = AnswerCache(path=path)
+    rebuilt.bind("build-2")
+    assert len(rebuilt) == 0
@@ -0,0 +1,67 @@
+"""
+Batch mode against a tiny index, a mock embedding model and MockLLM:
+questions are retrieved in batches and every one gets a JSONL result.
+"""
+import asyncio
+import json
+
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import MockLLM
+from llama_index.core.schema import TextNode
+
+from batch_qa import answer_all, read_questions, run_batch
+from query_service import QueryService
+from vector_index import VectorIndex
+
+DIM = 8
+
+
+def make_service(tmp_path) -> QueryService:
+    vector_index = VectorIndex.create(str(tmp_path / "index"), dim=DIM)
+    nodes = [TextNode(text=f"chunk {i}",
+                      metadata={"file_path": "doc.txt", "section": "ROOT", "chunk_id": i})
+             for i in range(3)]
+    vector_index.add_file("doc.txt", "hash", nodes, [[0.5] * DIM] * len(nodes))
+    return QueryService(embed_model=MockEmbedding(embed_dim=DIM), vector_index=vector_index,
+                        llm=MockLLM(max_tokens=4), hybrid=False)
+
+
+def test_read_questions_accepts_jsonl_and_plain_lines():
+    lines = ['{"request_id": "user-001", "title": "Speed up indexing", "body": "..."}',
+             "", "How do I add a route?", '{"id": 7}']
+    assert read_questions(lines) == [
+        {"index": 0, "id": "user-001", "question": "Speed up indexing"},
+        {"index": 1, "id": 3, "question": "How do I add a route?"},
+    ]
+
+
+def test_every_question_is_answered_with_batched_retrieval(tmp_path):
+    service = make_service(tmp_path)
+    batch_sizes = []
+    retrieve_many = service.retrieve_many
+
+    def counting_retrieve_many(questions, return_embeddings=False, filters=None):
+        batch_sizes.append(len(questions))
+        return retrieve_many(questions, return_embeddings, filters)
+
+    service.retrieve_many = counting_retrieve_many
+    items = read_questions(f"question {i}" for i in range(10))
+    results = []
+    summary = asyncio.run(answer_all(service, items, results.append,
+                                     concurrency=3, batch_size=4))
+
+    assert batch_sizes == [4, 4, 2]
+    assert summary == {"questions": 10, "answered": 10, "cached": 0, "failed": 0}
+    assert sorted(r["index"] for r in results) == list(range(10))
+    assert all(r["answer"] and len(r["citations"]) == 3 for r in results)
+    assert set(results[0]["timings_ms"]) == {"retrieve", "queue_wait", "generate"}
+
+
+def test_run_batch_writes_jsonl(tmp_path):
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text('{"id": "a", "question": "What is a route?"}\n', encoding="utf-8")
+    output = tmp_path / "answers.jsonl"
+    run_batch(make_service(tmp_path), str(questions), str(output))
+
+    [line] = output.read_text(encoding="utf-8").splitlines()
+    assert json.loads(line)["id"] == "a"
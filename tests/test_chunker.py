@@ -0,0 +1,57 @@
+import re
+
+from chunker import TokenChunker
+
+WORD_RE = re.compile(r"\S+")
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word, with character offsets."""
+    model_max_length = 40
+
+    def __call__(self, text, add_special_tokens=True, return_offsets_mapping=False,
+                 truncation=True, verbose=True):
+        words = list(WORD_RE.finditer(text))
+        encoding = {"input_ids": [0] * len(words)}
+        if return_offsets_mapping:
+            encoding["offset_mapping"] = [(m.start(), m.end()) for m in words]
+        return encoding
+
+
+def sentences(n, words=6):
+    return " ".join(f"Sentence {i} " + "word " * (words - 3) + "end." for i in range(n))
+
+
+def test_chunks_fit_budget_end_on_sentences_and_overlap():
+    chunker = TokenChunker(WordTokenizer(), max_tokens=20, overlap_tokens=6, min_tokens=8)
+    text = "Title: Page\n\nSection: Setup\n" + sentences(10)
+    body_start = text.index("Sentence 0")
+    [spans] = chunker.split(text, [(body_start, len(text))], [20])
+    chunks = [text[s:e] for s, e in spans]
+
+    assert all(len(c.split()) <= 20 for c in chunks)
+    assert chunks[0].startswith("Sentence 0") and chunks[-1].endswith("Sentence 9 word word word end.")
+    # Every chunk but the last ends on a sentence boundary
+    assert all(c.endswith("end.") for c in chunks[:-1])
+    # Consecutive chunks share the last sentence of the previous one
+    for (_, prev_end), (start, _) in zip(spans, spans[1:]):
+        assert start < prev_end
+        assert text[start:].startswith("Sentence")
+
+
+def test_budget_leaves_room_for_the_metadata_header():
+    chunker = TokenChunker(WordTokenizer(), max_tokens=100, overlap_tokens=0, min_tokens=4)
+    # 40 model tokens - 2 special - (4 header words + 1)
+    assert chunker.budget("file_path: a.txt section: Setup") == 33
+    assert chunker.budget() == 38
+
+
+def test_each_span_is_cut_independently():
+    chunker = TokenChunker(WordTokenizer(), max_tokens=10, overlap_tokens=0, min_tokens=4)
+    text = "alpha beta gamma. delta\n" + "one two three four five six seven eight nine ten eleven"
+    split_at = text.index("one")
+    first, second = chunker.split(text, [(0, split_at), (split_at, len(text))], [10, 10])
+    assert [text[s:e] for s, e in first] == ["alpha beta gamma. delta"]
+    # No sentence break: cut on a plain token boundary
+    assert [text[s:e] for s, e in second] == [
+        "one two three four five six seven eight nine ten", "eleven"]
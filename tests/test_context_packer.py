@@ -0,0 +1,68 @@
+from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+
+from context_packer import ContextPacker, MIN_BLOCK_TOKENS
+
+
+class WordEncoding:
+    """One token per space-separated word, enough to check the budget."""
+
+    def encode(self, text, disallowed_special=()):
+        return text.split(" ")
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def hit(text, chunk_id, score, section="Setup", file_path="a.txt"):
+    return NodeWithScore(
+        node=TextNode(id_=f"{file_path}-{section}-{chunk_id}", text=text,
+                      metadata={"file_path": file_path, "section": section,
+                                "chunk_id": chunk_id}),
+        score=score)
+
+
+def test_merges_consecutive_chunks_and_drops_contained_ones():
+    first = "Create a certificate bundle and upload it to the vault before deploying."
+    second = "upload it to the vault before deploying. Then attach the custom domain."
+    nodes = [
+        hit(second, 1, 0.9),
+        hit(first, 0, 0.8),
+        hit("attach the custom domain", 4, 0.7, file_path="b.txt"),
+        hit("Unrelated section text", 5, 0.5, section="Other"),
+    ]
+    blocks = ContextPacker(budget_tokens=None).pack(nodes)
+
+    assert [b.node.get_content() for b in blocks] == [
+        "Create a certificate bundle and upload it to the vault before deploying."
+        " Then attach the custom domain.",
+        "Unrelated section text",
+    ]
+    assert blocks[0].node.metadata["chunk_id"] == "0-1"
+    assert blocks[0].score == 0.9
+
+
+def test_trims_to_token_budget():
+    # Every other chunk_id, so nothing is merged
+    nodes = [hit(" ".join([f"w{i}"] * 200), i * 2, 1.0 - i / 10) for i in range(4)]
+    packer = ContextPacker(budget_tokens=300, encoding=WordEncoding())
+    blocks = packer.pack(nodes)
+
+    rendered = [b.node.get_content(metadata_mode=MetadataMode.LLM) for b in blocks]
+    assert len(blocks) == 2
+    assert sum(packer.count_tokens(r) for r in rendered) <= 300
+    assert blocks[0].node.get_content() == nodes[0].node.get_content()
+
+
+def test_drops_block_when_only_its_header_fits():
+    section = " ".join(["Very long section heading"] * 10)
+    nodes = [hit(" ".join([f"w{i}"] * 200), i * 2, 1.0 - i / 10, section=section)
+             for i in range(2)]
+    packer = ContextPacker(budget_tokens=None, encoding=WordEncoding())
+    first = packer.count_tokens(nodes[0].node.get_content(metadata_mode=MetadataMode.LLM))
+    header = first - packer.count_tokens(nodes[0].node.get_content())
+    assert header >= MIN_BLOCK_TOKENS
+
+    # What is left after the first block is exactly the second one's header
+    packer.budget_tokens = first + header
+    blocks = packer.pack(nodes)
+    assert [b.node.get_content() for b in blocks] == [nodes[0].node.get_content()]
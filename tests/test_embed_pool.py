@@ -0,0 +1,26 @@
+import os
+
+import numpy as np
+
+from embed_pool import EmbeddingPool
+
+
+class LengthEmbedding:
+    """Stands in for HFEmbedding in the workers: [text length, worker pid]."""
+
+    def __init__(self, offset=0):
+        self.offset = offset
+
+    def _encode(self, texts):
+        return np.asarray([[len(t) + self.offset, os.getpid()] for t in texts], dtype=np.float32)
+
+
+def test_batches_come_back_in_order():
+    batches = [["x" * (b * 10 + i) for i in range(3)] for b in range(12)]
+    with EmbeddingPool(workers=2, threads_per_worker=1, factory=LengthEmbedding,
+                       offset=1) as pool:
+        assert pool.warm() >= 1
+        results = pool.map_batches(batches)
+    assert [r[:, 0].tolist() for r in results] == [
+        [len(t) + 1 for t in batch] for batch in batches]
+    assert {int(pid) for r in results for pid in r[:, 1]} != {os.getpid()}
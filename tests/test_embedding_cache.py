@@ -0,0 +1,65 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache, MIN_CAPACITY
+
+
+def open_cache(path, model_name="model"):
+    return EmbeddingCache(str(path), model_name=model_name, dim=4)
+
+
+def vectors(n, start=0):
+    return np.arange(start * 4, (start + n) * 4, dtype="float32").reshape(n, 4)
+
+
+def test_round_trip_after_reopen(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put_many(["a", "b"], vectors(2))
+    # Known texts are not stored twice
+    cache.put_many(["a"], vectors(1, start=5))
+    assert len(cache) == 2
+    cache.flush()
+
+    found = open_cache(tmp_path).get_many(["b", "missing", "a"])
+    np.testing.assert_array_equal(found[0], vectors(2)[1])
+    assert found[1] is None
+    np.testing.assert_array_equal(found[2], vectors(2)[0])
+
+
+def test_grows_past_initial_capacity(tmp_path):
+    n = MIN_CAPACITY + 10
+    texts = [f"chunk {i}" for i in range(n)]
+    cache = open_cache(tmp_path)
+    cache.put_many(texts, vectors(n))
+    cache.flush()
+
+    reopened = open_cache(tmp_path)
+    assert len(reopened) == n
+    found = reopened.get_many([texts[0], texts[-1]])
+    np.testing.assert_array_equal(found[0], vectors(n)[0])
+    np.testing.assert_array_equal(found[1], vectors(n)[-1])
+
+
+def test_evict_unused_keeps_entries_touched_since_open(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put_many(["a", "b", "c"], vectors(3))
+    cache.flush()
+
+    cache = open_cache(tmp_path)
+    cache.get_many(["c"])
+    cache.put_many(["d"], vectors(1, start=3))
+    assert cache.evict_unused() == 2
+    assert len(cache) == 2
+
+    # Survivors moved to new rows, their vectors must move with them
+    found = open_cache(tmp_path).get_many(["a", "b", "c", "d"])
+    assert found[0] is None and found[1] is None
+    np.testing.assert_array_equal(found[2], vectors(3)[2])
+    np.testing.assert_array_equal(found[3], vectors(1, start=3)[0])
+
+
+def test_model_name_is_a_separate_namespace(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put_many(["a"], vectors(1))
+    cache.flush()
+    assert open_cache(tmp_path, model_name="other model").get_many(["a"]) == [None]
+    assert open_cache(tmp_path).get_many(["a"])[0] is not None
@@ -0,0 +1,69 @@
+"""
+An incremental update must leave the index as a full build of the new
+docs directory would: right manifest, docstore rows and vectors.
+"""
+import hashlib
+
+import numpy as np
+
+import indexer
+from config import EMBEDDING_DIM
+from embedding_cache import EmbeddingCache
+from vector_index import VectorIndex
+
+
+class HashEmbedding:
+    """Stands in for HFEmbedding in builds: a unit vector seeded by the text."""
+    pool = None
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get_text_embedding_batch(self, texts):
+        vectors = []
+        for text in texts:
+            seed = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+            vec = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM)
+            vectors.append((vec / np.linalg.norm(vec)).tolist())
+        return vectors
+
+
+def write_page(docs_dir, name, topic):
+    sections = "".join(f"Section: {topic} {s}\n" + f"How to {topic} step {s}. " * 30 + "\n\n"
+                       for s in range(2))
+    (docs_dir / name).write_text(f"Title: {topic}\n\n{sections}", encoding="utf-8")
+
+
+def test_update_index_adds_modifies_and_removes_files(tmp_path, monkeypatch):
+    docs_dir, index_dir = tmp_path / "docs", str(tmp_path / "index")
+    docs_dir.mkdir()
+    monkeypatch.setattr(indexer, "_cached_embedding", lambda embed_workers, cache_dir:
+                        HashEmbedding(EmbeddingCache(cache_dir, model_name="hash")))
+    kwargs = {"workers": 1, "embed_workers": 0, "cache_dir": str(tmp_path / "cache")}
+    write_page(docs_dir, "gateway.txt", "route traffic")
+    write_page(docs_dir, "deploy.txt", "roll back")
+    indexer.build_index(str(docs_dir), index_dir, index_type="flat", **kwargs)
+    old_ids = {key: entry["ids"] for key, entry in VectorIndex.load(index_dir).files.items()}
+
+    write_page(docs_dir, "gateway.txt", "rate limit")
+    (docs_dir / "deploy.txt").unlink()
+    write_page(docs_dir, "certs.txt", "rotate certificates")
+    changes = indexer.update_index(str(docs_dir), index_dir, **kwargs)
+    assert changes == {"added": ["certs.txt"], "modified": ["gateway.txt"],
+                       "removed": ["deploy.txt"]}
+
+    index = VectorIndex.load(index_dir)
+    assert set(index.files) == {"gateway.txt", "certs.txt"}
+    assert index.files["gateway.txt"]["hash"] == indexer.hash_file(str(docs_dir / "gateway.txt"))
+    live_ids = [vid for entry in index.files.values() for vid in entry["ids"]]
+    stale_ids = set(old_ids["gateway.txt"] + old_ids["deploy.txt"])
+    assert not stale_ids & set(live_ids)
+    assert index.ntotal == len(index.docstore) == len(live_ids)
+    assert set(index.docstore.get_nodes(live_ids)) == set(live_ids)
+    assert not index.docstore.get_nodes(stale_ids)
+
+    # Removed chunks are gone from search, dense and BM25 alike
+    query = np.ones((1, EMBEDDING_DIM), dtype="float32")
+    hits = index.hybrid_search(query, ["roll back"], top_k=len(live_ids) + 5,
+                               candidates=len(live_ids) + 5)[0]
+    assert {int(h.node.id_) for h in hits} == set(live_ids)
@@ -0,0 +1,37 @@
+"""
+The process-pool ingestion pipeline must produce the same chunks as
+processing every file inline.
+"""
+from ingest import IngestStats, iter_file_chunks
+
+
+def write_docs(tmp_path, n=12):
+    for i in range(n):
+        sections = "".join(
+            f"Section: Heading {i}.{s}\n" + f"Sentence {s} of page {i}. " * 40 + "\n\n"
+            for s in range(3))
+        (tmp_path / f"page_{i}.txt").write_text(f"Title: Page {i}\n\n{sections}",
+                                                encoding="utf-8")
+    return sorted(p.name for p in tmp_path.iterdir())
+
+
+def collect(docs_dir, keys, **kwargs):
+    merged = {}
+    for chunks_by_file in iter_file_chunks(docs_dir, keys, **kwargs):
+        merged.update(chunks_by_file)
+    return merged
+
+
+def test_parallel_matches_inline(tmp_path):
+    keys = write_docs(tmp_path)
+    inline = collect(str(tmp_path), keys, workers=1, shard_size=5)
+    stats = IngestStats()
+    parallel = collect(str(tmp_path), keys, workers=3, shard_size=5, stats=stats)
+
+    assert sorted(parallel) == keys
+    assert parallel == inline
+    assert {c["section"] for _, c in parallel["page_0.txt"]} == \
+        {"Heading 0.0", "Heading 0.1", "Heading 0.2"}
+    summary = stats.summary()["stages"]
+    assert summary["load"]["items"] == len(keys)
+    assert summary["section+chunk"]["items"] == sum(len(c) for c in parallel.values())
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from ingest import make_node
+from partitions import PartitionIndex, in_ranges, subtract_ranges
+from vector_index import VectorIndex
+
+DOCS = [
+    (0, "a", {"file_path": "gateway.txt", "section": "Routes"}),
+    (1, "b", {"file_path": "gateway.txt", "section": "Routes"}),
+    (2, "c", {"file_path": "gateway.txt", "section": "Limits"}),
+    (3, "d", {"file_path": "deploy.txt", "section": "Routes"}),
+    (4, "e", {"file_path": "deploy.txt", "section": "Rollback"}),
+]
+
+
+def test_resolve_ranges():
+    partitions = PartitionIndex.build(DOCS)
+    assert partitions.partitions["file_path"]["gateway.txt"] == [[0, 3]]
+    assert partitions.resolve({"file_path": "GATEWAY*"}).tolist() == [[0, 3]]
+    assert partitions.resolve({"section": ["routes", "rollback"]}).tolist() == [[0, 2], [3, 5]]
+    assert partitions.resolve({"file_path": "deploy*", "section": "Routes"}).tolist() == [[3, 4]]
+    assert len(partitions.resolve({"file_path": "missing*"})) == 0
+    with pytest.raises(ValueError):
+        partitions.resolve({"author": "*"})
+
+
+def test_in_ranges():
+    mask = in_ranges(np.arange(6), np.array([[1, 2], [3, 5]]))
+    assert mask.tolist() == [False, True, False, True, True, False]
+
+
+def test_subtract_ranges():
+    a = np.array([[0, 10], [20, 30]])
+    b = np.array([[2, 4], [8, 22], [29, 40]])
+    assert subtract_ranges(a, b).tolist() == [[0, 2], [4, 8], [22, 29]]
+
+
+def test_update_matches_full_rebuild():
+    added = [(5, "f", {"file_path": "gateway.txt", "section": "Routes"}),
+             (6, "g", {"file_path": "gateway.txt", "section": "Limits"})]
+    # gateway.txt was modified: its old chunks 0-2 go, 5-6 come in
+    updated = PartitionIndex.build(DOCS).update([0, 1, 2], added)
+    rebuilt = PartitionIndex.build([d for d in DOCS if d[0] > 2] + added)
+    assert updated.partitions == rebuilt.partitions
+
+
+def test_filtered_search_only_returns_matching_files(tmp_path):
+    rng = np.random.default_rng(0)
+    index = VectorIndex.create(str(tmp_path), dim=8, index_type="flat")
+    for name in ("gateway.txt", "deploy.txt"):
+        vectors = rng.standard_normal((5, 8)).astype("float32")
+        nodes = [make_node(f"{name} {i}", {"file_path": name, "section": "Intro"})
+                 for i in range(5)]
+        index.add_file(name, name, nodes, vectors)
+    index.persist()
+
+    query = rng.standard_normal((1, 8)).astype("float32")
+    hits = index.search(query, top_k=3, filters={"file_path": "deploy*"})[0]
+    assert len(hits) == 3
+    assert {n.node.metadata["file_path"] for n in hits} == {"deploy.txt"}
+
+
+def test_incremental_persist_keeps_filters_and_bm25_current(tmp_path):
+    rng = np.random.default_rng(1)
+
+    def nodes(name, words):
+        return [make_node(f"{name} {word}", {"file_path": name, "section": "Intro"})
+                for word in words]
+
+    index = VectorIndex.create(str(tmp_path), dim=8, index_type="flat")
+    index.add_file("a.txt", "1", nodes("a.txt", ["alpha", "beta"]),
+                   rng.standard_normal((2, 8)).astype("float32"))
+    index.add_file("b.txt", "1", nodes("b.txt", ["gamma"]),
+                   rng.standard_normal((1, 8)).astype("float32"))
+    index.persist()
+
+    index = VectorIndex.load(str(tmp_path))
+    index.remove_file("a.txt")
+    index.add_file("a.txt", "2", nodes("a.txt", ["delta"]),
+                   rng.standard_normal((1, 8)).astype("float32"))
+    index.persist()
+
+    index = VectorIndex.load(str(tmp_path))
+    assert index.partitions.partitions["file_path"] == {"b.txt": [[2, 3]], "a.txt": [[3, 4]]}
+    assert [vid for vid, _ in index.sparse.search("delta", top_k=3)] == [3]
+    assert index.sparse.search("alpha", top_k=3) == []
@@ -0,0 +1,53 @@
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from reranker import CrossEncoderReranker
+
+
+class FakeReranker(CrossEncoderReranker):
+    """Scores a chunk by how many question words it contains, no model."""
+
+    def __init__(self, seconds_per_batch=0.0, **kwargs):
+        self.seconds_per_batch = seconds_per_batch
+        self.batches = []
+        super().__init__(**kwargs)
+
+    def _load_model(self, model_name):
+        pass
+
+    def score_batch(self, question, texts):
+        import time
+        time.sleep(self.seconds_per_batch)
+        self.batches.append(texts)
+        words = set(question.lower().split())
+        return [len(words & set(t.lower().split())) / len(words) for t in texts]
+
+
+def hits(texts):
+    return [NodeWithScore(node=TextNode(id_=str(i), text=t), score=1.0 - i / 100)
+            for i, t in enumerate(texts)]
+
+
+def test_reranks_in_batches_and_caches_scores():
+    reranker = FakeReranker(top_n=2, batch_size=2, budget_ms=10_000)
+    nodes = hits(["unrelated text", "custom domain setup", "tls certificates",
+                  "custom domain tls certificates"])
+    question = "custom domain tls certificates"
+
+    top = reranker.rerank(question, nodes)
+    assert [n.node.id_ for n in top] == ["3", "1"]
+    assert top[0].score == 1.0
+    assert len(reranker.batches) == 2
+
+    assert [n.node.id_ for n in reranker.rerank(question, nodes)] == ["3", "1"]
+    assert len(reranker.batches) == 2
+
+
+def test_budget_stops_scoring_and_keeps_retrieval_order():
+    reranker = FakeReranker(seconds_per_batch=0.05, top_n=4, batch_size=1, budget_ms=20)
+    nodes = hits(["a", "b c", "c", "d"])
+
+    top = reranker.rerank("c", nodes)
+    # Only the first batch fits the budget; the rest follow in retrieval order
+    assert len(reranker.batches) == 1
+    assert [n.node.id_ for n in top] == ["0", "1", "2", "3"]
+    assert top[1].score == nodes[1].score
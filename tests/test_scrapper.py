@@ -0,0 +1,135 @@
+"""
+Crawls a local HTTP fixture site with scrapper.Crawler: a deep chain of
+linked pages plus a couple of off-scope links that must be ignored.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scrapper import Crawler, HostRateLimiter
+
+CHAIN_LENGTH = 1200  # deeper than Python's default recursion limit
+
+
+def page_html(n: int) -> str:
+    links = '<a href="/outside/page.htm">off scope</a><a href="/Content/APIGateway/file.pdf">pdf</a>'
+    if n + 1 < CHAIN_LENGTH:
+        links += f'<a href="/Content/APIGateway/page{n + 1}.htm">next</a>'
+    return (f"<html><head><title>Page {n}</title></head><body>"
+            f"<h1>Heading {n}</h1><p>Body of page {n}.</p>{links}</body></html>")
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # page number -> body override, and pages that no longer exist
+    overrides: dict = {}
+    deleted: set = set()
+
+    def do_GET(self):
+        name = self.path.rsplit("/", 1)[-1]
+        if self.path.startswith("/Content/APIGateway/page") and name.endswith(".htm"):
+            n = int(name[len("page"):-len(".htm")])
+            if n in self.deleted:
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = self.overrides.get(n, page_html(n)).encode("utf-8")
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    FixtureHandler.overrides = {}
+    FixtureHandler.deleted = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/Content/APIGateway/"
+    server.shutdown()
+
+
+def make_crawler(tmp_path, **kwargs):
+    return Crawler(docs_dir=str(tmp_path / "docs"),
+                   state_path=str(tmp_path / "state.json"),
+                   pages_path=str(tmp_path / "pages.json"),
+                   changes_path=str(tmp_path / "changes.json"),
+                   workers=4, host_delay=0.0, **kwargs)
+
+
+def test_crawls_deep_chain_without_recursion(site, tmp_path):
+    fetched = make_crawler(tmp_path).crawl([site + "page0.htm"])
+
+    assert fetched == CHAIN_LENGTH
+    assert len(os.listdir(tmp_path / "docs")) == CHAIN_LENGTH
+    with open(tmp_path / "docs" / "page_0.txt", encoding="utf-8") as f:
+        assert f.read() == "Title: Page 0\n\nSection: Heading 0\nbody of page 0.\n\n"
+    # Completed crawls leave no state behind
+    assert not os.path.exists(tmp_path / "state.json")
+
+
+def test_interrupted_crawl_resumes(site, tmp_path):
+    first = make_crawler(tmp_path).crawl([site + "page0.htm"], max_pages=10)
+    assert first == 10
+    assert os.path.exists(tmp_path / "state.json")
+
+    resumed = make_crawler(tmp_path)
+    assert len(resumed.state.visited) == 10
+    second = resumed.crawl([site + "page0.htm"])
+
+    assert second == CHAIN_LENGTH - 10
+    assert len(os.listdir(tmp_path / "docs")) == CHAIN_LENGTH
+
+
+def test_host_rate_limit_spaces_requests(site):
+    limiter = HostRateLimiter(min_interval=0.05)
+    start = time.monotonic()
+    threads = [threading.Thread(target=limiter.wait, args=(site,)) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Five requests to one host need at least four intervals
+    assert time.monotonic() - start >= 0.2
+
+
+def test_recrawl_only_reports_changed_pages(site, tmp_path):
+    make_crawler(tmp_path).crawl([site + "page0.htm"])
+    with open(tmp_path / "changes.json", encoding="utf-8") as f:
+        assert len(json.load(f)["added"]) == CHAIN_LENGTH
+
+    untouched = tmp_path / "docs" / "page_5.txt"
+    mtime = os.stat(untouched).st_mtime_ns
+    FixtureHandler.overrides[3] = page_html(3).replace("Body of page 3.", "New body.")
+    # Cutting the chain at page 10 leaves every later page unreachable
+    FixtureHandler.deleted.add(10)
+
+    make_crawler(tmp_path).crawl([site + "page0.htm"])
+    with open(tmp_path / "changes.json", encoding="utf-8") as f:
+        changes = json.load(f)
+
+    docs = str(tmp_path / "docs")
+    assert changes["added"] == []
+    assert changes["modified"] == [os.path.join(docs, "page_3.txt")]
+    assert len(changes["removed"]) == CHAIN_LENGTH - 10
+    assert os.stat(untouched).st_mtime_ns == mtime
+    assert len(os.listdir(docs)) == 10
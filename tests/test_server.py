@@ -0,0 +1,130 @@
+"""
+Exercises server.py end to end against a local stub of Ollama's
+/api/generate endpoint, with a mock embedding model and a tiny index.
+"""
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+
+from answer_cache import AnswerCache
+from llm_adapter import create_ollama_llm
+from query_service import QueryService
+from server import create_app
+from vector_index import VectorIndex
+
+DIM = 8
+
+
+def make_stub_ollama() -> web.Application:
+    calls = []
+
+    async def generate(request: web.Request) -> web.Response:
+        body = await request.json()
+        calls.append(body["prompt"])
+        await asyncio.sleep(0.01)
+        return web.json_response({
+            "model": body["model"],
+            "created_at": "2025-01-01T00:00:00Z",
+            "response": "stub answer",
+            "done": True,
+        })
+
+    app = web.Application()
+    app["calls"] = calls
+    app.router.add_post("/api/generate", generate)
+    return app
+
+
+def make_service(tmp_path, base_url: str, answer_cache=None) -> QueryService:
+    vector_index = VectorIndex.create(str(tmp_path), dim=DIM)
+    nodes = [
+        TextNode(text=f"chunk {i}",
+                 metadata={"file_path": "doc.txt", "section": "ROOT", "chunk_id": i})
+        for i in range(3)
+    ]
+    vector_index.add_file("doc.txt", "hash", nodes, [[0.5] * DIM] * len(nodes))
+    return QueryService(embed_model=MockEmbedding(embed_dim=DIM),
+                        vector_index=vector_index,
+                        llm=create_ollama_llm(base_url=base_url),
+                        answer_cache=answer_cache)
+
+
+def test_concurrent_queries_are_batched(tmp_path):
+    async def run():
+        ollama = TestServer(make_stub_ollama())
+        await ollama.start_server()
+        service = make_service(tmp_path, str(ollama.make_url("")).rstrip("/"))
+
+        batch_sizes = []
+        embed_queries = service.embed_queries
+
+        def counting_embed_queries(questions):
+            batch_sizes.append(len(questions))
+            return embed_queries(questions)
+
+        service.embed_queries = counting_embed_queries
+
+        client = TestClient(TestServer(create_app(service, window_ms=50)))
+        await client.start_server()
+        try:
+            responses = await asyncio.gather(*[
+                client.post("/query", json={"question": f"question {i}"})
+                for i in range(8)
+            ])
+            bodies = [await r.json() for r in responses]
+            assert all(r.status == 200 for r in responses)
+            assert all(b["answer"] == "stub answer" for b in bodies)
+            assert all(len(b["citations"]) == 3 for b in bodies)
+            # 8 concurrent requests share far fewer embedding passes
+            assert sum(batch_sizes) == 8
+            assert len(batch_sizes) < 8
+
+            health = await (await client.get("/health")).json()
+            assert health == {"status": "ok", "vectors": 3}
+
+            latency = await (await client.get("/latency")).json()
+            assert latency["total"]["count"] == 8
+        finally:
+            await client.close()
+            await ollama.close()
+
+    asyncio.run(run())
+
+
+def test_query_requires_question(tmp_path):
+    async def run():
+        service = make_service(tmp_path, "http://127.0.0.1:9")
+        client = TestClient(TestServer(create_app(service)))
+        await client.start_server()
+        try:
+            response = await client.post("/query", json={})
+            assert response.status == 400
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+
+
+def test_repeated_question_is_answered_from_cache(tmp_path):
+    async def run():
+        stub = make_stub_ollama()
+        ollama = TestServer(stub)
+        await ollama.start_server()
+        service = make_service(tmp_path, str(ollama.make_url("")).rstrip("/"),
+                               answer_cache=AnswerCache())
+        client = TestClient(TestServer(create_app(service)))
+        await client.start_server()
+        try:
+            first = await (await client.post("/query", json={"question": "same"})).json()
+            second = await (await client.post("/query", json={"question": "same"})).json()
+            assert (first["cached"], second["cached"]) == (False, True)
+            assert second["answer"] == first["answer"]
+            assert len(stub["calls"]) == 1
+        finally:
+            await client.close()
+            await ollama.close()
+
+    asyncio.run(run())
@@ -0,0 +1,156 @@
+import hashlib
+
+import numpy as np
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import MockLLM
+
+import config
+import indexer
+from answer_cache import AnswerCache
+from embedding_cache import EmbeddingCache
+from ingest import make_node
+from query_service import QueryService
+from shards import ShardRouter, shard_cache_dir
+from vector_index import VectorIndex
+
+
+class HashEmbedding:
+    """Stands in for HFEmbedding in builds: a vector seeded by the text, cached."""
+    pool = None
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.misses = 0
+
+    def get_text_embedding_batch(self, texts):
+        found = self.cache.get_many(texts)
+        missed = [t for t, vec in zip(texts, found) if vec is None]
+        self.misses += len(missed)
+        self.cache.put_many(missed, [self.vector(t) for t in missed])
+        return [self.vector(t).tolist() for t in texts]
+
+    @staticmethod
+    def vector(text):
+        seed = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+        vec = np.random.default_rng(seed).standard_normal(config.EMBEDDING_DIM)
+        return (vec / np.linalg.norm(vec)).astype("float32")
+
+
+def add_chunks(index, name, vectors, texts=None):
+    texts = texts or [f"{name} chunk {i}" for i in range(len(vectors))]
+    nodes = [make_node(text, {"file_path": f"{name}.txt", "section": "Intro"})
+             for text in texts]
+    index.add_file(f"{name}.txt", name, nodes, vectors)
+
+
+def make_shard(path, name, vectors, texts=None):
+    index = VectorIndex.create(str(path), dim=vectors.shape[1], index_type="flat")
+    add_chunks(index, name, vectors, texts)
+    index.persist()
+    return index
+
+
+def test_router_merges_shards_by_score(tmp_path):
+    eye = np.eye(4, dtype="float32")
+    router = ShardRouter({
+        "ops": make_shard(tmp_path / "ops", "ops", eye[:2] * [[0.9], [0.2]]),
+        "dev": make_shard(tmp_path / "dev", "dev", eye[:2] * [[0.5], [0.1]]),
+    })
+    try:
+        query = np.asarray([[1, 1, 0, 0]], dtype="float32")
+        hits = router.search(query, top_k=3)[0]
+        assert [h.node.id_ for h in hits] == ["ops:0", "dev:0", "ops:1"]
+        assert [h.node.metadata["shard"] for h in hits] == ["ops", "dev", "ops"]
+
+        # Filters apply inside every shard
+        hits = router.hybrid_search(query, ["chunk"], top_k=4, candidates=4,
+                                    filters={"file_path": "dev*"})[0]
+        assert {h.node.id_ for h in hits} == {"dev:0", "dev:1"}
+        assert router.ntotal == 4
+    finally:
+        router.close()
+
+
+def test_hybrid_merge_ranks_by_relevance_not_by_shard_rank(tmp_path):
+    eye = np.eye(4, dtype="float32")
+    # Listed first, but its best hit is barely related to the query
+    router = ShardRouter({
+        "dev": make_shard(tmp_path / "dev", "dev", eye[1:3] + eye[0] * 0.1),
+        "ops": make_shard(tmp_path / "ops", "ops", eye[:2]),
+    })
+    try:
+        hits = router.hybrid_search(eye[:1], ["nothing matches"], top_k=2, candidates=4)[0]
+        assert hits[0].node.id_ == "ops:0"
+    finally:
+        router.close()
+
+
+def test_hybrid_fusion_matches_a_single_index(tmp_path):
+    # BM25 strength (term frequency) and dense score of every chunk; the
+    # strongest BM25 hits all sit in one shard
+    chunks = {"ops": [(8, 0.1), (7, 0.6), (6, 0.3), (5, 0.8)],
+              "dev": [(4, 0.7), (3, 0.2), (2, 0.5), (1, 0.4)]}
+    data = {name: (np.asarray([[score, 0, 0, 0] for _, score in rows], dtype="float32"),
+                   ["alpha " * tf + "filler " * (10 - tf) for tf, _ in rows])
+            for name, rows in chunks.items()}
+    single = VectorIndex.create(str(tmp_path / "single"), dim=4, index_type="flat")
+    for name, (vectors, texts) in data.items():
+        add_chunks(single, name, vectors, texts)
+    single.persist()
+    router = ShardRouter({name: make_shard(tmp_path / name, name, vectors, texts)
+                          for name, (vectors, texts) in data.items()})
+    try:
+        query = np.asarray([[1, 0, 0, 0]], dtype="float32")
+        expected = single.hybrid_search(query, ["alpha"], top_k=8, candidates=8)[0]
+        hits = router.hybrid_search(query, ["alpha"], top_k=8, candidates=8)[0]
+        assert [h.node.get_content() for h in hits] == \
+            [h.node.get_content() for h in expected]
+        assert [h.score for h in hits] == pytest.approx([h.score for h in expected])
+    finally:
+        router.close()
+
+
+def test_query_service_caches_answers_over_shards(tmp_path):
+    ones = np.ones((2, 4), dtype="float32") / 2
+    router = ShardRouter({
+        "ops": make_shard(tmp_path / "ops", "ops", ones),
+        "dev": make_shard(tmp_path / "dev", "dev", ones),
+    })
+    try:
+        service = QueryService(embed_model=MockEmbedding(embed_dim=4), vector_index=router,
+                               llm=MockLLM(max_tokens=4), answer_cache=AnswerCache())
+        first = service.query("chunk")
+        second = service.query("chunk")
+        assert not first.metadata["cached"]
+        assert second.metadata["cached"]
+        assert second.response == first.response
+        assert all(":" in n.node.id_ for n in second.source_nodes)
+    finally:
+        router.close()
+
+
+def test_shard_builds_keep_each_others_cached_embeddings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ("ops", "dev"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "page.txt").write_text(
+            f"Title: {name}\n\nSection: Intro\n" + f"The {name} runbook. " * 20,
+            encoding="utf-8")
+        monkeypatch.setitem(config.SHARDS, name, str(tmp_path / name))
+    built = []
+
+    def cached_embedding(embed_workers, cache_dir):
+        built.append(HashEmbedding(EmbeddingCache(cache_dir, model_name="hash")))
+        return built[-1]
+
+    monkeypatch.setattr(indexer, "_cached_embedding", cached_embedding)
+    indexer.build_shards(["ops"], index_type="flat", workers=1, embed_workers=0)
+    cached = len(EmbeddingCache(shard_cache_dir("ops"), model_name="hash"))
+    indexer.build_shards(["dev"], index_type="flat", workers=1, embed_workers=0)
+    assert cached > 0
+    assert len(EmbeddingCache(shard_cache_dir("ops"), model_name="hash")) == cached
+
+    # Rebuilding the first shard is served from its cache entirely
+    indexer.build_shards(["ops"], index_type="flat", workers=1, embed_workers=0)
+    assert built[-1].misses == 0
@@ -0,0 +1,42 @@
+from sparse_index import SparseIndex, reciprocal_rank_fusion
+
+DOCS = [
+    (0, "Configure custom domains and TLS certificates for the gateway.", {"section": "Domains"}),
+    (1, "The responsecachelookup policy reads cached responses.", {"section": "Policies"}),
+    (2, "The responsecachestorage policy stores responses in the cache.", {"section": "Policies"}),
+    (5, "Routes send requests to different backends.", {"section": "Routes"}),
+]
+
+
+def test_exact_term_ranks_first_and_survives_reload(tmp_path):
+    index = SparseIndex.build(DOCS)
+    hits = index.search("What does responsecachelookup do?", top_k=3)
+    assert hits[0][0] == 1
+    # Section headings are searchable too
+    assert index.search("routes", top_k=1)[0][0] == 5
+    assert index.search("nothing matches this", top_k=3) == []
+
+    index.save(str(tmp_path))
+    loaded = SparseIndex.load(str(tmp_path))
+    assert loaded.search("What does responsecachelookup do?", top_k=3) == hits
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4]], top_k=3, k=60)
+    # 3 is in both lists, so it beats 1 which only tops one of them
+    assert [vid for vid, _ in fused] == [3, 1, 2]
+    assert fused[0][1] == 1 / 63 + 1 / 61
+
+
+def test_update_matches_full_rebuild():
+    added = [(6, "Rollback a deployment to an earlier version.", {"section": "Rollback"}),
+             (7, "The responsecachelookup policy has a TTL.", {"section": "Policies"})]
+    updated = SparseIndex.build(DOCS).update([1, 5], added)
+    rebuilt = SparseIndex.build([d for d in DOCS if d[0] not in (1, 5)] + added)
+
+    assert updated.terms == rebuilt.terms
+    assert updated.ids.tolist() == rebuilt.ids.tolist()
+    assert updated.tfs.tolist() == rebuilt.tfs.tolist()
+    assert (updated.n_docs, updated.avg_len) == (rebuilt.n_docs, rebuilt.avg_len)
+    for query in ("responsecachelookup", "routes", "deployment rollback"):
+        assert updated.search(query, top_k=3) == rebuilt.search(query, top_k=3)
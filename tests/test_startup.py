@@ -0,0 +1,25 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+HEAVY_MODULES = ("torch", "transformers", "sklearn", "faiss", "llama_index",
+                 "langchain_text_splitters", "langchain_core")
+
+PROBE = """
+import json, sys
+sys.argv = ["main.py", "--help"]
+import main
+try:
+    main.main()
+except SystemExit:
+    pass
+print(json.dumps(sorted({name.split(".")[0] for name in sys.modules} & set(%r))))
+"""
+
+
+def test_cli_help_imports_no_heavy_dependencies():
+    out = subprocess.run([sys.executable, "-c", PROBE % (HEAVY_MODULES,)], cwd=ROOT,
+                         capture_output=True, text=True, check=True).stdout
+    assert json.loads(out.strip().splitlines()[-1]) == []
@@ -0,0 +1,80 @@
+"""
+Streams an answer from a fake Ollama server that sends /api/generate
+chunks with a delay between them, checking that citations are available
+before generation starts and that first-token latency is recorded.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+
+from llm_adapter import create_ollama_llm
+from query_service import QueryService
+from vector_index import VectorIndex
+
+DIM = 8
+TOKENS = ["Hello", " streaming", " world"]
+TOKEN_DELAY = 0.2
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    requests: list = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for i, token in enumerate(TOKENS + [""]):
+            if i:
+                time.sleep(TOKEN_DELAY)
+            chunk = {"model": body["model"], "created_at": "2025-01-01T00:00:00Z",
+                     "response": token, "done": i == len(TOKENS)}
+            self.wfile.write(json.dumps(chunk).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def ollama_url():
+    FakeOllamaHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_stream_query_reports_citations_then_tokens(tmp_path, ollama_url):
+    vector_index = VectorIndex.create(str(tmp_path), dim=DIM)
+    nodes = [
+        TextNode(text=f"chunk {i}",
+                 metadata={"file_path": "doc.txt", "section": "ROOT", "chunk_id": i})
+        for i in range(3)
+    ]
+    vector_index.add_file("doc.txt", "hash", nodes, [[0.5] * DIM] * len(nodes))
+    service = QueryService(embed_model=MockEmbedding(embed_dim=DIM),
+                           vector_index=vector_index,
+                           llm=create_ollama_llm(base_url=ollama_url))
+
+    response = service.stream_query("what?")
+    # Citations are known before Ollama has been asked anything
+    assert len(response.source_nodes) == 3
+    assert FakeOllamaHandler.requests == []
+
+    received = list(response.response_gen)
+    assert "".join(received) == "".join(TOKENS)
+    assert FakeOllamaHandler.requests[0]["stream"] is True
+
+    timings = response.metadata["timings"]
+    assert timings["tokens"] == len(TOKENS)
+    # The first token arrives well before the last one was sent
+    assert timings["ttft_ms"] < timings["total_ms"] - TOKEN_DELAY * 1000
+    assert 0 < timings["tokens_per_s"] < 1 / TOKEN_DELAY + 1
@@ -0,0 +1,33 @@
+"""
+The page-level cleaner must reproduce the original per-element clean_text
+exactly. data/clean_text_golden.json holds inputs (entities, URLs, e-mails,
+citations, boilerplate, control and non-ASCII characters, ...) with the
+output of that original cleaner.
+"""
+import json
+import os
+import random
+
+from text_cleaner import SEPARATOR, clean_text, clean_texts
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "data", "clean_text_golden.json")
+
+with open(GOLDEN_PATH, encoding="utf-8") as f:
+    GOLDEN = json.load(f)
+
+
+def test_single_elements_match_golden():
+    for case in GOLDEN:
+        assert clean_text(case["input"]) == case["expected"], case["input"]
+
+
+def test_pages_match_golden():
+    rng = random.Random(0)
+    for _ in range(200):
+        page = rng.sample(GOLDEN, rng.randint(1, 40))
+        assert clean_texts([c["input"] for c in page]) == [c["expected"] for c in page]
+
+
+def test_separator_in_page_text():
+    page = ["before", f"raw {SEPARATOR} separator", "entity &#xfdd0; separator", "after"]
+    assert clean_texts(page) == ["before", "raw separator", "entity separator", "after"]
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture(autouse=True)
+def reset_tracing():
+    tracing.disable()
+    yield
+    tracing.disable()
+
+
+def test_disabled_tracing_records_nothing():
+    assert tracing.span("a") is tracing.span("b")
+    with tracing.span("a"):
+        tracing.count("c")
+    tracing.record("d", 1.0)
+    assert not tracing.enabled()
+    assert tracing.snapshot() == {}
+    assert tracing.prometheus_text() == ""
+
+
+def test_spans_counters_and_slowest(tmp_path):
+    tracing.enable(profile_top=2)
+    for seconds in (0.1, 0.3, 0.2):
+        tracing.record("query.generate", seconds, prompt_chars=int(seconds * 10))
+    with tracing.span("query.prompt"):
+        pass
+    tracing.count("embed.texts", 32)
+    tracing.count("embed.texts", 8)
+
+    snapshot = tracing.snapshot()
+    generate = snapshot["spans"]["query.generate"]
+    assert generate["count"] == 3
+    assert generate["max_ms"] == 300.0
+    assert snapshot["counters"] == {"embed.texts": 40}
+    assert [(s["span"], s["ms"]) for s in snapshot["slowest"]] == \
+        [("query.generate", 300.0), ("query.generate", 200.0)]
+
+    text = tracing.prometheus_text()
+    assert 'confluai_span_seconds_count{span="query.generate"} 3' in text
+    assert 'confluai_events_total{counter="embed.texts"} 40' in text
+
+    tracing.write_metrics(str(tmp_path / "metrics.json"))
+    tracing.write_metrics(str(tmp_path / "metrics.prom"))
+    assert json.loads((tmp_path / "metrics.json").read_text())["counters"]["embed.texts"] == 40
+    assert (tmp_path / "metrics.prom").read_text() == text
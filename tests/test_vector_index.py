@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+
+from docstore import SQLiteDocStore
+from ingest import make_node
+from vector_index import VectorIndex, DOCSTORE_FILE, BUILD_SUFFIX
+
+
+def add_page(index, name, vectors):
+    nodes = [make_node(f"{name} chunk {i}", {"file_path": name, "section": "Intro"})
+             for i in range(len(vectors))]
+    index.add_file(name, name, nodes, vectors)
+
+
+def test_docstore_add_get_and_delete(tmp_path):
+    store = SQLiteDocStore(str(tmp_path / "nodes.sqlite"))
+    store.add_nodes("a.txt", [0, 1], [make_node("first", {"section": "A"}),
+                                       make_node("second", {"section": "B"})])
+    store.add_nodes("b.txt", [2], [make_node("third", {"section": "C"})])
+    store.commit()
+
+    nodes = store.get_nodes([1, 2, 7])
+    assert sorted(nodes) == [1, 2]
+    assert nodes[1].id_ == "1" and nodes[1].get_content() == "second"
+    assert nodes[1].metadata == {"section": "B"}
+    store.delete_file("a.txt")
+    assert [vid for vid, _, _ in store.iter_nodes(batch_size=1)] == [2]
+    assert len(store) == 1
+
+
+def test_persist_then_mmap_load_fetches_nodes(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((6, 8)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = VectorIndex.create(str(tmp_path), dim=8, index_type="flat")
+    add_page(index, "gateway.txt", vectors)
+    index.persist()
+
+    loaded = VectorIndex.load(str(tmp_path), mmap=True)
+    assert loaded.ntotal == 6
+    assert loaded.files["gateway.txt"]["ids"] == list(range(6))
+    hits = loaded.search(vectors[3:4], top_k=2)[0]
+    assert hits[0].node.id_ == "3"
+    assert hits[0].node.get_content() == "gateway.txt chunk 3"
+    assert hits[0].node.metadata["file_path"] == "gateway.txt"
+
+
+def test_rebuild_swaps_in_the_new_docstore(tmp_path):
+    rng = np.random.default_rng(1)
+    first = VectorIndex.create(str(tmp_path), dim=8, index_type="flat")
+    add_page(first, "old.txt", rng.standard_normal((3, 8)).astype("float32"))
+    first.persist()
+    live = VectorIndex.load(str(tmp_path), mmap=True)
+
+    # Until persist, a rebuild writes its docstore next to the live one
+    rebuild = VectorIndex.create(str(tmp_path), dim=8, index_type="flat")
+    add_page(rebuild, "new.txt", rng.standard_normal((2, 8)).astype("float32"))
+    assert rebuild.docstore.path == os.path.join(str(tmp_path), DOCSTORE_FILE + BUILD_SUFFIX)
+    assert len(live.docstore) == 3
+
+    rebuild.persist()
+    assert rebuild.docstore.path == os.path.join(str(tmp_path), DOCSTORE_FILE)
+    assert not os.path.exists(os.path.join(str(tmp_path), DOCSTORE_FILE + BUILD_SUFFIX))
+    reloaded = VectorIndex.load(str(tmp_path), mmap=True)
+    assert set(reloaded.files) == {"new.txt"}
+    assert [text for _, text, _ in reloaded.docstore.iter_nodes()] == \
+        ["new.txt chunk 0", "new.txt chunk 1"]
@@ -0,0 +1,117 @@
+# text_cleaner.py
+"""
+Text cleaning for scraped pages, applied once per page instead of once per
+element.
+
+clean_texts joins all text elements of a page with a separator and runs
+the regex passes over the joined string once. The separator is a newline
+on each side of a Unicode noncharacter, which none of those passes can
+match across or alter. The result is split back into one string per
+element for the character-level passes, which only use C-level string
+methods. The passes and their order are the same as in the original
+per-element cleaner; tests/data/clean_text_golden.json pins the output.
+
+    1. unescape HTML entities
+    2. drop URLs, then e-mail addresses, citations like [1] / (1) and
+       "page created by" / "last edited by" lines
+    3. ASCII quotes and dashes, NFKC normalization
+    4. drop control / format / unassigned characters (Unicode category C)
+    5. lowercase, collapse whitespace, drop non-ASCII, strip
+"""
+import html
+import re
+import unicodedata
+
+# A noncharacter that no pass before the split can produce or remove
+SEPARATOR = "\ufdd0"
+JOINER = "\n" + SEPARATOR + "\n"
+
+URL_RE = re.compile(r"https?://\S+|www\.\S+")
+# A match of \S+@\S+\.\S+ always spans a whole whitespace-delimited
+# token, so only tokens around an "@" are checked, see _drop_emails
+EMAIL_RE = re.compile(r"\S+@\S+\.\S+")
+NON_SPACE_RE = re.compile(r"\S*")
+CITATION_RE = re.compile(r"\[\d+\]|\(\d+\)")
+# (?i)(page created by|last edited by): p and l have no case variants
+# beyond ASCII, and a leading character class lets re skip ahead quickly
+BOILERPLATE_RE = re.compile(r"[pPlL](?i:age created by|ast edited by)[^\n]*")
+PUNCTUATION = (("“", "\""), ("”", "\""), ("‘", "'"), ("’", "'"),
+               ("—", "-"), ("–", "-"))
+# ASCII text takes str.translate's fast path; anything else goes through
+# CONTROL_RE, checking non-ASCII runs character by character
+ASCII_CONTROL = str.maketrans({c: None for c in [*range(0x20), 0x7f]})
+CONTROL_RE = re.compile(r"[\x00-\x1f\x7f]+|[^\x00-\x7f]+")
+
+
+def _drop_control(match: re.Match) -> str:
+    run = match.group()
+    if run[0] < "\x80":
+        return ""
+    return "".join(ch for ch in run if unicodedata.category(ch)[0] != "C")
+
+
+def _drop_emails(text: str) -> str:
+    """EMAIL_RE.sub("", text), but only looking at tokens with an "@"."""
+    parts = []
+    pos = 0
+    at = text.find("@")
+    while at != -1:
+        start = at
+        while start > pos and not text[start - 1].isspace():
+            start -= 1
+        end = NON_SPACE_RE.match(text, at).end()
+        if EMAIL_RE.fullmatch(text, start, end):
+            parts.append(text[pos:start])
+            pos = end
+        at = text.find("@", end)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _clean_markup(text: str) -> str:
+    """Passes 1-3; they never match across a JOINER."""
+    text = html.unescape(text)
+    if "http" in text or "www." in text:
+        text = URL_RE.sub("", text)
+    text = _drop_emails(text)
+    if "[" in text or "(" in text:
+        text = CITATION_RE.sub("", text)
+    text = BOILERPLATE_RE.sub("", text)
+    for orig, repl in PUNCTUATION:
+        text = text.replace(orig, repl)
+    return unicodedata.normalize("NFKC", text)
+
+
+def _clean_characters(text: str) -> str:
+    """Passes 4-5 for a single element."""
+    if text.isascii():
+        text = text.translate(ASCII_CONTROL)
+    else:
+        text = CONTROL_RE.sub(_drop_control, text)
+    # str.split() splits on exactly the characters \s matches
+    text = " ".join(text.lower().split())
+    return text.encode("ascii", "ignore").decode("ascii").strip()
+
+
+def clean_texts(texts: list[str]) -> list[str]:
+    """Clean every text element of a page in one pass; aligned with texts."""
+    if not texts:
+        return []
+    joined = JOINER.join(texts)
+    parts = _clean_markup(joined).split(SEPARATOR)
+    if joined.count(SEPARATOR) != len(texts) - 1 or len(parts) != len(texts):
+        # The page itself contains the separator (raw or as an entity),
+        # so elements cannot be told apart after joining
+        parts = [_clean_markup(text) for text in texts]
+    return [_clean_characters(part) for part in parts]
+
+
+def clean_text(text: str) -> str:
+    """
+    Optimized text cleaning for improved embedding quality:
+    - Unescape HTML entities
+    - Remove URLs, emails, citations and boilerplate lines
+    - Normalize punctuation and unicode
+    - Lowercase and normalize whitespace
+    """
+    return clean_texts([text])[0]
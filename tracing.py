@@ -0,0 +1,219 @@
+# tracing.py
+"""
+Lightweight spans and counters for the RAG pipeline.
+
+Tracing is off unless TRACING_ENABLED is set or enable() is called (main.py
+--metrics / --profile). While it is off, span() hands back one shared no-op
+context manager and record() / count() return right away, so instrumented
+code pays a function call and a flag check.
+
+    import tracing
+    with tracing.span("query.embed"):
+        ...
+    tracing.count("embed.texts", len(texts))
+
+While it is on, every span name aggregates count, total and max seconds
+and every counter sums its values. write_metrics() saves them as JSON or,
+for a *.prom path, in the Prometheus text format (prometheus_text()). With
+profile_top > 0 the slowest individual spans are kept along with their
+attributes, and dump_slowest() logs them.
+
+State is per process: spans inside spawned ingestion workers are not seen
+here; IngestStats reports their stage times from the parent instead.
+"""
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Optional
+
+from config import TRACING_ENABLED, TRACING_PROFILE_TOP
+
+METRIC_PREFIX = "confluai"
+# Shared by every span() call while tracing is off
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    def __init__(self, profile_top: int = TRACING_PROFILE_TOP):
+        self.profile_top = profile_top
+        self.started = time.time()
+        # span name -> [count, total seconds, max seconds]
+        self.spans: dict[str, list] = {}
+        self.counters: dict[str, float] = defaultdict(float)
+        # Min-heap of the slowest spans: (seconds, seq, name, attrs, wall time)
+        self._slowest: list = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, attrs: Optional[dict] = None) -> None:
+        with self._lock:
+            row = self.spans.get(name)
+            if row is None:
+                self.spans[name] = [1, seconds, seconds]
+            else:
+                row[0] += 1
+                row[1] += seconds
+                row[2] = max(row[2], seconds)
+            if self.profile_top > 0:
+                item = (seconds, next(self._seq), name, attrs or {}, time.time())
+                if len(self._slowest) < self.profile_top:
+                    heapq.heappush(self._slowest, item)
+                elif seconds > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, item)
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0, attrs)
+
+    def slowest(self) -> list[dict]:
+        """The kept slowest spans, slowest first."""
+        with self._lock:
+            items = sorted(self._slowest, reverse=True)
+        return [{"span": name, "ms": round(seconds * 1000, 3), "attrs": attrs,
+                 "at": time.strftime("%H:%M:%S", time.localtime(wall))}
+                for seconds, _, name, attrs, wall in items]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            spans = {
+                name: {"count": n, "total_ms": round(total * 1000, 3),
+                       "mean_ms": round(total / n * 1000, 3), "max_ms": round(peak * 1000, 3)}
+                for name, (n, total, peak) in sorted(self.spans.items())
+            }
+            counters = dict(sorted(self.counters.items()))
+        snapshot = {"uptime_s": round(time.time() - self.started, 3),
+                    "spans": spans, "counters": counters}
+        if self.profile_top > 0:
+            snapshot["slowest"] = self.slowest()
+        return snapshot
+
+    def prometheus_text(self) -> str:
+        """Spans as a summary (sum/count) plus a max gauge, counters as counters."""
+        with self._lock:
+            spans = sorted(self.spans.items())
+            counters = sorted(self.counters.items())
+        lines = [
+            f"# HELP {METRIC_PREFIX}_span_seconds Time spent in each pipeline span.",
+            f"# TYPE {METRIC_PREFIX}_span_seconds summary",
+        ]
+        for name, (n, total, _) in spans:
+            lines.append(f'{METRIC_PREFIX}_span_seconds_sum{{span="{_label(name)}"}} {total:.6f}')
+            lines.append(f'{METRIC_PREFIX}_span_seconds_count{{span="{_label(name)}"}} {n}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_span_max_seconds Slowest single run of each span.",
+            f"# TYPE {METRIC_PREFIX}_span_max_seconds gauge",
+        ]
+        for name, (_, _, peak) in spans:
+            lines.append(f'{METRIC_PREFIX}_span_max_seconds{{span="{_label(name)}"}} {peak:.6f}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_events_total Pipeline counters.",
+            f"# TYPE {METRIC_PREFIX}_events_total counter",
+        ]
+        for name, value in counters:
+            lines.append(f'{METRIC_PREFIX}_events_total{{counter="{_label(name)}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_tracer: Optional[Tracer] = Tracer() if TRACING_ENABLED else None
+
+
+def enable(profile_top: int = TRACING_PROFILE_TOP) -> Tracer:
+    """Start recording (keeping the current tracer if already on)."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(profile_top)
+    else:
+        _tracer.profile_top = max(_tracer.profile_top, profile_top)
+    return _tracer
+
+
+def disable() -> None:
+    """Stop recording and drop everything recorded so far."""
+    global _tracer
+    _tracer = None
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, **attrs):
+    """Context manager timing its block under name; a no-op while disabled."""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, **attrs)
+
+
+def record(name: str, seconds: float, **attrs) -> None:
+    """Record a span measured elsewhere (e.g. a stage timing dict)."""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.record(name, seconds, attrs)
+
+
+def count(name: str, value: float = 1) -> None:
+    tracer = _tracer
+    if tracer is not None:
+        tracer.count(name, value)
+
+
+def traced(name: str):
+    """Decorator: run the function inside span(name)."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with _tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict:
+    return _tracer.snapshot() if _tracer is not None else {}
+
+
+def prometheus_text() -> str:
+    return _tracer.prometheus_text() if _tracer is not None else ""
+
+
+def write_metrics(path: str) -> None:
+    """Save the current metrics: Prometheus text for *.prom, JSON otherwise."""
+    if _tracer is None:
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith(".prom"):
+            f.write(_tracer.prometheus_text())
+        else:
+            json.dump(_tracer.snapshot(), f, indent=2)
+    logging.info("Metrics written to %s", path)
+
+
+def dump_slowest() -> None:
+    """Log the slowest spans kept by the profiling hook."""
+    if _tracer is None or _tracer.profile_top <= 0:
+        return
+    logging.info("Slowest %d spans:", _tracer.profile_top)
+    for item in _tracer.slowest():
+        attrs = " ".join(f"{k}={v}" for k, v in item["attrs"].items())
+        logging.info("  %10.2f ms  %-24s %s %s", item["ms"], item["span"], item["at"], attrs)
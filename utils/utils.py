@@ -4,9 +4,12 @@ It includes functions to load documents from a directory with proper encoding de
 and to split long text documents into smaller chunks using a recursive character splitter.
 """
 import os
-import chardet
-from langchain_text_splitters import RecursiveCharacterTextSplitter, RecursiveJsonSplitter
-from llama_index.core import SimpleDirectoryReader, Document
+from typing import TYPE_CHECKING, Optional
+
+# chardet, langchain and the LlamaIndex reader are imported by the functions
+# that use them: citation helpers are on every query's path, loaders aren't
+if TYPE_CHECKING:
+    from llama_index.core import Document
 
 
 def load_documents(doc_dir: str) -> list:
@@ -14,6 +17,8 @@ def load_documents(doc_dir: str) -> list:
     Load all .txt and .md files from the specified directory,
     automatically detecting file encoding.
     """
+    import chardet
+
     docs = []
     for file in os.listdir(doc_dir):
         if file.endswith(".txt") or file.endswith(".md"):
@@ -31,11 +36,17 @@ def load_documents(doc_dir: str) -> list:
                     docs.append(f.read())
     return docs
 
-def load_documents_with_metadata(docs_dir: str) -> list[Document]:
+def load_documents_with_metadata(docs_dir: str,
+                                 input_files: Optional[list] = None) -> "list[Document]":
     """
     Returns Document with metadata that has things like 
     'source' or 'file_path'
+    If input_files is given only those files are loaded.
     """
+    from llama_index.core import SimpleDirectoryReader
+
+    if input_files is not None:
+        return SimpleDirectoryReader(input_files=input_files).load_data()
     return SimpleDirectoryReader(docs_dir).load_data()
 
 def chunk_document(text: str, chunk_size: int = 512,
@@ -51,6 +62,8 @@ def chunk_document(text: str, chunk_size: int = 512,
     Returns:
         List[str]: A list of text chunks.
     """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size, 
         chunk_overlap=chunk_overlap
@@ -60,6 +73,8 @@ def chunk_document(text: str, chunk_size: int = 512,
 
 def chunk_code(data: str, chunk_size: int = 1000,
                    chunk_overlap: int = 0) -> list:
+    from langchain_text_splitters import RecursiveJsonSplitter
+
     splitter = RecursiveJsonSplitter(
             convert_lists=True,
             max_chunk_size=chunk_size,
@@ -69,6 +84,29 @@ def chunk_code(data: str, chunk_size: int = 1000,
     chunks = splitter.split_json(data)
     return chunks
 
+def citation_list(source_nodes) -> list[dict]:
+    """
+    Flatten source nodes into JSON-friendly citation records with
+    file_path, section, chunk_id, score and, for chunks that carry them,
+    the char_start / char_end span in the source file and the shard.
+    """
+    citations = []
+    for node in source_nodes or []:
+        container = getattr(node, "source_node", getattr(node, "node", node))
+        meta = getattr(container, "metadata", {}) or {}
+        score = getattr(node, "score", None)
+        citations.append({
+            "file_path": meta.get("file_path", meta.get("source", "<unknown>")),
+            "section": meta.get("section"),
+            "chunk_id": meta.get("chunk_id"),
+            "score": float(score) if score is not None else None,
+        })
+        if "char_start" in meta:
+            citations[-1]["span"] = [meta["char_start"], meta.get("char_end")]
+        if "shard" in meta:
+            citations[-1]["shard"] = meta["shard"]
+    return citations
+
 def get_citation_and_score(response) -> None:
     """
     Extracts source_nodes from a LlamaIndex response, groups chunk_ids by file_path
@@ -0,0 +1,326 @@
+# vector_index.py
+"""
+FAISS vectors, the node docstore and the build manifest, persisted together
+under FAISS_INDEX_PATH.
+
+Vectors sit in an ID-mapped FAISS index, stored in FAISS's native binary
+format, whose IDs double as docstore node IDs. The manifest records which
+IDs belong to which source file along with that file's content hash. That
+lets a single changed or deleted file be removed and re-added without
+rebuilding everything else.
+
+The FAISS index type (flat, IVF, HNSW, IVF-PQ) is chosen at build time, see
+ann_index.py. A BM25 index over the same node IDs is kept for hybrid
+search, see sparse_index.py, and so is a map from file_path / section
+values to ID ranges for filtered search, see partitions.py. Both are built
+from the docstore on a full build; on an incremental update persist()
+only applies the chunks removed and added since load(). For querying, the
+FAISS file is memory-mapped and node text and metadata are read from
+SQLite only for the hits, so cold start and RSS stay roughly flat as the
+corpus grows.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+import faiss
+import numpy as np
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from ann_index import (make_index, train_index, set_search_params, index_type_of,
+                       supports_remove, selector_search_params, TRAINED_INDEX_TYPES)
+from config import (EMBEDDING_DIM, FAISS_INDEX_PATH, INDEX_TYPE, IVF_NPROBE, HNSW_EF_SEARCH,
+                    FILTER_EXACT_MAX)
+from docstore import SQLiteDocStore
+from partitions import PartitionIndex, range_ids
+from sparse_index import SparseIndex, reciprocal_rank_fusion
+
+INDEX_FILE = "vectors.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+MANIFEST_FILE = "manifest.json"
+# Suffix of the docstore written by a full build until it is persisted
+BUILD_SUFFIX = ".build"
+
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class VectorIndex:
+    def __init__(self, faiss_index, docstore: SQLiteDocStore,
+                 manifest: dict, index_dir: str = FAISS_INDEX_PATH,
+                 sparse: Optional[SparseIndex] = None,
+                 partitions: Optional[PartitionIndex] = None):
+        self.faiss_index = faiss_index
+        self.docstore = docstore
+        self.manifest = manifest
+        self.index_dir = index_dir
+        self.sparse = sparse
+        self.partitions = partitions
+        # Set once IVF reconstruction (for exact filtered search) is enabled;
+        # the lock keeps concurrent filtered queries from building it twice
+        self._direct_map = False
+        self._direct_map_lock = threading.Lock()
+        # Node IDs removed and (ID, text, metadata) of chunks added since
+        # load, applied to the BM25 index and partition map on persist
+        self._removed_ids: list[int] = []
+        self._added_docs: list[tuple] = []
+
+    @classmethod
+    def create(cls, index_dir: str = FAISS_INDEX_PATH,
+               dim: int = EMBEDDING_DIM,
+               index_type: str = INDEX_TYPE) -> "VectorIndex":
+        """
+        Start an empty index. The FAISS index itself is created by train()
+        once the corpus size is known. The docstore is written next to the
+        live one and only replaces it on persist(), so a failed build leaves
+        the previous index intact.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        build_path = os.path.join(index_dir, DOCSTORE_FILE + BUILD_SUFFIX)
+        if os.path.exists(build_path):
+            os.remove(build_path)
+        manifest = {"next_id": 0, "dim": dim, "index_type": index_type, "files": {}}
+        return cls(None, SQLiteDocStore(build_path), manifest, index_dir)
+
+    @classmethod
+    def load(cls, index_dir: str = FAISS_INDEX_PATH,
+             mmap: bool = False,
+             nprobe: int = IVF_NPROBE,
+             ef_search: int = HNSW_EF_SEARCH) -> "VectorIndex":
+        """
+        Load a persisted index. With mmap=True the FAISS file is mapped
+        read-only instead of read into memory; use it for querying, not for
+        updates. nprobe / ef_search tune IVF / HNSW search.
+        """
+        index_path = os.path.join(index_dir, INDEX_FILE)
+        if mmap:
+            faiss_index = faiss.read_index(index_path, MMAP_FLAGS)
+        else:
+            faiss_index = faiss.read_index(index_path)
+        set_search_params(faiss_index, nprobe, ef_search)
+        docstore = SQLiteDocStore(os.path.join(index_dir, DOCSTORE_FILE))
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        # Indexes built before hybrid / filtered search lack these files
+        sparse = SparseIndex.load(index_dir) if SparseIndex.exists(index_dir) else None
+        partitions = PartitionIndex.load(index_dir) if PartitionIndex.exists(index_dir) else None
+        return cls(faiss_index, docstore, manifest, index_dir, sparse, partitions)
+
+    @staticmethod
+    def exists(index_dir: str = FAISS_INDEX_PATH) -> bool:
+        return all(
+            os.path.exists(os.path.join(index_dir, name))
+            for name in (INDEX_FILE, DOCSTORE_FILE, MANIFEST_FILE)
+        )
+
+    @property
+    def files(self) -> dict:
+        """file key -> {"hash": content hash, "ids": vector/node IDs}"""
+        return self.manifest["files"]
+
+    @property
+    def index_type(self) -> str:
+        return self.manifest.get("index_type", "flat")
+
+    @property
+    def version(self) -> str:
+        """Changes on every persist, so caches can tell the index changed."""
+        return self.manifest.get("version")
+
+    @property
+    def ntotal(self) -> int:
+        return int(self.faiss_index.ntotal) if self.faiss_index is not None else 0
+
+    @property
+    def supports_remove(self) -> bool:
+        return self.faiss_index is None or supports_remove(self.faiss_index)
+
+    @property
+    def needs_training(self) -> bool:
+        """True until train() has seen the whole corpus of an IVF/PQ build."""
+        return self.faiss_index is None and self.index_type in TRAINED_INDEX_TYPES
+
+    def train(self, embeddings) -> None:
+        """
+        Create the FAISS index for a fresh build, sized for the corpus, and
+        train it on a sample of the embeddings when its type needs it.
+        """
+        if self.faiss_index is None:
+            self.faiss_index = make_index(
+                self.index_type, self.manifest.get("dim", EMBEDDING_DIM), len(embeddings))
+            # Record what was actually built (small corpora fall back to flat)
+            self.manifest["index_type"] = index_type_of(self.faiss_index)
+        train_index(self.faiss_index, embeddings)
+
+    def add_file(self, file_key: str, file_hash: str,
+                 nodes: list[TextNode], embeddings) -> None:
+        """
+        Add the chunk nodes of one source file with their embeddings.
+        Node IDs are replaced with the FAISS IDs assigned here.
+        """
+        start = self.manifest["next_id"]
+        ids = list(range(start, start + len(nodes)))
+        if nodes:
+            if self.faiss_index is None:
+                self.train(embeddings)
+            self.faiss_index.add_with_ids(
+                np.asarray(embeddings, dtype=np.float32),
+                np.asarray(ids, dtype=np.int64))
+            for node, vid in zip(nodes, ids):
+                node.id_ = str(vid)
+            self.docstore.add_nodes(file_key, ids, nodes)
+            if self.sparse is not None or self.partitions is not None:
+                self._added_docs.extend(
+                    (vid, node.text, node.metadata) for node, vid in zip(nodes, ids))
+        self.manifest["next_id"] = start + len(nodes)
+        self.files[file_key] = {"hash": file_hash, "ids": ids}
+
+    def remove_file(self, file_key: str) -> None:
+        """Drop every vector and docstore entry of one source file."""
+        entry = self.files.pop(file_key, None)
+        if not entry or not entry["ids"]:
+            return
+        self.faiss_index.remove_ids(np.asarray(entry["ids"], dtype=np.int64))
+        self.docstore.delete_file(file_key)
+        self._removed_ids.extend(entry["ids"])
+
+    def resolve_filters(self, filters: Optional[dict]) -> Optional[np.ndarray]:
+        """ID ranges selected by a {field: pattern(s)} filter, None for no filter."""
+        if not filters:
+            return None
+        if self.partitions is None:
+            raise ValueError("This index has no partition map, rebuild it to use filters")
+        return self.partitions.resolve(filters)
+
+    def dense_search(self, query_embeddings, top_k: int,
+                     ranges: Optional[np.ndarray] = None) -> list[list[tuple[int, float]]]:
+        """
+        (node ID, inner product) of the top_k vectors for each query
+        embedding, only among the IDs in ranges if given (see
+        resolve_filters). Up to FILTER_EXACT_MAX selected vectors are
+        reconstructed and scored exactly; larger selections are searched
+        with a FAISS ID selector, which skips every other vector.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if ranges is None:
+            scores, ids = self.faiss_index.search(queries, top_k)
+        else:
+            n_selected = int((ranges[:, 1] - ranges[:, 0]).sum()) if len(ranges) else 0
+            if n_selected == 0:
+                return [[] for _ in queries]
+            if n_selected <= FILTER_EXACT_MAX:
+                return self._exact_search(queries, top_k, range_ids(ranges))
+            if len(ranges) == 1:
+                selector = faiss.IDSelectorRange(int(ranges[0][0]), int(ranges[0][1]))
+            else:
+                selector = faiss.IDSelectorBatch(range_ids(ranges))
+            scores, ids = self.faiss_index.search(
+                queries, top_k, params=selector_search_params(self.faiss_index, selector))
+        return [
+            [(int(vid), float(score)) for score, vid in zip(row_scores, row_ids) if vid != -1]
+            for row_scores, row_ids in zip(scores, ids)
+        ]
+
+    def _exact_search(self, queries: np.ndarray, top_k: int,
+                      ids: np.ndarray) -> list[list[tuple[int, float]]]:
+        """Brute-force inner product against the reconstructed vectors of ids."""
+        if not self._direct_map and index_type_of(self.faiss_index) in TRAINED_INDEX_TYPES:
+            with self._direct_map_lock:
+                if not self._direct_map:
+                    # IVF can only reconstruct by ID through a direct map
+                    faiss.extract_index_ivf(self.faiss_index).set_direct_map_type(
+                        faiss.DirectMap.Hashtable)
+                    self._direct_map = True
+        vectors = self.faiss_index.reconstruct_batch(ids)
+        scores = queries @ vectors.T
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row_scores, row_top in zip(scores, top):
+            row_top = row_top[np.argsort(-row_scores[row_top], kind="stable")]
+            results.append([(int(ids[i]), float(row_scores[i])) for i in row_top])
+        return results
+
+    def fetch(self, hits: list[list[tuple[int, float]]]) -> list[list[NodeWithScore]]:
+        """Turn (node ID, score) lists into scored nodes with one docstore read."""
+        nodes = self.docstore.get_nodes({vid for row in hits for vid, _ in row})
+        return [
+            [NodeWithScore(node=nodes[vid], score=score) for vid, score in row if vid in nodes]
+            for row in hits
+        ]
+
+    def search(self, query_embeddings, top_k: int,
+               filters: Optional[dict] = None) -> list[list[NodeWithScore]]:
+        """
+        Return the top_k scored nodes for each query embedding, restricted
+        to the chunks matching filters if given.
+        """
+        ranges = self.resolve_filters(filters)
+        return self.fetch(self.dense_search(query_embeddings, top_k, ranges))
+
+    def hybrid_search(self, query_embeddings, queries: list[str], top_k: int,
+                      candidates: int, timings: Optional[dict] = None,
+                      filters: Optional[dict] = None) -> list[list[NodeWithScore]]:
+        """
+        Fuse the top `candidates` dense and BM25 hits of each query with
+        reciprocal-rank fusion and return the top_k; node scores are RRF
+        scores. Both searches are restricted to chunks matching filters if
+        given. Falls back to dense search without a sparse index. Seconds
+        spent per stage are added to timings if given.
+        """
+        if self.sparse is None:
+            return self.search(query_embeddings, top_k, filters)
+        timings = timings if timings is not None else {}
+        ranges = self.resolve_filters(filters)
+        t0 = time.perf_counter()
+        dense = self.dense_search(query_embeddings, max(top_k, candidates), ranges)
+        t1 = time.perf_counter()
+        sparse = [self.sparse.search(q, max(top_k, candidates), ranges) for q in queries]
+        t2 = time.perf_counter()
+        fused = [
+            reciprocal_rank_fusion([[vid for vid, _ in d], [vid for vid, _ in s]], top_k)
+            for d, s in zip(dense, sparse)
+        ]
+        results = self.fetch(fused)
+        t3 = time.perf_counter()
+        timings["dense"] = timings.get("dense", 0.0) + t1 - t0
+        timings["sparse"] = timings.get("sparse", 0.0) + t2 - t1
+        timings["fuse_fetch"] = timings.get("fuse_fetch", 0.0) + t3 - t2
+        return results
+
+    def persist(self) -> None:
+        os.makedirs(self.index_dir, exist_ok=True)
+        if self.faiss_index is None:
+            self.train([])
+        # Running query processes memory-map the index file: write a new
+        # file and swap it in rather than rewriting pages under their mapping
+        index_path = os.path.join(self.index_dir, INDEX_FILE)
+        faiss.write_index(self.faiss_index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+        self.docstore.commit()
+        docstore_path = os.path.join(self.index_dir, DOCSTORE_FILE)
+        if self.docstore.path != docstore_path:
+            # Swap the freshly built docstore in for the live one
+            self.docstore.close()
+            os.replace(self.docstore.path, docstore_path)
+            self.docstore = SQLiteDocStore(docstore_path)
+        # Loaded indexes only need the changes since load, a full build
+        # (or an index from before hybrid / filtered search) reads everything
+        if self.sparse is not None:
+            self.sparse = self.sparse.update(self._removed_ids, self._added_docs)
+        else:
+            self.sparse = SparseIndex.build(self.docstore.iter_nodes())
+        self.sparse.save(self.index_dir)
+        if self.partitions is not None:
+            self.partitions = self.partitions.update(self._removed_ids, self._added_docs)
+        else:
+            self.partitions = PartitionIndex.build(self.docstore.iter_nodes())
+        self.partitions.save(self.index_dir)
+        self._removed_ids, self._added_docs = [], []
+        self.manifest["version"] = uuid.uuid4().hex
+        manifest_path = os.path.join(self.index_dir, MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(manifest_path + ".tmp", manifest_path)